@@ -6,12 +6,35 @@
 # - Alcohol: 술 여부 + 술 중심이면 주종/1차2차 반영(가중치/프롬프트)
 # - Output: 무조건 3개 보장 + 추천 이유/장면/해시태그 + 카카오맵 링크
 
+import abc
+import asyncio
+import copy
+import cProfile
+import hashlib
+import heapq
+import io
 import json
+import os
+import pstats
+import queue
 import re
 import math
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+import httpx
+import numpy as np
 import requests
 import streamlit as st
-from openai import OpenAI
+from openai import APITimeoutError, AsyncOpenAI, OpenAI
 from math import radians, sin, cos, sqrt, atan2
 
 
@@ -23,19 +46,426 @@ st.title("🍽️ 결정 메이트 (Decision Mate)")
 st.caption("맛집 추천이 아니라, 약속 장소 '결정 피로'를 줄이는 대화형 추천")
 
 
+# -----------------------------
+# Shared store (in-memory / SQLite / Redis 프로토콜) - 레플리카 간 캐시·세션 공유
+# -----------------------------
+# 키 스키마: dm:v1:<kind>:<id>
+#   geo:<location>          → 좌표 center           (STORE_TTL["geo"])
+#   kakao:<sha1(params)>    → Place rows             (STORE_TTL["kakao"])
+#   kakao_stale:<sha1>      → 같은 rows 장애 대비 사본 (STORE_TTL["kakao_stale"])
+#   rerank:<sha1(prompt)>   → rerank LLM 원문        (STORE_TTL["rerank"])
+#   plan:n:<cell>:<shape>   → 검색 통과율 카운터 (레플리카들이 원자적으로 더함, "<relax>:<항목>" → 정수)
+#                                                    (STORE_TTL["plan"])
+#   travel:<backend>:<cell> → 출발 셀 → 목적지 도보 분 (STORE_TTL["travel"])
+#   details:<place id>      → 영업시간/주차/가격대   (STORE_TTL["details"])
+#   session:<sid>           → 대화/조건 스냅샷       (STORE_TTL["session"])
+#   profile:<sha1(id)>      → 재방문 취향/최근 추천  (STORE_TTL["profile"])
+STORE_URL = os.environ.get("DECISION_MATE_STORE", "memory://")
+STORE_PREFIX = "dm:v1"
+STORE_TTL = {
+    "geo": 7 * 24 * 3600,
+    "kakao": 3600,
+    "kakao_stale": 3 * 24 * 3600,
+    "rerank": 1800,
+    "plan": 7 * 24 * 3600,
+    "travel": 7 * 24 * 3600,
+    "details": 24 * 3600,
+    "session": 24 * 3600,
+    "profile": 90 * 24 * 3600,
+}
+
+
+def store_key(kind: str, ident: str) -> str:
+    return f"{STORE_PREFIX}:{kind}:{ident}"
+
+
+def hash_key(*parts) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Store(abc.ABC):
+    # 백엔드는 get/set/delete(문자열) + 카운터(incr/counts)만 구현. 캐시 장애는 미스로 취급해서 추천은 계속 돌게
+    @abc.abstractmethod
+    def get(self, key: str) -> str | None:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str, ttl: int):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    def incr(self, key: str, counts: dict, ttl: int):
+        # 키 아래 정수 카운터 여러 개를 한 번에 원자적으로 더함 (읽고-더하고-쓰기 없이 → 레플리카 동시 기록 유실 없음)
+        ...
+
+    @abc.abstractmethod
+    def counts(self, key: str) -> dict:
+        ...
+
+    def get_many(self, keys: list) -> list:
+        # 백엔드가 한 번에 읽을 수 있으면 덮어씀 (Redis MGET)
+        return [self.get(k) for k in keys]
+
+    def get_json(self, key: str):
+        try:
+            raw = self.get(key)
+            return json.loads(raw) if raw is not None else None
+        except Exception:
+            return None
+
+    def get_many_json(self, keys: list) -> list:
+        if not keys:
+            return []
+        try:
+            raws = self.get_many(keys)
+        except Exception:
+            return [None] * len(keys)
+        out = []
+        for raw in raws:
+            try:
+                out.append(json.loads(raw) if raw is not None else None)
+            except ValueError:
+                out.append(None)
+        return out
+
+    def set_json(self, key: str, value, ttl: int):
+        try:
+            self.set(key, json.dumps(value, ensure_ascii=False, default=str), ttl)
+        except Exception:
+            pass
+
+    def discard(self, key: str):
+        try:
+            self.delete(key)
+        except Exception:
+            pass
+
+    def incr_counts(self, key: str, counts: dict, ttl: int):
+        try:
+            self.incr(key, {k: int(v) for k, v in counts.items()}, ttl)
+        except Exception:
+            pass
+
+    def get_counts(self, key: str) -> dict:
+        try:
+            return self.counts(key)
+        except Exception:
+            return {}
+
+
+class MemoryStore(Store):
+    def __init__(self, max_items: int = 5000):
+        self._data = {}
+        self._lock = threading.Lock()
+        self.max_items = max_items
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time() + ttl)
+            while len(self._data) > self.max_items:
+                del self._data[next(iter(self._data))]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, counts, ttl):
+        with self._lock:
+            item = self._data.pop(key, None)
+            cur = dict(item[0]) if item is not None and item[1] >= time.time() else {}
+            for k, v in counts.items():
+                cur[k] = cur.get(k, 0) + v
+            self._data[key] = (cur, time.time() + ttl)
+            while len(self._data) > self.max_items:
+                del self._data[next(iter(self._data))]
+
+    def counts(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.time():
+                return {}
+            return dict(item[0])
+
+
+class SQLiteStore(Store):
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (key TEXT NOT NULL, field TEXT NOT NULL, "
+                           "value INTEGER NOT NULL, expires REAL NOT NULL, PRIMARY KEY (key, field))")
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM kv WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                return None
+            return row[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                               (key, value, time.time() + ttl))
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key, counts, ttl):
+        # 같은 파일을 여는 다른 프로세스와도 원자적 (BEGIN IMMEDIATE + UPSERT 덧셈)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM counters WHERE key = ? AND expires < ?", (key, now))
+                self._conn.executemany(
+                    "INSERT INTO counters (key, field, value, expires) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key, field) DO UPDATE SET value = value + excluded.value, expires = excluded.expires",
+                    [(key, k, v, now + ttl) for k, v in counts.items()])
+                self._conn.execute("UPDATE counters SET expires = ? WHERE key = ?", (now + ttl, key))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def counts(self, key):
+        with self._lock:
+            rows = self._conn.execute("SELECT field, value FROM counters WHERE key = ? AND expires >= ?",
+                                      (key, time.time())).fetchall()
+        return {f: int(v) for f, v in rows}
+
+
+class RedisStore(Store):
+    # RESP2 최소 구현 (GET/SET EX/DEL, 카운터는 MULTI + HINCRBY/EXPIRE). redis 서버나 호환 스탠드인 어느 쪽이든 OK
+    def __init__(self, host: str, port: int, db: int = 0, password: str | None = None, timeout: float = 2.0):
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._rfile = self._sock.makefile("rb")
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", str(self.db))
+
+    def _close(self):
+        try:
+            if self._sock:
+                self._sock.close()
+        finally:
+            self._sock = None
+            self._rfile = None
+
+    def _read(self):
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            n = int(body)
+            if n < 0:
+                return None
+            data = self._rfile.read(n + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            n = int(body)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RuntimeError(f"bad RESP reply: {line!r}")
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for a in args:
+            b = a.encode("utf-8") if isinstance(a, str) else bytes(a)
+            parts.append(f"${len(b)}\r\n".encode() + b + b"\r\n")
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def command(self, *args):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(*args)
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def get_many(self, keys):
+        return self.command("MGET", *keys) if keys else []
+
+    def set(self, key, value, ttl):
+        self.command("SET", key, value, "EX", str(max(1, int(ttl))))
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def transaction(self, *commands):
+        # MULTI ... EXEC를 한 연결에서. 재시도 안 함 (EXEC 응답만 잃었을 때 두 번 더해지지 않게)
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._send("MULTI")
+                for args in commands:
+                    self._send(*args)
+                return self._send("EXEC")
+            except (OSError, ConnectionError):
+                self._close()
+                raise
+
+    def incr(self, key, counts, ttl):
+        if counts:
+            self.transaction(*[("HINCRBY", key, k, str(v)) for k, v in counts.items()],
+                             ("EXPIRE", key, str(max(1, int(ttl)))))
+
+    def counts(self, key):
+        flat = self.command("HGETALL", key) or []
+        return {flat[i]: int(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+
+def open_store(url: str) -> Store:
+    u = urlparse(url)
+    if u.scheme in ("", "memory"):
+        return MemoryStore()
+    if u.scheme == "sqlite":
+        return SQLiteStore(u.path or ":memory:")
+    if u.scheme == "redis":
+        db = int(u.path.lstrip("/") or 0)
+        return RedisStore(u.hostname or "localhost", u.port or 6379, db=db, password=u.password)
+    raise ValueError(f"unknown store url: {url}")
+
+
+@st.cache_resource
+def get_store() -> Store:
+    return open_store(STORE_URL)
+
+
+store = get_store()
+
+
+# 주의: ?sid= 링크는 bearer 토큰과 같음 (링크를 가진 사람은 누구나 그 대화를 이어받음).
+# 그래서 스냅샷에는 대화/조건만 두고 프로필 id와 프로필에서 온 값(meta.usual, meta.prefilled 키)은 안 넣음
+# (프로필은 같은 브라우저에서 ?pid=나 사이드바로 다시 줘야 붙음. 이어받은 쪽은 그 질문을 다시 받음)
+def session_snapshot() -> dict:
+    ss = st.session_state
+    conditions = copy.deepcopy(ss.conditions)
+    m = conditions["meta"]
+    m.pop("usual", None)
+    cm = m["common"]
+    for key in m.pop("prefilled", None) or []:
+        if key == "cannot_eat":
+            conditions["constraints"]["cannot_eat"] = []
+            cm["cannot_eat_done"] = False
+        elif key == "walk_limit_min":
+            cm["walk_limit_min"], cm["walk_limit_src"] = WALK_LIMIT_DEFAULT_MIN, None
+        else:
+            cm[key] = None
+    return {
+        "messages": ss.messages,
+        "conditions": conditions,
+        "last_picks_ids": ss.last_picks_ids,
+        "seen_pick_ids": ss.seen_pick_ids,
+        "history_summary": ss.history_summary,
+    }
+
+
+def save_session():
+    store.set_json(store_key("session", st.session_state.user_key), session_snapshot(), STORE_TTL["session"])
+
+
+def restore_session(sid: str):
+    snap = store.get_json(store_key("session", sid))
+    if not isinstance(snap, dict):
+        return
+    for k in ("messages", "conditions", "last_picks_ids", "seen_pick_ids", "history_summary"):
+        if k in snap:
+            st.session_state[k] = snap[k]
+
+
 # -----------------------------
 # Session init
 # -----------------------------
-def init_messages():
+# 세션당 보관 상한 (긴 세션에서도 rerun 비용/메모리가 일정하게)
+HISTORY_MAX = 40          # 보관 메시지 수 (넘치면 요약으로 접음)
+HISTORY_VISIBLE = 12      # 채팅창에 바로 그리는 최근 메시지 수
+HISTORY_PAGE = 10         # 이전 대화 펼쳤을 때 페이지당 메시지 수
+LOC_CACHE_MAX = 32
+SEEN_IDS_MAX = 60
+
+
+class BoundedDict(OrderedDict):
+    # 최근 사용 순 LRU. 상한 넘으면 가장 오래된 것부터 버림
+    def __init__(self, maxsize: int, *args, **kwargs):
+        self.maxsize = maxsize
+        super().__init__(*args, **kwargs)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+    def __reduce__(self):
+        return (self.__class__, (self.maxsize, list(self.items())))
+
+
+def init_messages(profile: dict | None = None):
+    usual = usual_location(profile)
+    if usual:
+        return [{"role": "assistant", "content": usual_location_text(usual)}]
     return [{
         "role": "assistant",
         "content": "오케이 😎\n오늘 어디서 누구랑 뭐 먹을지 내가 딱 정해줄게.\n일단 **어느 동네/역 근처**에서 찾을까?"
     }]
 
 
-def init_conditions():
-    return {
+WALK_LIMIT_DEFAULT_MIN = 20
+
+
+def init_conditions(profile: dict | None = None):
+    conditions = {
         "location": None,
+        "origins": [],              # 여러 출발지 [{name, weight}] (2곳 이상일 때만)
         "constraints": {
             "cannot_eat": [],
             "avoid_recent": [],
@@ -49,11 +479,15 @@ def init_conditions():
             "food_class": "자동",   # 자동/한식/중식/일식/양식
             "people_count": 2,
             "budget_tier": "상관없음",
+            "search_mode": "keyword",  # keyword/category (사이드바)
 
             # chat flow
             "fast_mode": False,     # "그냥 추천해"면 질문 중단
+            "skip_questions_once": False,  # 이번 턴만 질문 없이 바로 추천 ("더 가까운 데")
             "pending_question": None,
+            "questions_asked": 0,   # 선택 질문 턴 수 (질문 플래너 상한)
             "answers": {},          # mode-specific answers
+            "prefilled": [],        # 프로필에서 채운 조건 키 (세션 스냅샷에서는 뺌)
 
             # common extracted
             "common": {
@@ -62,25 +496,152 @@ def init_conditions():
                 "alcohol_plan": None,    # 한 곳/1차·2차 나눌 수도/모르겠음
                 "alcohol_type": None,    # 소주/맥주/와인/상관없음
                 "transport": None,       # 차/대중교통/상관없음
-                "walk_limit_min": 20,    # 기본 20
+                "walk_limit_min": WALK_LIMIT_DEFAULT_MIN,
+                "walk_limit_src": None,  # 도보 한도 출처: answer/closer/scenario/profile (None=기본값)
                 "sensitivity": None,     # 1~4
                 "focus": None,           # 대화 중심/음식 중심/균형
                 "search_relax": 0,       # 후보 부족시 완화 단계
                 "center": None,          # {x,y,name}
+                "origin_points": [],     # 출발지 좌표 [{name, weight, x, y}]
             }
         }
     }
+    return prefill_conditions(conditions, profile)
+
+
+# -----------------------------
+# User profile (opt-in id → 안 바뀌는 조건/자주 가는 동네/최근 추천을 세션 넘어 기억)
+# -----------------------------
+# 스토어 키는 id 해시만 씀 (입력한 id 자체는 안 남김)
+PROFILE_AREAS_MAX = 5        # 동네별 추천 횟수 보관 상한
+PROFILE_RECENT_MAX = 40      # 최근 추천 id 보관 상한
+PROFILE_EXCLUDE_DAYS = 14    # 이 기간 안에 보여준 곳은 새 세션에서도 후보에서 뺌
+PROFILE_QUESTION_CAP = 1     # 프로필로 채운 재방문 세션의 선택 질문 턴 상한
+# 답 전체가 이 중 하나일 때만 "평소 동네" (부분 일치면 "응암역"·"강남 좋아" 같은 위치 답을 먹어버림)
+USUAL_YES_ANSWERS = {"응", "응응", "ㅇㅇ", "ㅇㅋ", "웅", "네", "넹", "예", "그래", "거기", "거기로", "응거기", "ㅇㅇ거기",
+                     "그래거기", "맞아", "좋아", "평소처럼", "똑같이", "yes", "ok", "오케이"}
+
+
+def profile_key(profile_id: str) -> str:
+    return store_key("profile", hash_key(profile_id.strip()))
+
+
+def load_profile(profile_id: str) -> dict | None:
+    # id 없으면 None(기억 안 함), 처음 쓰는 id면 빈 프로필
+    if not profile_id:
+        return None
+    data = store.get_json(profile_key(profile_id))
+    return data if isinstance(data, dict) else {}
+
+
+def usual_location(profile: dict | None) -> str | None:
+    areas = (profile or {}).get("areas") or {}
+    return max(areas, key=areas.get) if areas else None
+
 
+def usual_location_text(location: str) -> str:
+    return (f"오 또 왔네 😎\n이번에도 **{location}** 근처로 찾을까?\n"
+            "(맞으면 **응**, 아니면 동네/역 말해줘. 다들 따로 오면 `홍대, 강남`처럼 쉼표로!)")
+
+
+def is_usual_answer(text: str) -> bool:
+    tc = re.sub(r"요$", "", nc(text).rstrip(".,?"))
+    return tc in USUAL_YES_ANSWERS
+
+
+def profile_exclusions(profile: dict | None) -> list:
+    # 최근 PROFILE_EXCLUDE_DAYS 안에 보여준 곳 (last_picks_ids보다 오래 가는 제외 목록)
+    cutoff = time.time() - PROFILE_EXCLUDE_DAYS * 24 * 3600
+    return [pid for pid, ts in (profile or {}).get("recent", []) if ts >= cutoff]
+
+
+def prefill_conditions(conditions: dict, profile: dict | None) -> dict:
+    # 세션 시작 시점에만 호출 (대화 중에 말한 값을 덮지 않게)
+    if not profile:
+        return conditions
+    m = conditions["meta"]
+    cm = m["common"]
+    if profile.get("cannot_eat") is not None:
+        conditions["constraints"]["cannot_eat"] = list(profile["cannot_eat"])
+        cm["cannot_eat_done"] = True
+        m["prefilled"].append("cannot_eat")
+    if profile.get("transport"):
+        cm["transport"] = profile["transport"]
+        m["prefilled"].append("transport")
+    if profile.get("walk_limit_min"):
+        cm["walk_limit_min"] = profile["walk_limit_min"]
+        cm["walk_limit_src"] = "profile"
+        m["prefilled"].append("walk_limit_min")
+    # 주종은 술 중심일 때만 쓰이게 따로 둠 (pending_common_questions에서 채움)
+    m["usual"] = {"location": usual_location(profile), "alcohol_type": profile.get("alcohol_type")}
+    m["question_cap"] = PROFILE_QUESTION_CAP
+    if m["usual"]["location"]:
+        # 첫 답이 바로 위치 답으로 들어가게 인사말을 위치 질문으로
+        m["pending_question"] = {"scope": "common", "key": "location",
+                                 "text": usual_location_text(m["usual"]["location"])}
+    return conditions
+
+
+def update_profile(profile: dict, conditions: dict, pick_ids: list) -> dict:
+    cm = conditions["meta"]["common"]
+    out = dict(profile)
+    if cm.get("cannot_eat_done"):
+        out["cannot_eat"] = list(conditions["constraints"].get("cannot_eat") or [])
+    for k in ("transport", "alcohol_type"):
+        if cm.get(k) is not None:
+            out[k] = cm[k]
+    # 도보 한도는 직접 답했을 때만 (기본값 20분, "더 가까운 데" 한 번 줄인 값은 취향이 아님)
+    if cm.get("walk_limit_src") == "answer":
+        out["walk_limit_min"] = cm["walk_limit_min"]
+
+    location = (conditions.get("location") or "").strip()
+    if location and not conditions.get("origins"):
+        areas = Counter(out.get("areas") or {})
+        areas[location] += 1
+        out["areas"] = dict(areas.most_common(PROFILE_AREAS_MAX))
+
+    now = int(time.time())
+    recent = [r for r in out.get("recent", []) if r[0] not in pick_ids]
+    out["recent"] = (recent + [[pid, now] for pid in pick_ids])[-PROFILE_RECENT_MAX:]
+    return out
+
+
+# 세션 id는 URL(?sid=)에 실어서 재접속/다른 레플리카에서도 같은 대화를 이어감
+# (공유하면 대화도 같이 공유됨 → session_snapshot 주석 참고)
+if "user_key" not in st.session_state:
+    sid = st.query_params.get("sid") or uuid.uuid4().hex
+    st.query_params["sid"] = sid
+    st.session_state.user_key = sid
+    restore_session(sid)
+
+# 재방문 프로필 (opt-in: 사이드바나 ?pid=로 id를 줬을 때만)
+if "profile_id" not in st.session_state:
+    st.session_state.profile_id = (st.query_params.get("pid") or "").strip()
+if "profile" not in st.session_state:
+    st.session_state.profile = load_profile(st.session_state.profile_id)
+# 자주 가는 동네 미리 받기 (키/함수가 준비되는 워머 섹션에서 1회 실행)
+if "profile_prefetch" not in st.session_state:
+    st.session_state.profile_prefetch = usual_location(st.session_state.profile)
 
 if "messages" not in st.session_state:
-    st.session_state.messages = init_messages()
+    st.session_state.messages = init_messages(st.session_state.profile)
 
 if "conditions" not in st.session_state:
-    st.session_state.conditions = init_conditions()
+    st.session_state.conditions = init_conditions(st.session_state.profile)
 
 if "last_picks_ids" not in st.session_state:
     st.session_state.last_picks_ids = []
 
+# 랭킹된 후보 풀 + 지금까지 보여준 id ("다른 데"는 여기서 다음 후보로 넘김)
+if "rec_pool" not in st.session_state:
+    st.session_state.rec_pool = None
+if "seen_pick_ids" not in st.session_state:
+    st.session_state.seen_pick_ids = []
+
+# 질문 플래너용으로 미리 받아둔 후보 풀
+if "question_pool" not in st.session_state:
+    st.session_state.question_pool = None
+
 if "openai_key" not in st.session_state:
     st.session_state.openai_key = ""
 if "kakao_key" not in st.session_state:
@@ -90,7 +651,15 @@ if "debug_raw_rerank" not in st.session_state:
     st.session_state.debug_raw_rerank = ""
 
 if "loc_center_cache" not in st.session_state:
-    st.session_state.loc_center_cache = {}
+    st.session_state.loc_center_cache = BoundedDict(LOC_CACHE_MAX)
+
+# HISTORY_MAX 밖으로 밀려난 메시지 요약
+if "history_summary" not in st.session_state:
+    st.session_state.history_summary = None
+
+# 워커 풀 작업: 진행 중 작업 id (세션 식별자는 user_key)
+if "active_job" not in st.session_state:
+    st.session_state.active_job = None
 
 
 # -----------------------------
@@ -103,6 +672,34 @@ st.session_state.openai_key = openai_key
 st.session_state.kakao_key = kakao_key
 
 debug_mode = st.sidebar.checkbox("🛠️ 디버그 모드", value=False)
+use_async_engine = st.sidebar.checkbox("⚡ 비동기 엔진(병렬 검색)", value=False)
+use_job_runner = st.sidebar.checkbox("🧵 백그라운드 작업(워커 풀)", value=False)
+use_question_planner = st.sidebar.checkbox("🎯 질문 최소화(후보 기준)", value=False)
+use_category_search_mode = st.sidebar.checkbox("🏷️ 카테고리 검색(음식점·카페 코드)", value=False)
+use_combined_llm = st.sidebar.checkbox("🧩 멘트+3곳 한 번에(LLM 1회 · 스트리밍)", value=False)
+profile_toggle = debug_mode and st.sidebar.checkbox("🔬 턴 프로파일링(cProfile + tracemalloc)", value=False)
+
+st.sidebar.markdown("---")
+st.sidebar.header("👤 내 취향 기억(선택)")
+profile_id = st.sidebar.text_input(
+    "프로필 id", value=st.session_state.profile_id,
+    help="넣어두면 못 먹는 것·이동수단·자주 가는 동네·최근 추천을 기억해서 다음엔 질문을 줄여줘",
+).strip()
+if profile_id != st.session_state.profile_id:
+    st.session_state.profile_id = profile_id
+    st.session_state.profile = load_profile(profile_id)
+    st.session_state.profile_prefetch = usual_location(st.session_state.profile)
+    # 프로필 id는 URL에 안 씀 (?sid= 링크를 공유해도 프로필은 안 따라가게)
+    st.query_params.pop("pid", None)
+    # 아직 대화 시작 전이면 프로필로 바로 다시 시작
+    if len(st.session_state.messages) <= 1:
+        st.session_state.messages = init_messages(st.session_state.profile)
+        st.session_state.conditions = init_conditions(st.session_state.profile)
+if profile_id and st.sidebar.button("🗑️ 이 프로필 기억 지우기"):
+    store.discard(profile_key(profile_id))
+    st.session_state.profile = {}
+    st.session_state.profile_prefetch = None
+    st.rerun()
 
 st.sidebar.markdown("---")
 st.sidebar.header("🧭 상황 설정")
@@ -130,9 +727,14 @@ avoid_franchise = st.sidebar.checkbox("프랜차이즈(체인) 지양", value=Fa
 st.sidebar.markdown("---")
 if st.sidebar.button("🔄 새 추천 시작(키 유지)"):
     # 키는 session에 남기고 대화/조건만 리셋
-    st.session_state.messages = init_messages()
-    st.session_state.conditions = init_conditions()
+    st.session_state.messages = init_messages(st.session_state.profile)
+    st.session_state.conditions = init_conditions(st.session_state.profile)
     st.session_state.last_picks_ids = []
+    st.session_state.rec_pool = None
+    st.session_state.seen_pick_ids = []
+    st.session_state.question_pool = None
+    st.session_state.history_summary = None
+    store.discard(store_key("session", st.session_state.user_key))
     st.rerun()
 
 
@@ -144,6 +746,120 @@ cond["meta"]["food_class"] = food_class
 cond["meta"]["people_count"] = int(people_count)
 cond["meta"]["budget_tier"] = budget_tier
 cond["constraints"]["avoid_franchise"] = bool(avoid_franchise)
+cond["meta"]["search_mode"] = "category" if use_category_search_mode else "keyword"
+
+
+# -----------------------------
+# Turn profiler (opt-in: 디버그 토글 또는 DECISION_MATE_PROFILE=1 → rerun 1회를 통째로 측정)
+# -----------------------------
+# 스크립트 스레드만 잡힘: 워커 풀/비동기 엔진 작업은 그걸 기다린 시간으로 보임
+PROFILE_ENV = os.environ.get("DECISION_MATE_PROFILE") == "1"
+PROFILE_DIR = os.environ.get("DECISION_MATE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "decision_mate_profiles"))
+PROFILE_TOP_N = 25
+PROFILE_ALLOC_TOP_N = 15
+
+
+@st.cache_resource
+def get_tracemalloc_lock() -> threading.Lock:
+    return threading.Lock()
+
+
+class TurnProfiler:
+    # tracemalloc은 프로세스 전역이라 한 번에 한 세션만 씀 (다른 세션이 재는 중이거나 밖에서 켜져 있으면 cProfile만)
+    def __init__(self, label: str):
+        self.label = label
+        self.prof = cProfile.Profile()
+        self.mem_lock = get_tracemalloc_lock()
+        self._stop_lock = threading.Lock()
+        self.trace_mem = self.mem_lock.acquire(blocking=False)
+        if self.trace_mem and tracemalloc.is_tracing():
+            self.mem_lock.release()
+            self.trace_mem = False
+        if self.trace_mem:
+            tracemalloc.start()
+            self.before = tracemalloc.take_snapshot()
+            # 턴은 스크립트 최상위 코드 전체라 거기에 try/finally를 못 씀 → 이 턴을 돌리는 스크립트 스레드가
+            # 끝나면(정상 종료/예외/중단 후 세션이 안 돌아와도) 전역 락과 추적을 반드시 해제
+            threading.Thread(target=self._release_after, args=(threading.current_thread(),),
+                             name="decision-mate-profile-guard", daemon=True).start()
+        self.t0 = time.perf_counter()
+        self.prof.enable()
+
+    def _release_after(self, owner: threading.Thread):
+        try:
+            owner.join()
+        finally:
+            self._stop_tracing()
+
+    def _stop_tracing(self):
+        with self._stop_lock:
+            if self.trace_mem:
+                self.trace_mem = False
+                tracemalloc.stop()
+                self.mem_lock.release()
+
+    def discard(self):
+        self.prof.disable()
+        self._stop_tracing()
+
+    def finish(self) -> dict:
+        self.prof.disable()
+        wall_s = time.perf_counter() - self.t0
+        peak, alloc = None, "(tracemalloc을 다른 세션/외부에서 쓰는 중이라 이번 턴은 cProfile만)"
+        if self.trace_mem:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            self._stop_tracing()
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>")]
+            allocs = after.filter_traces(ignore).compare_to(self.before.filter_traces(ignore), "lineno")
+            alloc = "\n".join(str(s) for s in allocs[:PROFILE_ALLOC_TOP_N])
+        peak_kb = peak / 1024 if peak is not None else None
+        out = io.StringIO()
+        pstats.Stats(self.prof, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        top = out.getvalue()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"turn-{time.strftime('%Y%m%d-%H%M%S')}-{self.label}")
+        self.prof.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            peak_text = f"{peak_kb:.1f}KB" if peak_kb is not None else "-"
+            f.write(f"wall {wall_s:.3f}s · peak {peak_text}\n\n{top}\n[alloc]\n{alloc}\n")
+        return {"path": base + ".prof", "wall_s": wall_s, "peak_kb": peak_kb, "top": top, "alloc": alloc}
+
+
+def finish_turn_profile():
+    profiler = st.session_state.pop("turn_profiler", None)
+    if profiler is None:
+        return
+    try:
+        summary = profiler.finish()
+    except Exception as e:
+        profiler.discard()
+        st.sidebar.caption(f"🔬 프로파일 저장 실패: {e}")
+        return
+    peak = f"{summary['peak_kb']:.0f}KB" if summary["peak_kb"] is not None else "-"
+    with st.sidebar.expander(f"🔬 이번 턴 {summary['wall_s'] * 1000:.0f}ms · peak {peak}", expanded=True):
+        st.caption(summary["path"])
+        st.code(summary["top"])
+        st.markdown("**할당 상위 (턴 동안 늘어난 것)**")
+        st.code(summary["alloc"])
+
+
+def end_turn(rerun: bool = False):
+    # st.stop()/st.rerun() 전에 프로파일 마무리 (꺼져 있으면 아무것도 안 함)
+    finish_turn_profile()
+    if rerun:
+        st.rerun()
+    st.stop()
+
+
+# 이전 rerun이 예외로 끝나서 못 닫은 프로파일러 정리
+_stale_profiler = st.session_state.pop("turn_profiler", None)
+if _stale_profiler is not None:
+    _stale_profiler.discard()
+if PROFILE_ENV or profile_toggle:
+    st.session_state.turn_profiler = TurnProfiler(st.session_state.user_key[:8])
+
 
 
 # -----------------------------
@@ -179,6 +895,12 @@ def detect_fast(text: str) -> bool:
     return contains_any(tc, keys)
 
 
+def detect_closer(text: str) -> bool:
+    tc = nc(text)
+    keys = ["더가까", "덜걷", "조금만걷", "가까운데로", "가까운곳으로"]
+    return contains_any(tc, keys)
+
+
 def detect_exclude_last(text: str) -> bool:
     tc = nc(text)
     keys = ["다른데", "다른곳", "딴데", "방금제외", "아까제외", "그거빼고", "중복말고", "새로운데"]
@@ -356,15 +1078,251 @@ def parse_mode_answer(mode_key: str, text: str) -> str | None:
     return None
 
 
+# -----------------------------
+# Place record (수집 시 1회 변환)
+# -----------------------------
+_CATEGORY_CACHE: dict[str, tuple] = {}
+
+
+def parse_place_id(value) -> int | str | None:
+    # 카카오 id는 숫자 문자열 → int로 보관 (LLM이 문자열/숫자 어느 쪽으로 돌려줘도 같은 키)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    s = str(value or "").strip()
+    if not s:
+        return None
+    if s.isdigit():
+        return int(s)
+    return sys.intern(s)
+
+
+def intern_category(category_name: str | None) -> tuple:
+    # "음식점 > 술집 > 호프,요리주점" → 같은 문자열이면 같은 tuple 객체 재사용
+    key = category_name or ""
+    path = _CATEGORY_CACHE.get(key)
+    if path is None:
+        path = tuple(sys.intern(c.strip()) for c in key.split(" > ") if c.strip())
+        _CATEGORY_CACHE[key] = path
+    return path
+
+
+def parse_coord(value) -> float | None:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Place:
+    # UI/rerank에 필요한 필드만 유지 (phone, 중복 주소 등은 버림)
+    __slots__ = ("id", "name", "cat_path", "address", "url", "x", "y", "text")
+
+    def __init__(self, id, name: str, cat_path: tuple, address: str, url: str,
+                 x: float | None, y: float | None):
+        self.id = id
+        self.name = name
+        self.cat_path = cat_path
+        self.address = address
+        self.url = url
+        self.x = x
+        self.y = y
+        # 필터/점수 계산용 소문자 검색 텍스트 (이름 + 카테고리)
+        self.text = f"{name} {' '.join(cat_path)}".lower()
+
+    @classmethod
+    def from_kakao(cls, doc: dict):
+        pid = parse_place_id(doc.get("id"))
+        if pid is None:
+            return None
+        return cls(
+            pid,
+            doc.get("place_name") or "",
+            intern_category(doc.get("category_name")),
+            doc.get("road_address_name") or doc.get("address_name") or "",
+            doc.get("place_url") or "",
+            parse_coord(doc.get("x")),
+            parse_coord(doc.get("y")),
+        )
+
+    @property
+    def category(self) -> str:
+        return " > ".join(self.cat_path)
+
+    # 공유 캐시 직렬화용 (JSON 배열)
+    def to_row(self) -> list:
+        return [self.id, self.name, self.category, self.address, self.url, self.x, self.y]
+
+    @classmethod
+    def from_row(cls, row: list):
+        pid, name, category, address, url, x, y = row
+        return cls(pid, name, intern_category(category), address, url, x, y)
+
+    @property
+    def has_coords(self) -> bool:
+        return self.x is not None and self.y is not None
+
+    def __repr__(self):
+        return f"Place({self.id!r}, {self.name!r})"
+
+
+# -----------------------------
+# Circuit breakers (Kakao/OpenAI 장애 시 타임아웃 대신 즉시 degraded 모드)
+# -----------------------------
+BREAKER_WINDOW_S = 60       # 최근 이 시간 동안의 호출로 에러율/지연 판단
+BREAKER_MIN_CALLS = 5
+BREAKER_ERROR_RATE = 0.5
+BREAKER_SLOW_RATE = 0.5
+BREAKER_OPEN_S = 30         # open 유지 후 half-open 에서 1건만 시험 호출
+# 의존성별 "느린 호출" 기준 (초)
+BREAKER_SLOW_S = {"kakao": 3.0, "openai": 12.0, "routing": 2.0, "details": 3.0}
+
+
+class BreakerOpen(Exception):
+    pass
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, slow_s: float, window_s: float = BREAKER_WINDOW_S,
+                 min_calls: int = BREAKER_MIN_CALLS, open_s: float = BREAKER_OPEN_S):
+        self.name = name
+        self.slow_s = slow_s
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.open_s = open_s
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._calls = deque()       # (t, ok, latency_s)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_s:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, latency_s: float):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+                if ok and latency_s < self.slow_s:
+                    self.state = "closed"
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            self._calls.append((now, ok, latency_s))
+            while self._calls and now - self._calls[0][0] > self.window_s:
+                self._calls.popleft()
+            if self.state == "closed" and len(self._calls) >= self.min_calls:
+                errors, slow = self._rates()
+                if errors >= BREAKER_ERROR_RATE or slow >= BREAKER_SLOW_RATE:
+                    self._open(now)
+
+    def abandon(self):
+        # 취소된 호출은 성공/실패 어느 쪽도 아님 → 시험 호출 자리만 반납
+        with self._lock:
+            self._probing = False
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+
+    def _rates(self) -> tuple:
+        n = len(self._calls) or 1
+        errors = sum(1 for _, ok, _ in self._calls if not ok) / n
+        slow = sum(1 for _, _, lat in self._calls if lat >= self.slow_s) / n
+        return errors, slow
+
+    def status(self) -> dict:
+        with self._lock:
+            errors, slow = self._rates()
+            return {"state": self.state, "calls": len(self._calls), "errors": round(errors, 2),
+                    "slow": round(slow, 2), "rejected": self.rejected}
+
+
+@st.cache_resource
+def get_breakers() -> dict:
+    return {name: CircuitBreaker(name, slow_s) for name, slow_s in BREAKER_SLOW_S.items()}
+
+
+breakers = get_breakers()
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    # 4xx(429 제외)는 요청 쪽 문제라 상대 서비스 장애로 안 셈
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+def call_guarded(name: str, fn, *args, **kwargs):
+    breaker = breakers[name]
+    if not breaker.allow():
+        raise BreakerOpen(name)
+    t0 = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        breaker.record(not counts_as_failure(e), time.perf_counter() - t0)
+        raise
+    breaker.record(True, time.perf_counter() - t0)
+    return result
+
+
+async def acall_guarded(name: str, fn, *args, **kwargs):
+    breaker = breakers[name]
+    if not breaker.allow():
+        raise BreakerOpen(name)
+    t0 = time.perf_counter()
+    try:
+        result = await fn(*args, **kwargs)
+    except asyncio.CancelledError:
+        breaker.abandon()
+        raise
+    except Exception as e:
+        breaker.record(not counts_as_failure(e), time.perf_counter() - t0)
+        raise
+    breaker.record(True, time.perf_counter() - t0)
+    return result
+
+
 # -----------------------------
 # Kakao API (paged + uniq)
 # -----------------------------
-def kakao_keyword_search(query: str, rest_key: str, size: int = 15, page: int = 1,
-                         x: str | None = None, y: str | None = None,
-                         radius: int | None = None, sort: str | None = None):
-    url = "https://dapi.kakao.com/v2/local/search/keyword.json"
-    headers = {"Authorization": f"KakaoAK {rest_key}"}
-    params = {"query": query, "size": size, "page": page}
+# 부하 테스트 등에서 로컬 stand-in으로 돌릴 때 DECISION_MATE_KAKAO_BASE로 교체 (OpenAI는 OPENAI_BASE_URL)
+KAKAO_BASE_URL = os.environ.get("DECISION_MATE_KAKAO_BASE", "https://dapi.kakao.com").rstrip("/")
+KAKAO_KEYWORD_URL = f"{KAKAO_BASE_URL}/v2/local/search/keyword.json"
+KAKAO_CATEGORY_URL = f"{KAKAO_BASE_URL}/v2/local/search/category.json"
+
+
+def kakao_headers(rest_key: str) -> dict:
+    return {"Authorization": f"KakaoAK {rest_key}"}
+
+
+def kakao_url(category: str | None = None) -> str:
+    return KAKAO_CATEGORY_URL if category else KAKAO_KEYWORD_URL
+
+
+def kakao_params(query: str, size: int = 15, page: int = 1,
+                 x: str | None = None, y: str | None = None,
+                 radius: int | None = None, sort: str | None = None,
+                 category: str | None = None) -> dict:
+    # category(그룹 코드)면 카테고리 검색: query 대신 category_group_code (x/y/radius 필수)
+    params = {"category_group_code": category} if category else {"query": query}
+    params.update(size=size, page=page)
     if x and y:
         params["x"] = x
         params["y"] = y
@@ -372,32 +1330,152 @@ def kakao_keyword_search(query: str, rest_key: str, size: int = 15, page: int =
         params["radius"] = radius
     if sort:
         params["sort"] = sort
+    return params
+
+
+def kakao_keyword_search(query: str, rest_key: str, size: int = 15, page: int = 1,
+                         x: str | None = None, y: str | None = None,
+                         radius: int | None = None, sort: str | None = None,
+                         category: str | None = None):
+    params = kakao_params(query, size=size, page=page, x=x, y=y, radius=radius, sort=sort, category=category)
+
+    def fetch():
+        res = requests.get(kakao_url(category), headers=kakao_headers(rest_key), params=params, timeout=10)
+        res.raise_for_status()
+        return res.json()
+
+    return call_guarded("kakao", fetch)
+
+
+def kakao_cache_key(query: str, max_pages: int, size: int, x, y, radius, sort, category: str | None = None) -> str:
+    if category:
+        return store_key("kakao", hash_key("category", category, max_pages, size, x, y, radius, sort))
+    return store_key("kakao", hash_key(query, max_pages, size, x, y, radius, sort))
+
+
+SEARCH_LOG_MAX = 5000      # 집계 상한 (넘으면 상위 절반만 유지)
+
+
+class SearchLog:
+    # 세션이 실제로 보낸 검색 파라미터(= kakao_cache_key 입력) 집계 → 캐시 워머가 똑같이 다시 보냄
+    # 워머 스레드에서 나간 검색/통계는 빼야 해서 스레드 표시도 여기서
+    def __init__(self, max_items: int = SEARCH_LOG_MAX):
+        self.max_items = max_items
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._thread = threading.local()
+
+    def mark_warm_thread(self):
+        self._thread.warm = True
+
+    def is_warm_thread(self) -> bool:
+        return getattr(self._thread, "warm", False)
+
+    def record(self, query: str, max_pages: int, size: int, x, y, radius, sort, category: str | None = None):
+        if self.is_warm_thread():
+            return
+        params = {"query": query, "max_pages": max_pages, "size": size, "x": x, "y": y, "radius": radius,
+                  "sort": sort, "category": category}
+        with self._lock:
+            self._counts[json.dumps(params, ensure_ascii=False, sort_keys=True)] += 1
+            if len(self._counts) > self.max_items:
+                self._counts = Counter(dict(self._counts.most_common(self.max_items // 2)))
+
+    def top(self, n: int) -> list[dict]:
+        with self._lock:
+            return [json.loads(k) for k, _ in self._counts.most_common(n)]
+
+
+@st.cache_resource
+def get_search_log() -> SearchLog:
+    return SearchLog()
+
+
+search_log = get_search_log()
+
+
+def cached_places(key: str) -> list | None:
+    rows = store.get_json(key)
+    if not isinstance(rows, list):
+        return None
+    try:
+        return [Place.from_row(r) for r in rows]
+    except (TypeError, ValueError):
+        return None
+
+
+def kakao_stale_key(key: str) -> str:
+    return store_key("kakao_stale", key.rsplit(":", 1)[-1])
+
+
+def cache_places(key: str, places: list):
+    rows = [p.to_row() for p in places]
+    store.set_json(key, rows, STORE_TTL["kakao"])
+    store.set_json(kakao_stale_key(key), rows, STORE_TTL["kakao_stale"])
+
+
+def degraded_places(key: str, all_docs: list, exc: Exception) -> list:
+    # 검색 장애: 만료된 캐시 사본 → 받아둔 페이지까지 → 둘 다 없으면 UpstreamUnavailable
+    stale = cached_places(kakao_stale_key(key))
+    if stale is not None:
+        return stale
+    if all_docs:
+        return docs_to_places(all_docs)
+    raise UpstreamUnavailable("kakao") from exc
+
+
+# 검색 결과 출처: 새로 다 받음 / 캐시 / 장애라 stale 사본이나 받은 페이지까지만
+SEARCH_SOURCE_RANK = {"fresh": 0, "cache": 1, "degraded": 2}
 
-    res = requests.get(url, headers=headers, params=params, timeout=10)
-    res.raise_for_status()
-    return res.json()
+
+def worst_source(*sources: str) -> str:
+    return max(sources, key=SEARCH_SOURCE_RANK.__getitem__)
 
 
 def kakao_search_paged(query: str, rest_key: str, max_pages: int = 3, size: int = 15,
                       x: str | None = None, y: str | None = None,
-                      radius: int | None = None, sort: str | None = None):
+                      radius: int | None = None, sort: str | None = None,
+                      category: str | None = None):
+    return kakao_search_result(query, rest_key, max_pages, size, x, y, radius, sort, category)[0]
+
+
+def kakao_search_result(query: str, rest_key: str, max_pages: int = 3, size: int = 15,
+                        x: str | None = None, y: str | None = None,
+                        radius: int | None = None, sort: str | None = None,
+                        category: str | None = None) -> tuple[list, str]:
+    # (places, 출처) — 통계/풀 캐시는 "fresh"인 것만 믿음
+    search_log.record(query, max_pages, size, x, y, radius, sort, category)
+    ckey = kakao_cache_key(query, max_pages, size, x, y, radius, sort, category)
+    hit = cached_places(ckey)
+    if hit is not None:
+        return hit, "cache"
+
     all_docs = []
-    for page in range(1, max_pages + 1):
-        data = kakao_keyword_search(query, rest_key, size=size, page=page, x=x, y=y, radius=radius, sort=sort)
-        docs = data.get("documents", []) or []
-        meta = data.get("meta", {}) or {}
-        all_docs.extend(docs)
-        if meta.get("is_end") is True:
-            break
-        if len(docs) < size:
-            break
+    try:
+        for page in range(1, max_pages + 1):
+            data = kakao_keyword_search(query, rest_key, size=size, page=page, x=x, y=y, radius=radius, sort=sort,
+                                        category=category)
+            docs = data.get("documents", []) or []
+            meta = data.get("meta", {}) or {}
+            all_docs.extend(docs)
+            if meta.get("is_end") is True:
+                break
+            if len(docs) < size:
+                break
+    except Exception as e:
+        return degraded_places(ckey, all_docs, e), "degraded"
+    places = docs_to_places(all_docs)
+    cache_places(ckey, places)
+    return places, "fresh"
+
 
+def docs_to_places(all_docs: list) -> list:
     uniq = {}
     for d in all_docs:
         pid = d.get("id")
         if pid:
             uniq[pid] = d
-    return list(uniq.values())
+    return [p for p in (Place.from_kakao(d) for d in uniq.values()) if p is not None]
 
 
 # -----------------------------
@@ -416,169 +1494,954 @@ def estimate_walk_minutes(distance_m: float, speed_m_per_min: float = 80.0) -> i
     return max(1, int(math.ceil(distance_m / speed_m_per_min)))
 
 
-def get_location_center(location: str, rest_key: str):
+def pairwise_haversine_m(ax, ay, bx, by) -> np.ndarray:
+    # (n,) × (m,) 좌표 → (n, m) 거리 행렬 (m)
+    lon1, lat1 = np.radians(np.asarray(ax, dtype=float))[:, None], np.radians(np.asarray(ay, dtype=float))[:, None]
+    lon2, lat2 = np.radians(np.asarray(bx, dtype=float))[None, :], np.radians(np.asarray(by, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6371000 * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# -----------------------------
+# Travel time (center → 후보 도보 분: 일대다 한 번에 조회, 출발 셀 × 목적지 캐시)
+# -----------------------------
+# DECISION_MATE_TRAVEL:
+#   haversine            → 직선거리 / 80m·분 (기본)
+#   graph:<path.json>    → 로컬 보행 그래프 Dijkstra ({"nodes": {id: [x, y]}, "edges": [[u, v, m?], ...]},
+#                          m 생략 시 두 노드 직선거리). 서비스 지역 OSM 보행로(highway=footway/residential/...)를
+#                          노드 좌표 + 간선 목록으로 뽑아 이 형식으로 변환해서 둠.
+#                          walk_graph_sample.json: 합정~홍대 일대 100m 격자 + 철길(건널목 2곳) 예시 추출본
+#                          (실제 보행로 아님, 형식/우회 동작 확인용) → DECISION_MATE_TRAVEL=graph:walk_graph_sample.json
+#   http(s)://host:port  → POST /v1/walk-matrix {"origin": [x, y], "destinations": [[x, y], ...]} → {"minutes": [...]}
+TRAVEL_URL = os.environ.get("DECISION_MATE_TRAVEL", "haversine")
+WALK_M_PER_MIN = 80.0
+TRAVEL_CELL_DEG = 0.001        # 출발 셀 (약 100m): 같은 셀에서 나가는 조회는 캐시 공유
+TRAVEL_CELL_MAX = 500          # 셀당 목적지 보관 상한
+TRAVEL_LOCAL_CELLS = 256       # 프로세스 로컬 셀 캐시 (질문 플래너처럼 한 턴에 여러 번 정렬할 때 스토어 왕복 없이)
+TRAVEL_MISS_TTL_S = 60         # 백엔드도 모른 목적지는 잠깐 로컬에 "모름"으로 (같은 턴 재정렬마다 다시 안 물어봄)
+TRAVEL_MISS_MAX = 5000
+GRAPH_SNAP_MAX_M = 300         # 가장 가까운 그래프 노드가 이보다 멀면 서비스 지역 밖 → 직선거리
+TRAVEL_HTTP_TIMEOUT_S = 2.0
+TRAVEL_PREFETCH_WAIT_S = 2.5   # sync 엔진: 스크립트 스레드가 prefetch를 기다리는 상한 (넘으면 이번 정렬은 직선거리)
+
+
+class TravelBackend(abc.ABC):
+    # 일대다: origin (x, y) → dests [(x, y), ...] 도보 분. 모르는 곳은 None (직선거리로 대체, 캐시 안 함)
+    name = "base"
+
+    @abc.abstractmethod
+    def walk_minutes(self, origin: tuple, dests: list) -> list:
+        ...
+
+
+class HaversineTravel(TravelBackend):
+    name = "haversine"
+
+    def walk_minutes(self, origin: tuple, dests: list) -> list:
+        dist = pairwise_haversine_m([origin[0]], [origin[1]], [x for x, _ in dests], [y for _, y in dests])[0]
+        return [float(d) / WALK_M_PER_MIN for d in dist]
+
+
+class GraphTravel(TravelBackend):
+    name = "graph"
+
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        ids = list(data["nodes"])
+        index = {str(nid): i for i, nid in enumerate(ids)}
+        self.xs = np.array([data["nodes"][nid][0] for nid in ids], dtype=float)
+        self.ys = np.array([data["nodes"][nid][1] for nid in ids], dtype=float)
+        self.adj = [[] for _ in ids]
+        for edge in data["edges"]:
+            u, v = index[str(edge[0])], index[str(edge[1])]
+            m = float(edge[2]) if len(edge) > 2 else haversine_m(self.xs[u], self.ys[u], self.xs[v], self.ys[v])
+            self.adj[u].append((v, m))
+            self.adj[v].append((u, m))
+        # 스냅용 격자 (셀 한 변 ≥ GRAPH_SNAP_MAX_M → 주변 3×3 셀만 보면 한도 안의 최근접 노드가 다 들어옴)
+        lat = float(self.ys.mean()) if len(ids) else 37.5
+        self.cell_y = GRAPH_SNAP_MAX_M / 111_320.0
+        self.cell_x = GRAPH_SNAP_MAX_M / (111_320.0 * max(0.1, math.cos(math.radians(lat))))
+        self.grid = {}
+        for i, key in enumerate(zip(np.floor(self.xs / self.cell_x).astype(int).tolist(),
+                                    np.floor(self.ys / self.cell_y).astype(int).tolist())):
+            self.grid.setdefault(key, []).append(i)
+
+    def snap(self, xs: list, ys: list):
+        # 점마다 주변 격자 노드만 거리 계산. 한도 안에 노드가 없으면 거리 inf (= 서비스 지역 밖)
+        idx = np.zeros(len(xs), dtype=int)
+        dist = np.full(len(xs), math.inf)
+        for k, (x, y) in enumerate(zip(xs, ys)):
+            gx, gy = int(math.floor(x / self.cell_x)), int(math.floor(y / self.cell_y))
+            near = [i for dx in (-1, 0, 1) for dy in (-1, 0, 1) for i in self.grid.get((gx + dx, gy + dy), ())]
+            if near:
+                d = pairwise_haversine_m([x], [y], self.xs[near], self.ys[near])[0]
+                j = int(d.argmin())
+                idx[k], dist[k] = near[j], d[j]
+        return idx, dist
+
+    def shortest(self, source: int, targets: set) -> dict:
+        # source에서 Dijkstra, targets가 다 확정되면 중단
+        best = {source: 0.0}
+        done = set()
+        left = set(targets)
+        heap = [(0.0, source)]
+        while heap and left:
+            d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            left.discard(u)
+            for v, w in self.adj[u]:
+                nd = d + w
+                if nd < best.get(v, math.inf):
+                    best[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return {t: best[t] for t in targets if t in done}
+
+    def walk_minutes(self, origin: tuple, dests: list) -> list:
+        idx, snap_m = self.snap([origin[0]] + [x for x, _ in dests], [origin[1]] + [y for _, y in dests])
+        if snap_m[0] > GRAPH_SNAP_MAX_M:
+            return [None] * len(dests)
+        inside = [int(i) if m <= GRAPH_SNAP_MAX_M else None for i, m in zip(idx[1:], snap_m[1:])]
+        reach = self.shortest(int(idx[0]), {i for i in inside if i is not None})
+        out = []
+        for node, m in zip(inside, snap_m[1:]):
+            path = reach.get(node) if node is not None else None
+            # 끊긴 그래프/지역 밖 → None
+            out.append(None if path is None else (float(snap_m[0]) + path + float(m)) / WALK_M_PER_MIN)
+        return out
+
+
+class HttpTravel(TravelBackend):
+    name = "http"
+
+    def __init__(self, base_url: str):
+        self.url = base_url.rstrip("/") + "/v1/walk-matrix"
+
+    def walk_minutes(self, origin: tuple, dests: list) -> list:
+        def fetch():
+            res = requests.post(self.url, json={"origin": list(origin), "destinations": [list(d) for d in dests]},
+                                timeout=TRAVEL_HTTP_TIMEOUT_S)
+            res.raise_for_status()
+            return res.json()["minutes"]
+
+        try:
+            minutes = call_guarded("routing", fetch)
+        except Exception:
+            # 라우팅 장애/차단 → 이번 턴은 직선거리
+            return [None] * len(dests)
+        if not isinstance(minutes, list) or len(minutes) != len(dests):
+            return [None] * len(dests)
+        return [float(m) if isinstance(m, (int, float)) else None for m in minutes]
+
+
+def open_travel_backend(url: str) -> TravelBackend:
+    if url.startswith("graph:"):
+        return GraphTravel(url[len("graph:"):])
+    if urlparse(url).scheme in ("http", "https"):
+        return HttpTravel(url)
+    if url in ("", "haversine"):
+        return HaversineTravel()
+    raise ValueError(f"unknown travel backend: {url}")
+
+
+class TravelTimes:
+    # 백엔드 + 캐시 (프로세스 로컬 셀 LRU → 공유 스토어 → 백엔드는 미스만 1번에)
+    def __init__(self, backend: TravelBackend):
+        self.backend = backend
+        self.fallback = HaversineTravel()
+        self.status = {"backend": backend.name, "queries": 0, "backend_calls": 0, "hits": 0, "misses": 0,
+                       "fallback": 0}
+        self._local = OrderedDict()
+        self._unknown = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cell_key(self, origin: tuple) -> str:
+        return (f"{self.backend.name}:{round(float(origin[1]) / TRAVEL_CELL_DEG)}:"
+                f"{round(float(origin[0]) / TRAVEL_CELL_DEG)}")
+
+    def _cell(self, ckey: str) -> dict:
+        with self._lock:
+            cell = self._local.get(ckey)
+            if cell is not None:
+                self._local.move_to_end(ckey)
+                return cell
+        cell = store.get_json(store_key("travel", ckey))
+        return cell if isinstance(cell, dict) else {}
+
+    def _keep(self, ckey: str, cell: dict):
+        with self._lock:
+            self._local[ckey] = cell
+            self._local.move_to_end(ckey)
+            while len(self._local) > TRAVEL_LOCAL_CELLS:
+                self._local.popitem(last=False)
+
+    def _known_unknown(self, ckey: str, key: str, now: float) -> bool:
+        with self._lock:
+            return self._unknown.get((ckey, key), 0) > now
+
+    def _mark_unknown(self, ckey: str, keys: list):
+        until = time.time() + TRAVEL_MISS_TTL_S
+        with self._lock:
+            for k in keys:
+                self._unknown[(ckey, k)] = until
+                self._unknown.move_to_end((ckey, k))
+            while len(self._unknown) > TRAVEL_MISS_MAX:
+                self._unknown.popitem(last=False)
+
+    def walk_minutes(self, origin: tuple, dests: list, fetch: bool = True) -> list:
+        # fetch=False: 캐시만 읽음 (미스는 직선거리, 백엔드 호출 없음)
+        ckey = self.cell_key(origin)
+        cell = self._cell(ckey)
+        keys = [f"{float(x):.5f},{float(y):.5f}" for x, y in dests]
+        now = time.time()
+        missing = [i for i, k in enumerate(keys) if k not in cell and not self._known_unknown(ckey, k, now)]
+        self.status["queries"] += 1
+        self.status["hits"] += len(keys) - len(missing)
+        self.status["misses"] += len(missing)
+        if missing and fetch:
+            self.status["backend_calls"] += 1
+            got = self.backend.walk_minutes(origin, [dests[i] for i in missing])
+            new = {keys[i]: round(m, 2) for i, m in zip(missing, got) if m is not None}
+            self._mark_unknown(ckey, [keys[i] for i, m in zip(missing, got) if m is None])
+            if new:
+                cell = dict(list({**cell, **new}.items())[-TRAVEL_CELL_MAX:])
+                store.set_json(store_key("travel", ckey), cell, STORE_TTL["travel"])
+        self._keep(ckey, cell)
+
+        out = [cell.get(k) for k in keys]
+        if any(m is None for m in out):
+            self.status["fallback"] += sum(m is None for m in out)
+            straight = self.fallback.walk_minutes(origin, dests)
+            out = [straight[i] if m is None else m for i, m in enumerate(out)]
+        return out
+
+
+@st.cache_resource
+def get_travel(url: str) -> TravelTimes:
+    return TravelTimes(open_travel_backend(url))
+
+
+travel = get_travel(TRAVEL_URL)
+
+
+def walk_minutes_to(center: dict | None, places: list, fetch: bool = True) -> list:
+    # center → 후보별 도보 분 (좌표 없으면 None). 백엔드 조회는 턴당 캐시 미스만 1번 (fetch=False면 캐시만)
+    out = [None] * len(places)
+    if not center or not center.get("x") or not center.get("y"):
+        return out
+    idx = [i for i, p in enumerate(places) if p.has_coords]
+    if idx:
+        minutes = travel.walk_minutes((float(center["x"]), float(center["y"])), [(places[i].x, places[i].y) for i in idx],
+                                      fetch)
+        for i, m in zip(idx, minutes):
+            out[i] = m
+    return out
+
+
+def location_candidates(loc: str) -> list[str]:
+    return [loc] if "역" in loc else [f"{loc}역", loc]
+
+
+def get_location_center(location: str, rest_key: str, cache: dict | None = None):
     loc = (location or "").strip()
     if not loc:
         return None
 
-    cache = st.session_state.loc_center_cache
+    if cache is None:
+        cache = st.session_state.loc_center_cache
     if loc in cache:
         return cache[loc]
+    shared = store.get_json(store_key("geo", loc))
+    if shared:
+        cache[loc] = shared
+        return shared
 
-    candidates = [loc] if "역" in loc else [f"{loc}역", loc]
-    for cand in candidates:
+    for cand in location_candidates(loc):
         try:
             docs = kakao_search_paged(cand, rest_key, max_pages=1, size=15)
             if not docs:
                 continue
             d = docs[0]
-            x, y = d.get("x"), d.get("y")
-            if x and y:
-                center = {"x": x, "y": y, "name": cand}
+            if d.has_coords:
+                center = {"x": d.x, "y": d.y, "name": cand}
                 cache[loc] = center
+                store.set_json(store_key("geo", loc), center, STORE_TTL["geo"])
                 return center
+        except UpstreamUnavailable:
+            # 장애 중이면 다른 후보도 똑같이 실패 → 바로 포기
+            break
         except Exception:
             continue
     return None
 
 
 # -----------------------------
-# Query + Candidate pipeline
+# Place details (picks 뒤 백그라운드 보강: 영업시간·주차·가격대 → place id별 TTL 캐시)
 # -----------------------------
-def build_query(conditions: dict) -> str:
-    m = conditions["meta"]
-    cm = m["common"]
-    tokens = []
+# DECISION_MATE_DETAILS:
+#   off                  → 보강 안 함 (기본)
+#   http(s)://host:port  → POST /v1/place-details {"places": [{"id", "name", "category", "address"}, ...]}
+#                          → {"details": {id: {"hours": "11:30~22:00", "parking": bool, "price_level": 1~3}}}
+# 추천 경로에서는 캐시만 읽음 (카드/점수/프롬프트). 가져오기는 렌더 후 워커에서만
+DETAILS_URL = os.environ.get("DECISION_MATE_DETAILS", "off")
+DETAILS_TOP_K = 6              # picks + 다음 후보까지 미리 (다른 데 / 다른 사용자 턴에 바로 씀)
+DETAILS_WORKERS = 2
+DETAILS_HTTP_TIMEOUT_S = 3.0
+DETAILS_LOCAL_MAX = 2000
+DETAILS_MISS_TTL_S = 60        # 스토어에도 없던 id는 잠깐 로컬에 "모름"으로 (점수 계산마다 스토어 왕복 안 하게)
+DETAILS_POLL_S = 1.0           # 보강 중인 카드 자리만 이 주기로 다시 그림 (fragment)
+DETAILS_OPEN_SOON_MIN = 120    # 지금 닫혀 있어도 이 안에 열면 감점 안 함 (미리 잡는 약속)
+DETAILS_CLOSED_PENALTY = 600   # 지금도, 곧도 영업 안 함 (점수 = 거리 척도 m)
+DETAILS_PRICE_PENALTY = 150    # 예산대와 가격대 한 단계 차이당
+DETAILS_PRICE_LABELS = {1: "가성비", 2: "보통", 3: "조금 특별"}
+
+
+class DetailsFetcher(abc.ABC):
+    # places → {place id: raw details}. 모르는 곳은 빼고 반환 (빈 dict로 캐시 → TTL 동안 다시 안 물어봄)
+    name = "base"
+
+    @abc.abstractmethod
+    def fetch(self, places: list) -> dict:
+        ...
+
+
+class NullDetails(DetailsFetcher):
+    name = "off"
+
+    def fetch(self, places: list) -> dict:
+        return {}
+
+
+class HttpDetails(DetailsFetcher):
+    name = "http"
+
+    def __init__(self, base_url: str):
+        self.url = base_url.rstrip("/") + "/v1/place-details"
+
+    def fetch(self, places: list) -> dict:
+        def post():
+            res = requests.post(self.url, json={"places": [
+                {"id": p.id, "name": p.name, "category": p.category, "address": p.address} for p in places
+            ]}, timeout=DETAILS_HTTP_TIMEOUT_S)
+            res.raise_for_status()
+            return res.json().get("details") or {}
+
+        got = call_guarded("details", post)
+        return got if isinstance(got, dict) else {}
+
+
+def open_details_fetcher(url: str) -> DetailsFetcher:
+    if urlparse(url).scheme in ("http", "https"):
+        return HttpDetails(url)
+    if url in ("", "off"):
+        return NullDetails()
+    raise ValueError(f"unknown details fetcher: {url}")
+
+
+def normalize_details(raw) -> dict:
+    # 아는 필드만, 타입 맞는 것만
+    raw = raw if isinstance(raw, dict) else {}
+    hours = raw.get("hours")
+    parking = raw.get("parking")
+    price = raw.get("price_level")
+    return {
+        "hours": hours.strip() if isinstance(hours, str) and hours.strip() else None,
+        "parking": parking if isinstance(parking, bool) else None,
+        "price_level": price if isinstance(price, int) and price in DETAILS_PRICE_LABELS else None,
+    }
 
-    if conditions.get("location"):
-        tokens.append(conditions["location"])
 
-    # place type
-    pt = m.get("place_type", "자동")
-    if pt == "술":
-        tokens.append("술집")
-    elif pt == "카페":
-        tokens.append("카페")
-    elif pt == "식사":
-        tokens.append("맛집")
+def open_at(hours: str | None, minute_of_day: int) -> bool | None:
+    # "HH:MM~HH:MM" (자정 넘김 허용). 형식 모르면 None
+    m = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*[~-]\s*(\d{1,2}):(\d{2})\s*", hours or "")
+    if not m:
+        return None
+    start = int(m.group(1)) * 60 + int(m.group(2))
+    end = int(m.group(3)) * 60 + int(m.group(4))
+    if start == end:
+        return True
+    if start < end:
+        return start <= minute_of_day < end
+    return minute_of_day >= start or minute_of_day < end
+
+
+def now_minute() -> int:
+    t = time.localtime()
+    return t.tm_hour * 60 + t.tm_min
+
+
+class PlaceDetails:
+    # 로컬 LRU → 공유 스토어. 가져오기는 워커 풀에서 미스만 배치로 (같은 id 동시 요청은 1번)
+    def __init__(self, fetcher: DetailsFetcher):
+        self.fetcher = fetcher
+        self.status = {"fetcher": fetcher.name, "scheduled": 0, "fetched": 0, "known": 0, "errors": 0}
+        self._local = OrderedDict()     # id → (details | None, 로컬 만료 시각)
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=DETAILS_WORKERS, thread_name_prefix="decision-mate-details")
+
+    @property
+    def enabled(self) -> bool:
+        return not isinstance(self.fetcher, NullDetails)
+
+    def _keep(self, pid, info: dict | None, ttl: float):
+        with self._lock:
+            self._local[pid] = (info, time.time() + ttl)
+            self._local.move_to_end(pid)
+            while len(self._local) > DETAILS_LOCAL_MAX:
+                self._local.popitem(last=False)
+
+    def get(self, pid) -> dict | None:
+        # 캐시만: 보강된 적 있으면 dict (모르는 필드는 None), 아니면 None
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._local.get(pid)
+        if item is not None and item[1] > time.time():
+            return item[0]
+        info = store.get_json(store_key("details", str(pid)))
+        info = normalize_details(info) if isinstance(info, dict) else None
+        self._keep(pid, info, STORE_TTL["details"] if info is not None else DETAILS_MISS_TTL_S)
+        return info
+
+    def get_many(self, pids: list) -> dict:
+        # 점수 계산용: 로컬에 없는 id만 스토어 한 번(MGET)에. 결과는 로컬에 남아서 같은 턴의 재정렬은 왕복 없음
+        if not self.enabled:
+            return {}
+        now = time.time()
+        out, misses = {}, []
+        with self._lock:
+            for pid in dict.fromkeys(pids):
+                item = self._local.get(pid)
+                if item is not None and item[1] > now:
+                    out[pid] = item[0]
+                else:
+                    misses.append(pid)
+        if misses:
+            rows = store.get_many_json([store_key("details", str(pid)) for pid in misses])
+            for pid, info in zip(misses, rows):
+                info = normalize_details(info) if isinstance(info, dict) else None
+                self._keep(pid, info, STORE_TTL["details"] if info is not None else DETAILS_MISS_TTL_S)
+                out[pid] = info
+        return out
+
+    def pending(self, pid) -> bool:
+        with self._lock:
+            return pid in self._inflight
+
+    def enrich(self, places: list):
+        # 캐시에 없는 곳만 골라 백그라운드로. 바로 반환
+        if not self.enabled:
+            return
+        todo = []
+        for p in places:
+            if p is None or self.get(p.id) is not None:
+                continue
+            with self._lock:
+                if p.id in self._inflight:
+                    continue
+                self._inflight.add(p.id)
+            todo.append(p)
+        if todo:
+            self.status["scheduled"] += len(todo)
+            self._pool.submit(self._fetch, todo)
 
-    # food class
-    fc = m.get("food_class", "자동")
-    if fc != "자동":
-        tokens.append(fc)
+    def _fetch(self, places: list):
+        try:
+            got = self.fetcher.fetch(places)
+            self.status["fetched"] += len(places)
+            for p in places:
+                raw = got.get(str(p.id), got.get(p.id))
+                info = normalize_details(raw)
+                self.status["known"] += raw is not None
+                store.set_json(store_key("details", str(p.id)), info, STORE_TTL["details"])
+                self._keep(p.id, info, STORE_TTL["details"])
+        except Exception:
+            # 장애/차단 → 이번엔 보강 없이. 다음 턴에 다시 시도
+            self.status["errors"] += 1
+        finally:
+            with self._lock:
+                self._inflight.difference_update(p.id for p in places)
 
-    # alcohol hint
-    if pt != "카페":
-        if cm.get("alcohol_level") == "술 중심":
-            tokens.append("술")
-        elif cm.get("alcohol_level") == "가볍게" and pt == "자동":
-            tokens.append("술집")
 
-    # alcohol type
-    at = cm.get("alcohol_type")
-    if at and at != "상관없음":
-        tokens.append(at)
+@st.cache_resource
+def get_place_details(url: str) -> PlaceDetails:
+    return PlaceDetails(open_details_fetcher(url))
 
-    # focus hint
-    focus = cm.get("focus")
-    if focus == "대화 중심":
-        tokens.append("조용한")
-    elif focus == "음식 중심":
-        tokens.append("맛집")
 
-    # mode hints (가볍게만)
-    mode = m.get("mode")
-    if mode == "회사 회식":
-        tokens.append("회식")
-    elif mode == "단체 모임":
-        tokens.append("단체")
-    elif mode == "혼밥":
-        tokens.append("혼밥")
-    elif mode == "연인 · 썸 · 소개팅":
-        tokens.append("데이트")
+details = get_place_details(DETAILS_URL)
 
-    return " ".join([t for t in tokens if t]).strip()
 
+def details_penalty(info: dict | None, conditions: dict, minute_of_day: int) -> float:
+    # 보강된 정보로만 점수 보정 (없으면 0 → 기존 순위 그대로)
+    if not info:
+        return 0.0
+    penalty = 0.0
+    soon = (minute_of_day + DETAILS_OPEN_SOON_MIN) % (24 * 60)
+    if open_at(info["hours"], minute_of_day) is False and open_at(info["hours"], soon) is False:
+        penalty += DETAILS_CLOSED_PENALTY
+    tier = conditions["meta"].get("budget_tier")
+    if info["price_level"] and tier in BUDGET_OPTIONS[1:]:
+        penalty += abs(BUDGET_OPTIONS.index(tier) - info["price_level"]) * DETAILS_PRICE_PENALTY
+    return penalty
 
-def get_candidate_pool(conditions: dict, rest_key: str):
-    """
-    완화 단계:
-    relax 0: radius=1200, pages=2
-    relax 1: radius=2000, pages=3
-    relax 2: radius=None, pages=4
-    relax 3: query 약화(location + place_type + food_class), radius=None, pages=4
-    """
-    m = conditions["meta"]
-    cm = m["common"]
-    relax = int(cm.get("search_relax", 0))
 
-    center = get_location_center(conditions.get("location"), rest_key)
-    cm["center"] = center
+def details_text(info: dict | None) -> str:
+    if not info:
+        return ""
+    parts = []
+    if info["hours"]:
+        parts.append(f"🕒 {info['hours']}" + ("" if open_at(info["hours"], now_minute()) is not False else " (지금 영업 전/후)"))
+    if info["parking"] is not None:
+        parts.append("🅿️ 주차 가능" if info["parking"] else "🅿️ 주차 없음")
+    if info["price_level"]:
+        parts.append(f"💰 {DETAILS_PRICE_LABELS[info['price_level']]}")
+    return " · ".join(parts)
+
+
+def place_details_caption(pid, label: str = ""):
+    info = details.get(pid)
+    if info:
+        text = details_text(info)
+        if text:
+            st.caption(label + text)
+    elif details.pending(pid):
+        st.caption(label + "🔎 영업시간·주차 정보 찾는 중…")
+
+
+def render_place_details(place: Place, label: str = ""):
+    # 있으면 바로 그리고, 보강 중이면 그 카드 자리만 fragment 폴링 → 도착하면 제자리에서 채움
+    # (턴 끝을 붙잡지 않음. 도착 뒤에도 다음 입력까지 틱은 돌지만 로컬 캐시 조회라 가벼움)
+    if not details.enabled:
+        return
+    if details.get(place.id) is None and details.pending(place.id):
+        st.fragment(place_details_caption, run_every=DETAILS_POLL_S)(place.id, label)
+    else:
+        place_details_caption(place.id, label)
 
-    pages = 2 if relax == 0 else (3 if relax == 1 else 4)
-    radius = 1200 if relax == 0 else (2000 if relax == 1 else None)
 
-    x = center["x"] if center else None
-    y = center["y"] if center else None
-    sort = "distance" if center else None
+# -----------------------------
+# Meeting point (여러 출발지 → 공평한 중간 지점 + 1인당 이동 기준 순위)
+# -----------------------------
+MEET_GRID = 21                  # 출발지 bbox 위 격자 해상도 (GRID × GRID 후보 지점)
+MEET_SNAP_RADIUS_M = 1500       # 중간 지점 근처 지하철역으로 맞춤
+MEET_TRANSIT_M_PER_MIN = 350.0  # 대중교통 체감 속도 (대기/환승 포함 평균)
+MEET_TRANSIT_BASE_MIN = 8
+MEET_ORIGIN_MAX_CHARS = 10       # 출발지 한 조각 길이 상한 (공백 제외, "서울대입구역" 정도)
+_ORIGIN_SPLIT = re.compile(r"[,/·&+\n]+")
+_ORIGIN_NOISE = re.compile(r"\d+\s*명|에서\s*(?:모여|만나|출발|와)?|근처|부근|쪽")
+# 동네/역 이름이 아니라 말로 덧붙인 조건 ("소개팅이라 조용했으면")
+_ORIGIN_FREE_TEXT = re.compile(r"이라|라서|으면|하면|해서|싶|좋|는데|니까|조용|분위기|맛집|한\s|[고요다데곳]$")
 
-    query = build_query(conditions)
-    places = kakao_search_paged(query, rest_key, max_pages=pages, size=15, x=x, y=y, radius=radius, sort=sort)
 
-    if relax >= 3 and len(places) < 10:
-        weak = [conditions.get("location", "")]
-        pt = m.get("place_type", "자동")
-        fc = m.get("food_class", "자동")
-        if pt == "술":
-            weak.append("술집")
-        elif pt == "카페":
-            weak.append("카페")
-        elif pt == "식사":
-            weak.append("맛집")
-        if fc != "자동":
-            weak.append(fc)
-        weak_query = " ".join([t for t in weak if t]).strip()
-        places2 = kakao_search_paged(weak_query, rest_key, max_pages=4, size=15, x=x, y=y, radius=None, sort=sort)
-        byid = {p.get("id"): p for p in places if p.get("id")}
-        for p in places2:
-            pid = p.get("id")
-            if pid and pid not in byid:
-                byid[pid] = p
-        places = list(byid.values())
+def looks_like_origin(name: str) -> bool:
+    return (0 < len(nc(name)) <= MEET_ORIGIN_MAX_CHARS and len(name.split()) <= 2
+            and not _ORIGIN_FREE_TEXT.search(name))
 
-    return places, center, query
 
+def parse_origins(text: str) -> list[dict]:
+    # "홍대 3명, 강남 2명, 잠실(에서 모여)" → 조각이 전부 동네/역처럼 보이고 2곳 이상일 때만 출발지 목록
+    # ("홍대역 근처, 소개팅이라 조용했으면"은 위치 + 조건이지 출발지 2곳이 아님)
+    out = []
+    for part in _ORIGIN_SPLIT.split(text or ""):
+        if not part.strip():
+            continue
+        m = re.search(r"(\d+)\s*명", part)
+        name = _ORIGIN_NOISE.sub(" ", part).strip()
+        if not looks_like_origin(name):
+            return []
+        out.append({"name": name, "weight": max(1, int(m.group(1))) if m else 1})
+    return out if len(out) >= 2 else []
 
-def filter_by_place_type(places: list, place_type: str):
-    if place_type == "카페":
+
+def meet_objective(points: list) -> str:
+    # 인원 수를 말해줬으면 인원 가중 합, 아니면 가장 먼 사람 기준(minimax)
+    return "weighted" if any(p.get("weight", 1) > 1 for p in points) else "minimax"
+
+
+def fairness_cost(dist: np.ndarray, weights: np.ndarray, objective: str) -> np.ndarray:
+    # dist: (출발지, 지점) → 지점별 목표값 (m)
+    if objective == "weighted":
+        return (weights[:, None] * dist).sum(axis=0) / weights.sum()
+    return dist.max(axis=0) + 0.1 * dist.mean(axis=0)
+
+
+def origin_costs(points: list, places: list) -> np.ndarray | None:
+    if not points or len(points) < 2:
+        return None
+    out = np.full(len(places), 1e12)
+    idx = [i for i, p in enumerate(places) if p.has_coords]
+    if idx:
+        dist = pairwise_haversine_m([o["x"] for o in points], [o["y"] for o in points],
+                                    [places[i].x for i in idx], [places[i].y for i in idx])
+        weights = np.array([o.get("weight", 1) for o in points], dtype=float)
+        out[idx] = fairness_cost(dist, weights, meet_objective(points))
+    return out
+
+
+def travel_minutes(points: list, place: Place) -> list[tuple[str, int]]:
+    dist = pairwise_haversine_m([o["x"] for o in points], [o["y"] for o in points], [place.x], [place.y])[:, 0]
+    return [(o["name"], int(MEET_TRANSIT_BASE_MIN + math.ceil(d / MEET_TRANSIT_M_PER_MIN))) for o, d in zip(points, dist)]
+
+
+def meeting_target(points: list) -> tuple[float, float]:
+    xs = np.array([o["x"] for o in points], dtype=float)
+    ys = np.array([o["y"] for o in points], dtype=float)
+    pad_x = max(0.002, (xs.max() - xs.min()) * 0.1)
+    pad_y = max(0.002, (ys.max() - ys.min()) * 0.1)
+    gx, gy = np.meshgrid(np.linspace(xs.min() - pad_x, xs.max() + pad_x, MEET_GRID),
+                         np.linspace(ys.min() - pad_y, ys.max() + pad_y, MEET_GRID))
+    gx, gy = gx.ravel(), gy.ravel()
+    weights = np.array([o.get("weight", 1) for o in points], dtype=float)
+    best = int(np.argmin(fairness_cost(pairwise_haversine_m(xs, ys, gx, gy), weights, meet_objective(points))))
+    return float(gx[best]), float(gy[best])
+
+
+def origin_points(origins: list, centers: list) -> list[dict]:
+    return [{"name": o["name"], "weight": o.get("weight", 1), "x": float(c["x"]), "y": float(c["y"])}
+            for o, c in zip(origins, centers) if c]
+
+
+def station_center(docs: list) -> dict | None:
+    for d in docs:
+        if d.has_coords and "지하철" in d.category:
+            return {"x": d.x, "y": d.y, "name": d.name}
+    return None
+
+
+def meeting_center(origins: list, rest_key: str, cache: dict | None = None):
+    if cache is None:
+        cache = st.session_state.loc_center_cache
+    # 캐시에 없는 출발지만 동시에 조회 (세션 캐시 쓰기는 이 스레드에서)
+    names = [o["name"] for o in origins]
+    misses = [n for n in dict.fromkeys(names) if n not in cache]
+    if misses:
+        with ThreadPoolExecutor(max_workers=min(8, len(misses))) as ex:
+            for name, center in zip(misses, ex.map(lambda n: get_location_center(n, rest_key, {}), misses)):
+                if center:
+                    cache[name] = center
+    points = origin_points(origins, [cache.get(n) for n in names])
+    if len(points) < 2:
+        return (cache.get(points[0]["name"]) if points else None), points
+
+    x, y = meeting_target(points)
+    try:
+        docs = kakao_search_paged("지하철역", rest_key, max_pages=1, size=5, x=x, y=y,
+                                  radius=MEET_SNAP_RADIUS_M, sort="distance")
+    except UpstreamUnavailable:
+        docs = []
+    return station_center(docs) or {"x": x, "y": y, "name": "중간 지점"}, points
+
+
+def resolve_center(conditions: dict, rest_key: str, cache: dict | None = None):
+    cm = conditions["meta"]["common"]
+    if conditions.get("origins"):
+        center, cm["origin_points"] = meeting_center(conditions["origins"], rest_key, cache)
+        return center
+    cm["origin_points"] = []
+    return get_location_center(conditions.get("location"), rest_key, cache)
+
+
+# -----------------------------
+# Category search (place_type → 카카오 카테고리 그룹 코드로 좌표 주변 검색, 세부는 카테고리 경로로 후필터)
+# -----------------------------
+CATEGORY_GROUPS = {"카페": "CE7"}      # 나머지(자동/식사/술)는 음식점 그룹
+CATEGORY_DEFAULT_GROUP = "FD6"
+CATEGORY_MAX_PAGES = 3                 # 카테고리 검색은 45건(3페이지)까지만 줌
+CATEGORY_WIDE_RADIUS_M = 5000          # 반경 없는 relax 단계용 (카테고리 검색은 radius 필수, 최대 20km)
+
+
+def use_category_search(conditions: dict, center: dict | None) -> bool:
+    # 좌표가 있어야 카테고리 검색 가능 → 없으면 키워드 검색 그대로
+    return conditions["meta"].get("search_mode") == "category" and center is not None
+
+
+def category_group(conditions: dict) -> str:
+    return CATEGORY_GROUPS.get(conditions["meta"].get("place_type"), CATEGORY_DEFAULT_GROUP)
+
+
+def category_keyword(conditions: dict) -> str:
+    # 카테고리 코드로 못 거르는 구체 토큰만 키워드 검색으로 (술집 + 주종)
+    m = conditions["meta"]
+    cm = m["common"]
+    tokens = []
+    if m.get("place_type") == "술":
+        tokens.append("술집")
+    at = cm.get("alcohol_type")
+    if m.get("place_type") != "카페" and at and at != "상관없음":
+        tokens.append(at)
+    return " ".join(tokens)
+
+
+def category_label(code: str, keyword: str) -> str:
+    return f"[{code}] {keyword}".strip()
+
+
+def filter_by_food_class(places: list, food_class: str, min_keep: int = 8):
+    # 카테고리 검색은 검색어에 음식 분류가 없으니 경로("음식점 > 일식 > ...")로 거름
+    if food_class == "자동":
+        return places
+    out = [p for p in places if any(food_class in c for c in p.cat_path)]
+    return out if len(out) >= min_keep else places
+
+
+def category_pool(conditions: dict, rest_key: str, center: dict, pages: int, radius: int | None):
+    code = category_group(conditions)
+    keyword = category_keyword(conditions)
+    radius = radius or CATEGORY_WIDE_RADIUS_M
+    x, y = center["x"], center["y"]
+    places, source = kakao_search_result("", rest_key, max_pages=min(pages, CATEGORY_MAX_PAGES), size=15, x=x, y=y,
+                                         radius=radius, sort="distance", category=code)
+    if keyword:
+        hits, hit_source = kakao_search_result(keyword, rest_key, max_pages=1, size=15, x=x, y=y, radius=radius,
+                                               sort="distance")
+        places = merge_places(hits, places)
+        source = worst_source(source, hit_source)
+    return places, category_label(code, keyword), source
+
+
+# -----------------------------
+# Retrieval pool cache (검색 조건이 그대로면 카카오/스토어 왕복 없이 필터·점수 단계만 다시)
+# -----------------------------
+# 검색(쿼리/카테고리/좌표)에 들어가는 필드. 나머지(이동수단·도보 한도·프차·못 먹는 것·예산·민감도·인원 등)는
+# 필터/점수에만 쓰여서 바뀌어도 같은 풀을 재사용
+RETRIEVAL_META = ("place_type", "food_class", "mode", "search_mode")
+RETRIEVAL_COMMON = ("alcohol_level", "alcohol_type", "focus")
+POOL_CACHE_MAX = 256
+POOL_CACHE_TTL_S = STORE_TTL["kakao"]     # 카카오 응답 캐시와 같은 신선도
+
+
+def retrieval_signature(conditions: dict, center: dict | None) -> str:
+    m = conditions["meta"]
+    cm = m["common"]
+    sig = {
+        # 좌표가 있으면 좌표로 (같은 역을 다르게 불러도 같은 풀), 없으면 지역명 쿼리 그대로
+        "center": [f"{float(center['x']):.5f}", f"{float(center['y']):.5f}"] if center else None,
+        "location": None if center else conditions.get("location"),
+        "meta": {k: m.get(k) for k in RETRIEVAL_META},
+        "common": {k: cm.get(k) for k in RETRIEVAL_COMMON},
+    }
+    return hash_key(json.dumps(sig, ensure_ascii=False, sort_keys=True, default=str))
+
+
+class PoolCache:
+    # (center, 검색 signature) → 필터 전 Place 풀 + 그 풀을 받은 완화 단계. 프로세스 로컬 LRU
+    def __init__(self, max_items: int = POOL_CACHE_MAX, ttl_s: float = POOL_CACHE_TTL_S):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self.status = {"hits": 0, "misses": 0}
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sig: str, relax: int) -> dict | None:
+        # 요청한 완화 단계 이상으로 받아둔 풀만 (더 넓게 받은 풀은 좁은 요청에도 충분)
+        with self._lock:
+            entry = self._data.get(sig)
+            if entry is not None and entry["expires"] < time.time():
+                del self._data[sig]
+                entry = None
+            if entry is None or entry["relax"] < relax:
+                self.status["misses"] += 1
+                return None
+            self._data.move_to_end(sig)
+            self.status["hits"] += 1
+            return entry
+
+    def put(self, sig: str, places: list, query: str, relax: int, source: str = "fresh"):
+        if source == "degraded" or breakers["kakao"].state != "closed":
+            return      # 장애 때 받은 풀은 만료 사본/일부 페이지일 수 있음 → 안 담음 (브레이커가 아직 closed여도)
+        with self._lock:
+            self._data[sig] = {"places": places, "query": query, "relax": relax,
+                               "expires": time.time() + self.ttl_s}
+            self._data.move_to_end(sig)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+
+@st.cache_resource
+def get_pool_cache() -> PoolCache:
+    return PoolCache()
+
+
+pool_cache = get_pool_cache()
+
+
+def cached_pool(conditions: dict, center: dict | None):
+    # 히트면 (places 복사본, query) + 완화 단계를 풀 기준으로 맞춤
+    entry = pool_cache.get(retrieval_signature(conditions, center), int(conditions["meta"]["common"].get("search_relax", 0)))
+    if entry is None:
+        return None
+    conditions["meta"]["common"]["search_relax"] = entry["relax"]
+    return list(entry["places"]), entry["query"]
+
+
+# -----------------------------
+# Query + Candidate pipeline
+# -----------------------------
+def build_query(conditions: dict) -> str:
+    m = conditions["meta"]
+    cm = m["common"]
+    tokens = []
+
+    # 여러 출발지면 지역명 대신 중간 지점 좌표로만 검색
+    if conditions.get("location") and not conditions.get("origins"):
+        tokens.append(conditions["location"])
+
+    # place type
+    pt = m.get("place_type", "자동")
+    if pt == "술":
+        tokens.append("술집")
+    elif pt == "카페":
+        tokens.append("카페")
+    elif pt == "식사":
+        tokens.append("맛집")
+
+    # food class
+    fc = m.get("food_class", "자동")
+    if fc != "자동":
+        tokens.append(fc)
+
+    # alcohol hint
+    if pt != "카페":
+        if cm.get("alcohol_level") == "술 중심":
+            tokens.append("술")
+        elif cm.get("alcohol_level") == "가볍게" and pt == "자동":
+            tokens.append("술집")
+
+    # alcohol type
+    at = cm.get("alcohol_type")
+    if at and at != "상관없음":
+        tokens.append(at)
+
+    # focus hint
+    focus = cm.get("focus")
+    if focus == "대화 중심":
+        tokens.append("조용한")
+    elif focus == "음식 중심":
+        tokens.append("맛집")
+
+    # mode hints (가볍게만)
+    mode = m.get("mode")
+    if mode == "회사 회식":
+        tokens.append("회식")
+    elif mode == "단체 모임":
+        tokens.append("단체")
+    elif mode == "혼밥":
+        tokens.append("혼밥")
+    elif mode == "연인 · 썸 · 소개팅":
+        tokens.append("데이트")
+
+    return " ".join([t for t in tokens if t]).strip() or "맛집"
+
+
+def get_candidate_pool(conditions: dict, rest_key: str, loc_cache: dict | None = None):
+    """
+    완화 단계:
+    relax 0: radius=1200, pages=2
+    relax 1: radius=2000, pages=3
+    relax 2: radius=None, pages=4
+    relax 3: query 약화(location + place_type + food_class), radius=None, pages=4
+    (plan_search 통계가 쌓이면 시작 단계/페이지 수는 관측 통과율로 조정)
+    """
+    cm = conditions["meta"]["common"]
+    relax = int(cm.get("search_relax", 0))
+
+    center = resolve_center(conditions, rest_key, loc_cache)
+    cm["center"] = center
+    hit = cached_pool(conditions, center)
+    if hit is not None:
+        return hit[0], center, hit[1]
+
+    # 관측 통계로 시작 단계/페이지 수 결정 (희소 지역은 넓게, 밀집 지역은 1페이지)
+    relax, pages, radius = plan_search(center, conditions, relax)
+    cm["search_relax"] = relax
+
+    x = center["x"] if center else None
+    y = center["y"] if center else None
+    sort = "distance" if center else None
+
+    if use_category_search(conditions, center):
+        places, query, source = category_pool(conditions, rest_key, center, pages, radius)
+        pages = min(pages, CATEGORY_MAX_PAGES)
+    else:
+        query = build_query(conditions)
+        places, source = kakao_search_result(query, rest_key, max_pages=pages, size=15, x=x, y=y, radius=radius,
+                                             sort=sort)
+    # 통과율 통계는 새로 다 받은 응답만 (캐시/장애 경로 결과로 치우치지 않게)
+    if source == "fresh":
+        record_search_stats(center, conditions, relax, pages, places)
+
+    if relax >= 3 and len(places) < 10:
+        places2, source2 = kakao_search_result(build_weak_query(conditions), rest_key, max_pages=4, size=15, x=x, y=y, radius=None, sort=sort)
+        places = merge_places(places, places2)
+        source = worst_source(source, source2)
+
+    pool_cache.put(retrieval_signature(conditions, center), places, query, relax, source)
+    return places, center, query
+
+
+def relax_plan(relax: int) -> tuple[int, int | None]:
+    pages = 2 if relax == 0 else (3 if relax == 1 else 4)
+    radius = 1200 if relax == 0 else (2000 if relax == 1 else None)
+    return pages, radius
+
+
+def build_weak_query(conditions: dict) -> str:
+    m = conditions["meta"]
+    weak = ["" if conditions.get("origins") else conditions.get("location", "")]
+    pt = m.get("place_type", "자동")
+    fc = m.get("food_class", "자동")
+    if pt == "술":
+        weak.append("술집")
+    elif pt == "카페":
+        weak.append("카페")
+    elif pt == "식사":
+        weak.append("맛집")
+    if fc != "자동":
+        weak.append(fc)
+    return " ".join([t for t in weak if t]).strip() or "맛집"
+
+
+def merge_places(places: list, extra: list) -> list:
+    byid = {p.id: p for p in places}
+    for p in extra:
+        if p.id not in byid:
+            byid[p.id] = p
+    return list(byid.values())
+
+
+def filter_by_place_type(places: list, place_type: str, min_keep: int = 8):
+    if place_type == "카페":
         allow = ["카페", "디저트", "베이커리", "아이스크림"]
-        out = [p for p in places if any(a in (p.get("category_name") or "") for a in allow)]
-        return out if len(out) >= 8 else places
+        out = [p for p in places if any(a in c for c in p.cat_path for a in allow)]
+        return out if len(out) >= min_keep else places
     if place_type == "술":
         allow = ["술", "주점", "호프", "이자카야", "바", "포차", "펍", "와인", "막걸리", "전통주"]
-        out = [p for p in places if any(a in (p.get("category_name") or "") for a in allow)]
-        return out if len(out) >= 8 else places
+        out = [p for p in places if any(a in c for c in p.cat_path for a in allow)]
+        return out if len(out) >= min_keep else places
     if place_type == "식사":
         banned = ["카페", "디저트", "베이커리", "아이스크림"]
-        out = [p for p in places if not any(b in (p.get("category_name") or "") for b in banned)]
-        return out if len(out) >= 8 else places
+        out = [p for p in places if not any(b in c for c in p.cat_path for b in banned)]
+        return out if len(out) >= min_keep else places
     return places
 
 
-def franchise_filter(places: list, avoid: bool):
+def franchise_filter(places: list, avoid: bool, min_keep: int = 8):
     if not avoid:
         return places
     franchise_keywords = ["스타벅스", "투썸", "이디야", "메가커피", "빽다방", "홍콩반점", "교촌", "bhc", "bbq", "버거킹", "맥도날드", "kfc"]
     out = []
     for p in places:
-        name = (p.get("place_name") or "")
-        if any(k.lower() in name.lower() for k in franchise_keywords):
+        name = p.name.lower()
+        if any(k.lower() in name for k in franchise_keywords):
             continue
         out.append(p)
-    return out if len(out) >= 8 else places
+    return out if len(out) >= min_keep else places
 
 
-def dating_high_sensitivity_filter(places: list, conditions: dict):
+def dating_high_sensitivity_filter(places: list, conditions: dict, min_keep: int = 8):
     m = conditions["meta"]
     cm = m["common"]
     if m.get("mode") != "연인 · 썸 · 소개팅":
@@ -589,19 +2452,16 @@ def dating_high_sensitivity_filter(places: list, conditions: dict):
     banned_words = ["오마카세", "파인다이닝", "테이스팅", "코스"]
     out = []
     for p in places:
-        name = (p.get("place_name") or "")
-        if any(b in name for b in banned_words):
+        if any(b in p.name for b in banned_words):
             continue
         out.append(p)
-    return out if len(out) >= 8 else places
+    return out if len(out) >= min_keep else places
 
 
-def alcohol_type_match_score(place: dict, alcohol_type: str | None) -> int:
+def alcohol_type_match_score(place: Place, alcohol_type: str | None) -> int:
     if not alcohol_type or alcohol_type == "상관없음":
         return 0
-    name = (place.get("place_name") or "").lower()
-    cat = (place.get("category_name") or "").lower()
-    text = f"{name} {cat}"
+    text = place.text
 
     if alcohol_type == "소주":
         hits = ["포차", "주점", "한식주점", "소주", "막걸리", "전통주", "곱창", "삼겹", "고기"]
@@ -625,56 +2485,375 @@ def alcohol_type_match_score(place: dict, alcohol_type: str | None) -> int:
     return score
 
 
-def prioritize_places(places: list, center: dict | None, conditions: dict):
+def score_places(places: list, center: dict | None, conditions: dict) -> list:
+    # (score, dist, place) — score는 거리(m) 기반, 낮을수록 우선
     m = conditions["meta"]
     cm = m["common"]
     transport = cm.get("transport")
-    walk_limit = cm.get("walk_limit_min") or 20
+    walk_limit = cm.get("walk_limit_min") or WALK_LIMIT_DEFAULT_MIN
     alcohol_type = cm.get("alcohol_type")
 
-    def parking_signal(p: dict) -> int:
-        text = f"{p.get('place_name','')} {p.get('category_name','')}".lower()
+    def parking_signal(p: Place, info: dict | None) -> int:
+        if info and info["parking"] is not None:
+            # 보강된 주차 정보가 있으면 이름/카테고리 추정보다 우선
+            return 3 if info["parking"] else -2
+        text = p.text
         score = 0
         if "주차" in text or "parking" in text or "발렛" in text:
             score += 3
         return score
 
+    fair = origin_costs(cm.get("origin_points"), places)
+    # 도보 분은 prefetch_scoring_inputs가 미리 채운 캐시만 (정렬 중 라우팅 호출 없음)
+    walks = walk_minutes_to(center, places, fetch=False) if fair is None else [None] * len(places)
+    known = details.get_many([p.id for p in places])
+    infos = [known.get(p.id) for p in places]
+    minute = now_minute()
     scored = []
-    for p in places:
+    for i, p in enumerate(places):
         dist = 10**12
         walk = None
-        if center and center.get("x") and center.get("y") and p.get("x") and p.get("y"):
-            try:
-                dist = haversine_m(center["x"], center["y"], p["x"], p["y"])
-                walk = estimate_walk_minutes(dist)
-            except Exception:
-                dist = 10**12
-                walk = None
+        if fair is not None:
+            # 여러 출발지: 중간 지점 거리 대신 1인당 이동 목표값 (도보 한도는 적용 안 함)
+            dist = float(fair[i])
+        elif walks[i] is not None:
+            # 도보 분을 거리 척도로 (강/철길 우회가 길면 그만큼 먼 곳)
+            dist = walks[i] * WALK_M_PER_MIN
+            walk = max(1, int(math.ceil(walks[i])))
 
         score = dist
 
         if transport == "차":
-            score -= parking_signal(p) * 140
-        elif transport == "대중교통":
+            score -= parking_signal(p, infos[i]) * 140
+        elif transport == "대중교통" or cm.get("walk_limit_src"):
+            # 대중교통이거나 도보 한도를 직접 정했으면 한도 넘는 만큼 감점 (기본값 20분만으론 감점 안 함)
             if walk is not None and walk > walk_limit:
                 score += (walk - walk_limit) * 120
 
         score -= alcohol_type_match_score(p, alcohol_type) * 180
+        score += details_penalty(infos[i], conditions, minute)
 
         scored.append((score, dist, p))
+    return scored
+
+
+def prefetch_scoring_inputs(center: dict | None, places: list, walks: bool = True):
+    # score_places가 읽는 외부 값(도보 분, 상세 정보)을 한 번에 로컬 캐시로
+    if walks:
+        walk_minutes_to(center, places)
+    details.get_many([p.id for p in places])
+
 
+def prioritize_places(places: list, center: dict | None, conditions: dict):
+    scored = score_places(places, center, conditions)
     scored.sort(key=lambda x: (x[0], x[1]))
     return [p for _, __, p in scored]
 
 
+def strict_survivors(places: list, conditions: dict) -> list:
+    # 필터 fallback(부족하면 원본 반환) 없이 실제로 통과하는 후보만 → 플래너 통계용
+    places = franchise_filter(places, conditions["constraints"].get("avoid_franchise", False), min_keep=0)
+    places = filter_by_place_type(places, conditions["meta"].get("place_type", "자동"), min_keep=0)
+    if conditions["meta"].get("search_mode") == "category":
+        places = filter_by_food_class(places, conditions["meta"].get("food_class", "자동"), min_keep=0)
+    return dating_high_sensitivity_filter(places, conditions, min_keep=0)
+
+
+def refine_places(places: list, center: dict | None, conditions: dict) -> list:
+    # 필터 → 우선순위 (sync/async 엔진 공통 단계)
+    places = franchise_filter(places, conditions["constraints"].get("avoid_franchise", False))
+    places = filter_by_place_type(places, conditions["meta"].get("place_type", "자동"))
+    if conditions["meta"].get("search_mode") == "category":
+        places = filter_by_food_class(places, conditions["meta"].get("food_class", "자동"))
+    places = dating_high_sensitivity_filter(places, conditions)
+    return prioritize_places(places, center, conditions)
+
+
 def filter_exclude_last(places: list, exclude_ids: list):
     if not exclude_ids:
         return places
     ex = set(exclude_ids)
-    out = [p for p in places if p.get("id") not in ex]
+    out = [p for p in places if p.id not in ex]
     return out if len(out) >= 6 else places
 
 
+# -----------------------------
+# Diverse shortlist (rerank 전 MMR: 점수 높고 서로 덜 겹치는 후보만 프롬프트로)
+# -----------------------------
+MMR_LAMBDA = 0.7            # 관련도 vs 중복 페널티
+MMR_SCORE_SCALE_M = 400     # 점수(m) 차이가 이만큼 나면 관련도 1/e
+MMR_NEAR_M = 50             # 같은 건물/골목 수준 거리
+MMR_CLOSE_REL = 0.6         # 이 이상이면 "상위권과 비슷한 점수"
+MMR_MIN_K = 8
+_BRANCH_SUFFIX = re.compile(r"\s+\S+점$")
+
+
+def name_bigrams(name: str) -> set:
+    s = re.sub(r"\s+", "", name or "")
+    return {s[i:i + 2] for i in range(len(s) - 1)} or {s}
+
+
+def place_similarity(a: Place, b: Place, fa: dict, fb: dict) -> float:
+    # 같은 체인 지점 / 같은 카테고리 잎 / 같은 건물이면 1에 가깝게
+    if fa["brand"] and fa["brand"] == fb["brand"]:
+        return 1.0
+    name = len(fa["bigrams"] & fb["bigrams"]) / max(1, len(fa["bigrams"] | fb["bigrams"]))
+
+    depth = max(len(a.cat_path), len(b.cat_path)) or 1
+    shared = 0
+    for ca, cb in zip(a.cat_path, b.cat_path):
+        if ca != cb:
+            break
+        shared += 1
+    cat = shared / depth
+
+    loc = 0.0
+    if a.has_coords and b.has_coords:
+        loc = math.exp(-haversine_m(a.x, a.y, b.x, b.y) / MMR_NEAR_M)
+    return max(name, 0.6 * cat + 0.4 * loc)
+
+
+def select_candidates(places: list, center: dict | None, conditions: dict, limit: int = 20) -> list:
+    # 상위 점수가 촘촘할수록 더 많이(LLM이 고를 여지), 확실한 1등들이 있으면 적게
+    if len(places) <= MMR_MIN_K:
+        return list(places)
+    scored = score_places(places, center, conditions)
+    best = min(s for s, _, _ in scored)
+    rel = {id(p): math.exp(-(s - best) / MMR_SCORE_SCALE_M) for s, _, p in scored}
+    close = sum(1 for v in rel.values() if v >= MMR_CLOSE_REL)
+    k = min(limit, len(places), max(MMR_MIN_K, round(close * 1.5)))
+
+    feats = {id(p): {"brand": _BRANCH_SUFFIX.sub("", p.name) if _BRANCH_SUFFIX.search(p.name) else "",
+                     "bigrams": name_bigrams(p.name)} for p in places}
+    remaining = list(places)
+    max_sim = {id(p): 0.0 for p in places}
+    chosen = []
+    while remaining and len(chosen) < k:
+        pick = max(remaining, key=lambda p: MMR_LAMBDA * rel[id(p)] - (1 - MMR_LAMBDA) * max_sim[id(p)])
+        remaining.remove(pick)
+        chosen.append(pick)
+        for p in remaining:
+            sim = place_similarity(pick, p, feats[id(pick)], feats[id(p)])
+            if sim > max_sim[id(p)]:
+                max_sim[id(p)] = sim
+    return chosen
+
+
+# -----------------------------
+# Course planner (술 중심 1차·2차: 후보 풀 안에서 걸어서 이어지는 코스 조합)
+# -----------------------------
+COURSE_PLAN = "1차·2차 나눌 수도"
+COURSE_TOP_K = 3
+COURSE_MAX_PER_ROLE = 80        # 역할별 점수 상위 N만 행렬에 (수백 후보여도 N×N 이하)
+COURSE_LEG_WEIGHT = 1.5         # 1차→2차 이동 거리는 센터 거리보다 더 체감
+COURSE_SECOND_WEIGHT = 0.5
+COURSE_WALK_M_PER_MIN = 80.0
+COURSE_SECOND_CATS = ["술집", "주점", "호프", "이자카야", "와인", "칵테일", "포차", "펍", "막걸리", "전통주",
+                      "카페", "디저트", "베이커리", "아이스크림"]
+COURSE_CAFE_CATS = ["카페", "디저트", "베이커리", "아이스크림"]
+
+
+def is_course_mode(conditions: dict) -> bool:
+    return conditions["meta"]["common"].get("alcohol_plan") == COURSE_PLAN
+
+
+def is_first_stop(p: Place) -> bool:
+    # 1차 = 식사 or 술 (카페류 제외)
+    return not any(b in c for c in p.cat_path for b in COURSE_CAFE_CATS)
+
+
+def is_second_stop(p: Place) -> bool:
+    # 2차 = 술 or 카페
+    return any(a in c for c in p.cat_path for a in COURSE_SECOND_CATS)
+
+
+def plan_courses(places: list, center: dict | None, conditions: dict, k: int = COURSE_TOP_K) -> list:
+    walk_limit = conditions["meta"]["common"].get("walk_limit_min") or WALK_LIMIT_DEFAULT_MIN
+    scored = [(s, p) for s, _, p in score_places(places, center, conditions) if p.has_coords]
+    scored.sort(key=lambda x: x[0])
+    firsts = [(s, p) for s, p in scored if is_first_stop(p)][:COURSE_MAX_PER_ROLE]
+    seconds = [(s, p) for s, p in scored if is_second_stop(p)][:COURSE_MAX_PER_ROLE]
+    if not firsts or not seconds:
+        return []
+
+    s1 = np.array([s for s, _ in firsts], dtype=float)
+    s2 = np.array([s for s, _ in seconds], dtype=float)
+    # 센터 없으면 점수가 전부 1e12 근처 → 상대값만 쓰도록 기준을 빼둠
+    base = min(s1.min(), s2.min())
+    leg = pairwise_haversine_m([p.x for _, p in firsts], [p.y for _, p in firsts],
+                               [p.x for _, p in seconds], [p.y for _, p in seconds])
+    total = (s1 - base)[:, None] + COURSE_SECOND_WEIGHT * (s2 - base)[None, :] + COURSE_LEG_WEIGHT * leg
+    same = np.array([p.id for _, p in firsts], dtype=object)[:, None] == np.array([p.id for _, p in seconds], dtype=object)[None, :]
+    total[(leg > walk_limit * COURSE_WALK_M_PER_MIN) | same] = np.inf
+
+    # 좋은 조합부터, 한 가게는 코스 하나에만
+    courses, used = [], set()
+    for flat in np.argsort(total, axis=None):
+        i, j = divmod(int(flat), total.shape[1])
+        if not np.isfinite(total[i, j]):
+            break
+        a, b = firsts[i][1], seconds[j][1]
+        if a.id in used or b.id in used:
+            continue
+        used.update((a.id, b.id))
+        courses.append({"first": a, "second": b, "leg_min": estimate_walk_minutes(float(leg[i, j])),
+                        "score": float(total[i, j])})
+        if len(courses) >= k:
+            break
+    return courses
+
+
+# -----------------------------
+# Adaptive search planner (영역 셀 × 쿼리 모양별 통과율로 pages/radius 결정)
+# -----------------------------
+PLAN_NEED = 8              # collect_candidates 목표 생존 후보 수
+PLAN_MARGIN = 1.25
+PLAN_CELL_DEG = 0.01       # 약 1km 격자
+PLAN_MAX_PAGES = 4
+PLAN_MIN_OBS = 2           # 이 이상 관측된 단계만 통계로 판단
+PLAN_PAGE_SIZE = 15
+
+
+def area_cell(center: dict) -> str:
+    return f"{round(float(center['y']) / PLAN_CELL_DEG)}:{round(float(center['x']) / PLAN_CELL_DEG)}"
+
+
+def query_shape(conditions: dict) -> str:
+    # 지역을 뺀 검색어 + 통과율에 영향을 주는 필터 플래그
+    loc = (conditions.get("location") or "").strip()
+    q = build_query(conditions)
+    if loc and q.startswith(loc):
+        q = q[len(loc):].strip()
+    m = conditions["meta"]
+    dating_strict = m.get("mode") == "연인 · 썸 · 소개팅" and (m["common"].get("sensitivity") or 0) >= 3
+    shape = [q, m.get("place_type"), bool(conditions["constraints"].get("avoid_franchise")), dating_strict]
+    if m.get("search_mode") == "category":
+        # 카테고리 검색은 통과율이 달라서 따로 집계 (검색어 대신 그룹 코드 + 구체 토큰 + 음식 분류)
+        shape[0] = [category_group(conditions), category_keyword(conditions), m.get("food_class")]
+    return json.dumps(shape, ensure_ascii=False)
+
+
+def plan_stats_key(center: dict, conditions: dict) -> str:
+    return store_key("plan", f"n:{area_cell(center)}:{hash_key(query_shape(conditions))[:16]}")
+
+
+def load_search_stats(center: dict, conditions: dict) -> dict:
+    # 카운터 "<relax>:<항목>" → {relax: {항목: 값}}
+    stats = {}
+    for field, value in store.get_counts(plan_stats_key(center, conditions)).items():
+        level, _, name = field.partition(":")
+        stats.setdefault(level, {"obs": 0, "pages": 0, "returned": 0, "survived": 0, "exhausted": 0})[name] = value
+    return stats
+
+
+def record_search_stats(center: dict | None, conditions: dict, relax: int, pages: int, places: list):
+    # pages = 실제로 요청한 페이지 수 (카테고리 검색은 CATEGORY_MAX_PAGES로 잘린 값)
+    # 워머가 다시 보낸 검색은 실제 트래픽이 아니라서 통계에 안 넣음
+    if not center or relax >= 3 or search_log.is_warm_thread():
+        return
+    counts = {
+        "obs": 1,
+        "pages": pages,
+        "returned": len(places),
+        "survived": len(strict_survivors(places, conditions)),
+        # 요청한 페이지를 다 못 채웠으면 이 반경의 결과를 다 긁은 것
+        "exhausted": int(len(places) < pages * PLAN_PAGE_SIZE),
+    }
+    store.incr_counts(plan_stats_key(center, conditions), {f"{relax}:{k}": v for k, v in counts.items()},
+                      STORE_TTL["plan"])
+
+
+def plan_search(center: dict | None, conditions: dict, relax: int, need: int = PLAN_NEED) -> tuple[int, int, int | None]:
+    # 반환: (relax 단계, pages, radius). 통계 없으면 기존 relax_plan 그대로
+    if not center or relax >= 3:
+        return (relax, *relax_plan(relax))
+    stats = load_search_stats(center, conditions)
+    target = need * PLAN_MARGIN
+
+    for level in range(relax, 3):
+        lv = stats.get(str(level))
+        if not lv or lv["obs"] < PLAN_MIN_OBS:
+            return (level, *relax_plan(level))
+        radius = relax_plan(level)[1]
+        # 대부분 소진됐는데 평균 생존이 목표 미만 → 희소 지역, 바로 다음(넓은) 반경
+        if lv["exhausted"] * 2 >= lv["obs"] and lv["survived"] / lv["obs"] < need:
+            continue
+        per_page = lv["survived"] / max(1, lv["pages"])
+        if per_page * PLAN_MAX_PAGES < target:
+            continue
+        # 밀집 지역이면 1페이지로 끝
+        return (level, max(1, min(PLAN_MAX_PAGES, math.ceil(target / per_page))), radius)
+
+    return (2, *relax_plan(2))
+
+
+# -----------------------------
+# Candidate pool (세션 보관 + "다른 데" 페이지네이션)
+# -----------------------------
+# 풀 무효화 판단에서 빼는 값들 (대화 진행/검색 내부 상태라 조건 변화가 아님)
+POOL_SIG_IGNORE_META = {"pending_question", "fast_mode", "skip_questions_once", "questions_asked", "question_cap",
+                        "usual", "prefilled", "compare"}
+POOL_SIG_IGNORE_COMMON = {"search_relax", "center", "origin_points"}
+
+
+def conditions_signature(conditions: dict) -> str:
+    m = conditions["meta"]
+    meta = {k: v for k, v in m.items() if k not in POOL_SIG_IGNORE_META and k != "common"}
+    common = {k: v for k, v in m["common"].items() if k not in POOL_SIG_IGNORE_COMMON}
+    sig = {
+        "location": conditions.get("location"),
+        "constraints": conditions.get("constraints"),
+        "meta": meta,
+        "common": common,
+    }
+    return json.dumps(sig, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def collect_candidates(conditions: dict, rest_key: str, exclude_ids: list | None = None,
+                       loc_cache: dict | None = None):
+    # 후보 파이프라인 + 완화 단계. 반환 풀은 제외 처리 전 전체 랭킹.
+    cm = conditions["meta"]["common"]
+    relax_guard = 0
+    places = []
+    center = None
+    used_query = build_query(conditions)
+
+    while relax_guard < 4:
+        places, center, used_query = get_candidate_pool(conditions, rest_key, loc_cache)
+        # 도보 분/상세 조회는 prefetch 풀에서 → 스크립트 스레드는 상한까지만 기다림 (늦으면 이번 정렬은 직선거리)
+        prefetch = get_prefetch_pool().submit(prefetch_scoring_inputs, center, places, not cm.get("origin_points"))
+        if not wait([prefetch], timeout=TRAVEL_PREFETCH_WAIT_S).done:
+            travel.status["prefetch_timeouts"] = travel.status.get("prefetch_timeouts", 0) + 1
+        places = refine_places(places, center, conditions)
+
+        if len(filter_exclude_last(places, exclude_ids or [])) >= 8:
+            break
+
+        # not enough -> relax up
+        cm["search_relax"] = min(3, int(cm.get("search_relax", 0)) + 1)
+        relax_guard += 1
+
+    return places, center, used_query
+
+
+def make_pool(conditions: dict, places: list, center: dict | None, query: str) -> dict:
+    return {
+        "sig": conditions_signature(conditions),
+        "places": places,
+        "center": center,
+        "query": query,
+    }
+
+
+def pool_unseen(pool: dict | None, conditions: dict, seen_ids: list):
+    # 조건이 그대로고 안 보여준 후보가 3개 이상 남았을 때만 재사용
+    if not pool or pool.get("sig") != conditions_signature(conditions):
+        return None
+    seen = set(seen_ids)
+    unseen = [p for p in pool["places"] if p.id not in seen]
+    return unseen if len(unseen) >= 3 else None
+
+
 # -----------------------------
 # Questions (공통 + 모드별)
 # -----------------------------
@@ -685,46 +2864,69 @@ MODE_QUESTIONS = {
     "가족": [{"key": "family_member", "text": "가족 구성에 **아이/어른(연세)** 있어? (아이 있음/어른 있음/둘 다/없음)"}],
 }
 
-def next_common_question(conditions: dict):
+def next_required_question(conditions: dict):
     cm = conditions["meta"]["common"]
-    m = conditions["meta"]
 
     if not conditions.get("location"):
-        return {"scope": "common", "key": "location", "text": "오케이! **어느 동네/역 근처**에서 찾을까? 📍"}
+        return {"scope": "common", "key": "location", "text": "오케이! **어느 동네/역 근처**에서 찾을까? 📍\n(다들 따로 오면 `홍대, 강남, 잠실`처럼 쉼표로!)"}
 
     if not cm.get("cannot_eat_done"):
         return {"scope": "common", "key": "cannot_eat", "text": "못 먹는 거 있어? (알레르기/극혐 포함) 없으면 **없음** 🙅"}
 
-    # fast mode면 더 안 묻고 바로 추천
-    if m.get("fast_mode"):
-        return None
+    return None
+
+
+def pending_common_questions(conditions: dict) -> list:
+    # 아직 안 채운 공통 질문 전부 (기본 질문 순서 유지)
+    cm = conditions["meta"]["common"]
+    m = conditions["meta"]
+    out = []
 
     if cm.get("alcohol_level") is None:
         # place_type이 카페면 술 질문을 뒤로 미루되, 사용자가 술을 말하면 자동 반영됨
         if m.get("place_type") == "카페":
             cm["alcohol_level"] = "없음"
         else:
-            return {"scope": "common", "key": "alcohol_level", "text": "오늘 술은 어때? (안 마셔/한잔/술 중심)"}
+            out.append({"scope": "common", "key": "alcohol_level", "text": "오늘 술은 어때? (안 마셔/한잔/술 중심)"})
 
     if cm.get("transport") is None:
-        return {"scope": "common", "key": "transport", "text": "이동수단은? (뚜벅/지하철/택시 vs 차/주차)"}
+        out.append({"scope": "common", "key": "transport", "text": "이동수단은? (뚜벅/지하철/택시 vs 차/주차)"})
 
     if cm.get("walk_limit_min") is None:
-        return {"scope": "common", "key": "walk_limit_min", "text": "도보는 최대 몇 분까지 괜찮아? (10분/15분/상관없음)"}
+        out.append({"scope": "common", "key": "walk_limit_min", "text": "도보는 최대 몇 분까지 괜찮아? (10분/15분/상관없음)"})
 
     if cm.get("sensitivity") is None:
-        return {"scope": "common", "key": "sensitivity", "text": "이 자리는 얼마나 신경 써야 해? (1 대충~ 4 중요한 자리)"}
+        out.append({"scope": "common", "key": "sensitivity", "text": "이 자리는 얼마나 신경 써야 해? (1 대충~ 4 중요한 자리)"})
 
     if cm.get("focus") is None:
-        return {"scope": "common", "key": "focus", "text": "오늘은 **대화**가 더 중요해? **음식**이 더 중요해? (대화/음식/균형)"}
+        out.append({"scope": "common", "key": "focus", "text": "오늘은 **대화**가 더 중요해? **음식**이 더 중요해? (대화/음식/균형)"})
 
     if cm.get("alcohol_level") == "술 중심" and cm.get("alcohol_plan") is None:
-        return {"scope": "common", "key": "alcohol_plan", "text": "술 중심이면 흐름은? (한 곳/1차2차 나눔/모르겠음)"}
+        out.append({"scope": "common", "key": "alcohol_plan", "text": "술 중심이면 흐름은? (한 곳/1차2차 나눔/모르겠음)"})
 
     if cm.get("alcohol_level") == "술 중심" and cm.get("alcohol_type") is None:
-        return {"scope": "common", "key": "alcohol_type", "text": "주로 뭐 마실 생각이야? (소주/맥주/와인/상관없음)"}
+        # 프로필에 평소 주종이 있으면 묻지 않고 채움
+        usual = (m.get("usual") or {}).get("alcohol_type")
+        if usual:
+            cm["alcohol_type"] = usual
+            m.setdefault("prefilled", []).append("alcohol_type")
+        else:
+            out.append({"scope": "common", "key": "alcohol_type", "text": "주로 뭐 마실 생각이야? (소주/맥주/와인/상관없음)"})
 
-    return None
+    return out
+
+
+def next_common_question(conditions: dict):
+    q = next_required_question(conditions)
+    if q:
+        return q
+
+    # fast mode면 더 안 묻고 바로 추천
+    if conditions["meta"].get("fast_mode"):
+        return None
+
+    pending = pending_common_questions(conditions)
+    return pending[0] if pending else None
 
 
 def next_mode_question(conditions: dict):
@@ -739,7 +2941,20 @@ def next_mode_question(conditions: dict):
     return None
 
 
-def get_next_question(conditions: dict):
+def get_next_question(conditions: dict, qpool: tuple | None = None):
+    # qpool(미리 받은 후보 풀)이 있으면 질문 플래너, 없으면 기본 순서
+    m = conditions["meta"]
+    cap = m.get("question_cap")
+    if cap is not None and m.get("questions_asked", 0) >= cap:
+        # 프로필로 채운 재방문 세션: 선택 질문은 상한까지만
+        return next_required_question(conditions)
+
+    if qpool is not None:
+        q = next_required_question(conditions)
+        if q or conditions["meta"].get("fast_mode"):
+            return q
+        return plan_next_question(conditions, *qpool)
+
     q = next_common_question(conditions)
     if q:
         return q
@@ -747,22 +2962,157 @@ def get_next_question(conditions: dict):
 
 
 # -----------------------------
-# Apply answer (pending 질문 + 자동 채움)
+# Question planner (미리 받은 후보 풀 기준, 순위를 바꿀 질문만 영향 큰 순서로)
 # -----------------------------
-def apply_answer(conditions: dict, pending: dict | None, user_text: str) -> bool:
-    m = conditions["meta"]
-    cm = m["common"]
-    answers = m.get("answers", {})
+# 모드별 선택 질문 턴 상한 (위치/못 먹는 것 제외)
+# DECISION_MATE_QUESTION_CAPS='{"혼밥": 0, "친구": 1}' → 모드별로 덮어씀 (목록에 없는 모드는 QUESTION_TURN_CAP_DEFAULT)
+QUESTION_TURN_CAPS_DEFAULT = {
+    "선택 안 함": 3,
+    "회사 회식": 3,
+    "친구": 2,
+    "단체 모임": 2,
+    "연인 · 썸 · 소개팅": 4,
+    "혼밥": 1,
+    "가족": 3,
+}
+QUESTION_TURN_CAP_DEFAULT = 3
 
-    if detect_fast(user_text):
-        m["fast_mode"] = True
-        return True
 
-    # 자동 채움(비어있을 때만)
-    def fill_extras():
-        if cm.get("alcohol_level") is None:
-            v = parse_alcohol_level(user_text)
-            if v:
+def load_question_caps(raw: str | None) -> dict:
+    # 잘못된 JSON/값은 무시하고 기본값 유지
+    caps = dict(QUESTION_TURN_CAPS_DEFAULT)
+    try:
+        over = json.loads(raw) if raw else {}
+    except ValueError:
+        over = {}
+    if isinstance(over, dict):
+        caps.update({k: v for k, v in over.items() if type(v) is int and v >= 0})
+    return caps
+
+
+QUESTION_TURN_CAPS = load_question_caps(os.environ.get("DECISION_MATE_QUESTION_CAPS"))
+QPLAN_MIN_IMPACT = 0.25    # 이 미만이면 물어봐도 top3가 안 바뀐다고 보고 생략
+QPLAN_TOP_K = 3
+
+# 가상 답변 (검색어 변화 + 로컬 재정렬로 영향 측정)
+QUESTION_SLOT_VALUES = {
+    "alcohol_level": ["없음", "가볍게", "술 중심"],
+    "transport": ["차", "대중교통", "상관없음"],
+    "walk_limit_min": [10, 15, 30],
+    "sensitivity": [1, 2, 3, 4],
+    "focus": ["대화 중심", "음식 중심", "균형"],
+    "alcohol_plan": ["한 곳", "1차·2차 나눌 수도", "모르겠음"],
+    "alcohol_type": ["소주", "맥주", "와인", "상관없음"],
+}
+
+# 측정이 안 되는 영향 (rerank 프롬프트에만 들어가는 값). 검색어에 들어가는 값(술/분위기/주종)은
+# question_impact가 검색어 변화로 직접 재니까 여기 안 둠. 전부 QPLAN_MIN_IMPACT 미만이라
+# 측정된 영향 없이 사전값만으로는 안 물어봄
+# 모드별 질문(MODE_QUESTIONS) 답은 검색어·점수·프롬프트 어디에도 안 들어가서 플래너 후보가 아님
+# (플래너 없이 도는 기본 순서에서만 물어봄)
+QUESTION_PRIOR_IMPACT = {
+    "sensitivity": 0.2,
+    "alcohol_plan": 0.2,
+    "transport": 0.1,
+    "walk_limit_min": 0.0,
+}
+# 모드별 사전 영향 보정 (rerank 규칙이 민감도를 직접 쓰는 모드)
+QUESTION_MODE_PRIOR = {
+    "연인 · 썸 · 소개팅": {"sensitivity": 0.4},
+    "회사 회식": {"sensitivity": 0.3},
+}
+
+
+def with_answer(conditions: dict, q: dict, value) -> dict:
+    hyp = copy.deepcopy(conditions)
+    hyp["meta"]["common"][q["key"]] = value
+    return hyp
+
+
+def top_ids(pool: list, center: dict | None, conditions: dict, k: int = QPLAN_TOP_K) -> list:
+    return [p.id for p in refine_places(pool, center, conditions)[:k]]
+
+
+def query_tokens(conditions: dict) -> set:
+    return set(build_query(conditions).split())
+
+
+def question_impact(q: dict, pool: list, center: dict | None, conditions: dict) -> float:
+    # 가능한 답변별 top-k 교체 비율 평균 + 사전 영향 (공통 질문만)
+    # 답 때문에 검색어가 바뀌면 추천 때 다른 풀을 받아오니 지금 풀로는 못 잼 → top-k 전부 바뀐다고 봄
+    local = 0.0
+    values = QUESTION_SLOT_VALUES.get(q["key"], [])
+    if values and pool:
+        base = set(top_ids(pool, center, conditions))
+        base_query = query_tokens(conditions)
+        changed = []
+        for v in values:
+            hyp = with_answer(conditions, q, v)
+            if query_tokens(hyp) != base_query:
+                changed.append(1.0)
+            else:
+                changed.append(1 - len(base & set(top_ids(pool, center, hyp))) / max(1, len(base)))
+        local = sum(changed) / len(changed)
+    slot = q["key"]
+    prior = QUESTION_MODE_PRIOR.get(conditions["meta"].get("mode"), {}).get(slot, QUESTION_PRIOR_IMPACT.get(slot, 0.0))
+    return local + prior
+
+
+def plan_next_question(conditions: dict, pool: list, center: dict | None):
+    m = conditions["meta"]
+    cap = QUESTION_TURN_CAPS.get(m.get("mode"), QUESTION_TURN_CAP_DEFAULT)
+    if m.get("questions_asked", 0) >= cap:
+        return None
+
+    best, best_impact = None, 0.0
+    for q in pending_common_questions(conditions):
+        impact = question_impact(q, pool, center, conditions)
+        if impact >= QPLAN_MIN_IMPACT and impact > best_impact:
+            best, best_impact = q, impact
+    return best
+
+
+def prefetch_question_pool(conditions: dict, rest_key: str):
+    # 질문 턴에서 현재 검색어 기준 후보 풀을 받아둠 (같은 검색어면 세션/공유 캐시 재사용)
+    key = json.dumps([conditions.get("location"), build_query(conditions)], ensure_ascii=False)
+    cached = st.session_state.question_pool
+    if cached and cached["key"] == key:
+        return cached["places"], cached["center"]
+    try:
+        places, center, _ = get_candidate_pool(copy.deepcopy(conditions), rest_key)
+    except Exception:
+        return None
+    st.session_state.question_pool = {"key": key, "places": places, "center": center}
+    return places, center
+
+
+# -----------------------------
+# Apply answer (pending 질문 + 자동 채움)
+# -----------------------------
+CLOSER_STEP_MIN = 5
+
+
+def apply_answer(conditions: dict, pending: dict | None, user_text: str) -> bool:
+    m = conditions["meta"]
+    cm = m["common"]
+    answers = m.get("answers", {})
+
+    if detect_fast(user_text):
+        m["fast_mode"] = True
+        return True
+
+    # "좀 더 가까운 데" → 도보 한도만 줄이고 이번 턴은 바로 추천 (검색 조건은 그대로라 풀 재사용)
+    if detect_closer(user_text):
+        cm["walk_limit_min"] = max(5, (cm.get("walk_limit_min") or WALK_LIMIT_DEFAULT_MIN) - CLOSER_STEP_MIN)
+        cm["walk_limit_src"] = "closer"
+        m["skip_questions_once"] = True
+        return True
+
+    # 자동 채움(비어있을 때만)
+    def fill_extras():
+        if cm.get("alcohol_level") is None:
+            v = parse_alcohol_level(user_text)
+            if v:
                 cm["alcohol_level"] = v
                 if v == "없음":
                     cm["alcohol_plan"] = None
@@ -775,6 +3125,7 @@ def apply_answer(conditions: dict, pending: dict | None, user_text: str) -> bool
             v = parse_minutes(user_text)
             if v:
                 cm["walk_limit_min"] = max(5, min(60, v))
+                cm["walk_limit_src"] = "answer"
         if cm.get("sensitivity") is None:
             v = parse_sensitivity(user_text)
             if v:
@@ -803,7 +3154,17 @@ def apply_answer(conditions: dict, pending: dict | None, user_text: str) -> bool
     tc = nc(user_text)
 
     if scope == "common" and key == "location":
-        conditions["location"] = user_text.strip()
+        usual = (m.get("usual") or {}).get("location")
+        if usual and is_usual_answer(user_text):
+            conditions["origins"] = []
+            conditions["location"] = usual
+            fill_extras()
+            return True
+        conditions["origins"] = parse_origins(user_text)
+        if conditions["origins"]:
+            conditions["location"] = " · ".join(o["name"] for o in conditions["origins"])
+        else:
+            conditions["location"] = user_text.strip()
         fill_extras()
         return True
 
@@ -853,12 +3214,14 @@ def apply_answer(conditions: dict, pending: dict | None, user_text: str) -> bool
     if scope == "common" and key == "walk_limit_min":
         if contains_any(tc, ["상관없", "아무", "무관"]):
             cm["walk_limit_min"] = 30
+            cm["walk_limit_src"] = "answer"
             fill_extras()
             return True
         v = parse_minutes(user_text)
         if not v:
             return False
         cm["walk_limit_min"] = max(5, min(60, v))
+        cm["walk_limit_src"] = "answer"
         fill_extras()
         return True
 
@@ -907,6 +3270,301 @@ def apply_answer(conditions: dict, pending: dict | None, user_text: str) -> bool
     return True
 
 
+# -----------------------------
+# LLM metering (호출별 토큰/지연 → 세션·일·전체 집계 + 예산 단계)
+# -----------------------------
+# 모델별 1K 토큰 단가 USD (prompt, completion)
+LLM_PRICE_PER_1K = {"gpt-4o-mini": (0.00015, 0.0006), "gpt-4o": (0.0025, 0.01)}
+LLM_BUDGET_SESSION_TOKENS = int(os.environ.get("DECISION_MATE_SESSION_TOKENS", "60000"))
+LLM_BUDGET_DAY_TOKENS = int(os.environ.get("DECISION_MATE_DAY_TOKENS", "5000000"))
+LLM_BUDGET_DAY_USD = float(os.environ.get("DECISION_MATE_DAY_USD", "5.0"))
+# 예산 사용률이 넘을 때마다 한 단계씩: 멘트 LLM 생략 → rerank 후보 축소 → LLM 없이 로컬 순위
+LLM_BUDGET_STEPS = (0.7, 0.85, 1.0)
+# 단계별 rerank 후보 수 (0 = rerank LLM 안 씀)
+LLM_RERANK_LIMITS = (20, 20, 10, 0)
+LLM_METER_SESSIONS_MAX = 5000
+LLM_RECENT_MAX = 50
+
+
+class LLMMeter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.day = time.strftime("%Y-%m-%d")
+        self.total = self._bucket()
+        self.today = self._bucket()
+        self.sessions = BoundedDict(LLM_METER_SESSIONS_MAX)
+        self.recent = []
+        self.policy = Counter()     # "tier:outcome" → 횟수 (요청 정책 결과)
+        self.policy_latency = {}    # tier → 누적 지연(초)
+
+    @staticmethod
+    def _bucket() -> dict:
+        return {"calls": 0, "prompt": 0, "completion": 0, "usd": 0.0, "latency_s": 0.0}
+
+    def _roll_day(self):
+        day = time.strftime("%Y-%m-%d")
+        if day != self.day:
+            self.day = day
+            self.today = self._bucket()
+            self.sessions.clear()
+
+    def record(self, session: str | None, kind: str, model: str, usage, latency_s: float):
+        prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+        completion = int(getattr(usage, "completion_tokens", 0) or 0)
+        p_price, c_price = LLM_PRICE_PER_1K.get(model, (0.0, 0.0))
+        usd = prompt / 1000 * p_price + completion / 1000 * c_price
+
+        with self._lock:
+            self._roll_day()
+            buckets = [self.total, self.today]
+            if session:
+                if session not in self.sessions:
+                    self.sessions[session] = self._bucket()
+                buckets.append(self.sessions[session])
+            for b in buckets:
+                b["calls"] += 1
+                b["prompt"] += prompt
+                b["completion"] += completion
+                b["usd"] += usd
+                b["latency_s"] += latency_s
+            self.recent.append({"session": session, "kind": kind, "model": model, "prompt": prompt,
+                                "completion": completion, "latency_s": round(latency_s, 3)})
+            del self.recent[:-LLM_RECENT_MAX]
+
+    def record_policy(self, session: str | None, kind: str, tier: str, model: str | None, outcome: str,
+                      latency_s: float):
+        with self._lock:
+            self.policy[f"{tier}:{outcome}"] += 1
+            self.policy_latency[tier] = self.policy_latency.get(tier, 0.0) + latency_s
+            self.recent.append({"session": session, "kind": f"{kind}:policy", "model": model, "tier": tier,
+                                "outcome": outcome, "latency_s": round(latency_s, 3)})
+            del self.recent[:-LLM_RECENT_MAX]
+
+    def policy_status(self) -> dict:
+        with self._lock:
+            return dict(self.policy)
+
+    def usage(self, session: str | None = None) -> dict:
+        with self._lock:
+            self._roll_day()
+            s = self.sessions.get(session) if session else None
+            return {"session": dict(s or self._bucket()), "today": dict(self.today), "total": dict(self.total)}
+
+    def budget_level(self, session: str | None = None) -> int:
+        u = self.usage(session)
+        s, d = u["session"], u["today"]
+        ratio = max(
+            (s["prompt"] + s["completion"]) / LLM_BUDGET_SESSION_TOKENS,
+            (d["prompt"] + d["completion"]) / LLM_BUDGET_DAY_TOKENS,
+            d["usd"] / LLM_BUDGET_DAY_USD,
+        )
+        return sum(ratio >= step for step in LLM_BUDGET_STEPS)
+
+
+@st.cache_resource
+def get_llm_meter() -> LLMMeter:
+    return LLMMeter()
+
+
+meter = get_llm_meter()
+
+
+def llm_chat(llm, session: str | None, kind: str, **kwargs) -> str:
+    t0 = time.perf_counter()
+    res = call_guarded("openai", llm.chat.completions.create, **kwargs)
+    meter.record(session, kind, kwargs.get("model"), getattr(res, "usage", None), time.perf_counter() - t0)
+    return (res.choices[0].message.content or "").strip()
+
+
+async def allm_chat(llm, session: str | None, kind: str, **kwargs) -> str:
+    t0 = time.perf_counter()
+    res = await acall_guarded("openai", llm.chat.completions.create, **kwargs)
+    meter.record(session, kind, kwargs.get("model"), getattr(res, "usage", None), time.perf_counter() - t0)
+    return (res.choices[0].message.content or "").strip()
+
+
+def stream_piece(chunk) -> str:
+    return (chunk.choices[0].delta.content or "") if chunk.choices else ""
+
+
+def llm_stream(llm, session: str | None, kind: str, on_text, **kwargs) -> str:
+    # stream=True: 조각 올 때마다 on_text(누적 원문). 사용량은 마지막 청크(include_usage)로 집계
+    t0 = time.perf_counter()
+
+    def consume():
+        buf, usage = "", None
+        for chunk in llm.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs):
+            usage = getattr(chunk, "usage", None) or usage
+            piece = stream_piece(chunk)
+            if piece:
+                buf += piece
+                on_text(buf)
+        return buf, usage
+
+    text, usage = call_guarded("openai", consume)
+    meter.record(session, kind, kwargs.get("model"), usage, time.perf_counter() - t0)
+    return text.strip()
+
+
+async def allm_stream(llm, session: str | None, kind: str, on_text, **kwargs) -> str:
+    t0 = time.perf_counter()
+
+    async def consume():
+        buf, usage = "", None
+        stream = await llm.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            piece = stream_piece(chunk)
+            if piece:
+                buf += piece
+                on_text(buf)
+        return buf, usage
+
+    text, usage = await acall_guarded("openai", consume)
+    meter.record(session, kind, kwargs.get("model"), usage, time.perf_counter() - t0)
+    return text.strip()
+
+
+# -----------------------------
+# LLM request policy (rerank: 난이도별 모델 티어 + 지연 헤지 + 호출별 엄격 타임아웃)
+# -----------------------------
+LLM_MODEL_FAST = os.environ.get("DECISION_MATE_LLM_FAST", "gpt-4o-mini")
+LLM_MODEL_STRONG = os.environ.get("DECISION_MATE_LLM_STRONG", "gpt-4o")
+LLM_TIMEOUT_S = float(os.environ.get("DECISION_MATE_LLM_TIMEOUT", "8"))
+# 첫 요청이 이 시간 안에 안 오면 같은 요청을 하나 더 보내고 먼저 온 걸 씀 (0 = 헤지 안 함)
+LLM_HEDGE_AFTER_S = float(os.environ.get("DECISION_MATE_LLM_HEDGE", "2.5"))
+LLM_HEDGE_WORKERS = 16
+TIER_CLEAR_GAP_M = 300        # 3위와 4위 점수 차가 이 이상이면 순위가 뻔한 경우 (점수 = 거리 척도 m)
+TIER_STRONG_MODES = {"연인 · 썸 · 소개팅", "회사 회식"}
+
+
+def choose_rerank_policy(conditions: dict, cands: list, center: dict | None, budget_level: int = 0) -> dict:
+    # local: LLM 없이 후보 순위 그대로 / fast: 싼·빠른 모델 / strong: 신경 쓸 자리(소개팅·회식 + 민감도 3+)
+    m = conditions["meta"]
+    sensitivity = m["common"].get("sensitivity")
+    tier, reason = "fast", "default"
+    if m.get("mode") in TIER_STRONG_MODES and (sensitivity or 0) >= 3:
+        tier, reason = ("strong", "high_stakes") if budget_level < 1 else ("fast", "high_stakes_budget")
+    else:
+        scores = sorted(s for s, _, __ in score_places(cands, center, conditions))
+        clear = len(scores) <= 3 or scores[3] - scores[2] >= TIER_CLEAR_GAP_M
+        # 민감도는 직접 낮다고 답했을 때만 (안 물어본 None을 "상관없음"으로 보지 않음)
+        if clear and (m.get("fast_mode") or (sensitivity is not None and sensitivity <= 1)):
+            tier, reason = "local", "clear_gap"
+    return {
+        "tier": tier,
+        "reason": reason,
+        "model": LLM_MODEL_STRONG if tier == "strong" else LLM_MODEL_FAST,
+        "timeout_s": LLM_TIMEOUT_S,
+        "hedge_s": LLM_HEDGE_AFTER_S,
+    }
+
+
+def default_policy() -> dict:
+    return {"tier": "fast", "reason": "default", "model": LLM_MODEL_FAST,
+            "timeout_s": LLM_TIMEOUT_S, "hedge_s": LLM_HEDGE_AFTER_S}
+
+
+def record_outcome(policy: dict, session: str | None, kind: str, outcome: str, t0: float):
+    # 정책 결과는 policy dict에도 남겨서 추천 결과(디버그)로 올림
+    policy["outcome"] = outcome
+    policy["latency_s"] = round(time.perf_counter() - t0, 3)
+    meter.record_policy(session, kind, policy["tier"], policy.get("model"), outcome, policy["latency_s"])
+
+
+def is_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, (TimeoutError, APITimeoutError))
+
+
+def timed_client(llm, timeout_s: float):
+    # 호출별 엄격 타임아웃 + SDK 자체 재시도 끔 (재시도는 헤지가 대신)
+    return llm.with_options(timeout=timeout_s, max_retries=0) if hasattr(llm, "with_options") else llm
+
+
+@st.cache_resource
+def get_hedge_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="decision-mate-hedge")
+
+
+def hedged_chat(llm, session: str | None, kind: str, policy: dict, **kwargs) -> tuple[str, str]:
+    # 반환 (content, "primary"|"hedge"). 전체 timeout_s 넘기면 TimeoutError
+    # 진 요청은 스레드에서 끝까지 돌고(클라이언트 타임아웃으로 상한) 토큰도 meter에 잡힘
+    client = timed_client(llm, policy["timeout_s"])
+    pool = get_hedge_pool()
+    t0 = time.perf_counter()
+    deadline = t0 + policy["timeout_s"]
+    hedge_at = t0 + policy["hedge_s"] if policy["hedge_s"] else None
+    futs = {pool.submit(llm_chat, client, session, kind, **kwargs): "primary"}
+    pending = set(futs)
+    last_exc = None
+    while pending or hedge_at is not None:
+        until = deadline if hedge_at is None else min(deadline, hedge_at)
+        done, pending = wait(pending, timeout=max(0.0, until - time.perf_counter()), return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                return f.result(), futs[f]
+            last_exc = f.exception()
+        now = time.perf_counter()
+        if hedge_at is not None and (now >= hedge_at or not pending):
+            # 헤지 시점이 됐거나 첫 요청이 먼저 실패 → 한 번 더
+            hedge_at = None
+            f = pool.submit(llm_chat, client, session, f"{kind}:hedge", **kwargs)
+            futs[f] = "hedge"
+            pending.add(f)
+        elif now >= deadline:
+            raise TimeoutError(f"{kind}: no response in {policy['timeout_s']}s")
+    raise last_exc or TimeoutError(kind)
+
+
+async def ahedged_chat(llm, session: str | None, kind: str, policy: dict, **kwargs) -> tuple[str, str]:
+    # 비동기 버전: 진 요청은 취소 (breaker는 abandon 처리)
+    client = timed_client(llm, policy["timeout_s"])
+    t0 = time.perf_counter()
+    deadline = t0 + policy["timeout_s"]
+    hedge_at = t0 + policy["hedge_s"] if policy["hedge_s"] else None
+    tasks = {asyncio.ensure_future(allm_chat(client, session, kind, **kwargs)): "primary"}
+    pending = set(tasks)
+    last_exc = None
+    try:
+        while pending or hedge_at is not None:
+            until = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, until - time.perf_counter()),
+                                               return_when=asyncio.FIRST_COMPLETED) if pending else (set(), set())
+            for t in done:
+                if t.exception() is None:
+                    return t.result(), tasks[t]
+                last_exc = t.exception()
+            now = time.perf_counter()
+            if hedge_at is not None and (now >= hedge_at or not pending):
+                hedge_at = None
+                t = asyncio.ensure_future(allm_chat(client, session, f"{kind}:hedge", **kwargs))
+                tasks[t] = "hedge"
+                pending.add(t)
+            elif now >= deadline:
+                raise TimeoutError(f"{kind}: no response in {policy['timeout_s']}s")
+        raise last_exc or TimeoutError(kind)
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+def local_picks(cands: list, center: dict | None, conditions: dict) -> list:
+    # local 티어: 점수 상위 3곳(= 티어 판단이 본 1~3위)을 카테고리 기반 문구로
+    # (cands는 MMR 순서라 앞 3개가 점수 상위 3곳이 아닐 수 있음)
+    picks = []
+    for p in prioritize_places(cands, center, conditions)[:3]:
+        leaf = p.cat_path[-1] if p.cat_path else "근처"
+        picks.append({
+            "id": p.id,
+            "one_line": f"{leaf} 쪽에서 조건에 제일 잘 맞는 곳 😎",
+            "scene_feel": "링크 눌러서 리뷰/사진 확인하면 감 바로 올 거야.",
+            "hashtags": ["#근처", f"#{leaf.replace(' ', '')}", "#조건우선", "#바로확인"],
+            "matched_conditions": ["근처 우선"],
+            "reason": "거리·분류 점수가 다른 후보보다 확실히 앞서서 바로 골랐어.",
+        })
+    return picks
+
+
 # -----------------------------
 # LLM rerank (안정 JSON)
 # -----------------------------
@@ -924,22 +3582,24 @@ def extract_first_json_object(text: str):
     return safe_json_load(m.group(0))
 
 
-def rerank_and_format(conditions: dict, places: list):
-    if client is None:
-        return []
-
+def build_rerank_prompt(conditions: dict, places: list, limit: int = 20, with_intro: bool = False) -> str:
     m = conditions["meta"]
     cm = m["common"]
 
     compact = []
-    for p in places[:20]:
-        compact.append({
-            "id": p.get("id"),
-            "name": p.get("place_name"),
-            "category": p.get("category_name"),
-            "address": p.get("road_address_name") or p.get("address_name"),
-            "url": p.get("place_url"),
-        })
+    known = details.get_many([p.id for p in places[:limit]])
+    for p in places[:limit]:
+        row = {
+            "id": p.id,
+            "name": p.name,
+            "category": p.category,
+            "address": p.address,
+            "url": p.url,
+        }
+        text = details_text(known.get(p.id))
+        if text:
+            row["details"] = text
+        compact.append(row)
 
     rules = {
         "mode": m.get("mode"),
@@ -958,11 +3618,15 @@ def rerank_and_format(conditions: dict, places: list):
         "avoid_franchise": conditions["constraints"].get("avoid_franchise", False),
     }
 
+    # 한 번에 모드: 시작 멘트(intro)를 맨 앞 필드로 → 스트리밍 중 먼저 보여줌
+    intro_field = '\n  "intro":"친구톤 추천 시작 멘트 1~2문장. 조건 반영. 이모지 1개",' if with_intro else ""
+    intro_rule = "\n- intro를 맨 먼저 쓰고 그다음 picks." if with_intro else ""
+
     prompt = f"""
 너는 '결정 메이트'다. 후보 중 BEST 3곳만 고르고, 왜 이 3곳인지 '사용자 조건 기반'으로만 설명해라.
 
 반드시 아래 JSON 형식만 출력:
-{{
+{{{intro_field}
   "picks":[
     {{
       "id":"...",
@@ -976,11 +3640,11 @@ def rerank_and_format(conditions: dict, places: list):
 }}
 
 중요:
-- picks는 반드시 3개.
+- picks는 반드시 3개.{intro_rule}
 - place_type/food_class를 최대한 지켜라.
 - 술 중심 + 주종 있으면 주종에 맞는 곳 우선.
 - 소개팅/첫/어색 + 민감도(3~4)이면 '과한 옵션(오마카세/파인다이닝 느낌)' 지양.
-- 후보 데이터에 없는 정보(주차 확정/실내간격/가격/예약가능 등) 상상 금지.
+- 후보 데이터에 없는 정보(주차 확정/실내간격/가격/예약가능 등) 상상 금지. details가 있는 후보만 그 안의 영업시간/주차/가격대 언급 가능.
 - hashtags 4~6개.
 - "무조건/최고/완벽" 금지.
 
@@ -990,16 +3654,10 @@ def rerank_and_format(conditions: dict, places: list):
 [후보 목록]
 {json.dumps(compact, ensure_ascii=False, indent=2)}
 """
+    return prompt
 
-    res = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.25,
-        response_format={"type": "json_object"},
-    )
-    raw = (res.choices[0].message.content or "").strip()
-    st.session_state.debug_raw_rerank = raw
 
+def parse_rerank_picks(raw: str) -> list:
     data = safe_json_load(raw) or extract_first_json_object(raw)
     if not isinstance(data, dict):
         return []
@@ -1009,21 +3667,121 @@ def rerank_and_format(conditions: dict, places: list):
     return picks[:3]
 
 
+def rerank_cache_key(prompt: str, model: str = "gpt-4o-mini") -> str:
+    return store_key("rerank", hash_key(model, prompt))
+
+
+def rerank_chat_kwargs(prompt: str, model: str = "gpt-4o-mini") -> dict:
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.25,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def rerank_and_format(conditions: dict, places: list, llm, session: str | None = None, limit: int = 20,
+                      policy: dict | None = None):
+    if llm is None:
+        return [], ""
+    policy = policy or default_policy()
+
+    prompt = build_rerank_prompt(conditions, places, limit)
+    ckey = rerank_cache_key(prompt, policy["model"])
+    t0 = time.perf_counter()
+    raw = store.get_json(ckey)
+    if isinstance(raw, str):
+        record_outcome(policy, session, "rerank", "cache", t0)
+    else:
+        try:
+            raw, outcome = hedged_chat(llm, session, "rerank", policy, **rerank_chat_kwargs(prompt, policy["model"]))
+        except Exception as e:
+            # OpenAI 장애/타임아웃 → 빈 picks (ensure_3_picks가 후보 순서대로 채움)
+            record_outcome(policy, session, "rerank", "timeout" if is_timeout(e) else "error", t0)
+            return [], ""
+        record_outcome(policy, session, "rerank", outcome, t0)
+        store.set_json(ckey, raw, STORE_TTL["rerank"])
+    return parse_rerank_picks(raw), raw
+
+
+# -----------------------------
+# Combined intro + picks (JSON 모드 1회 호출 → 스트리밍 중 intro부터 출력)
+# -----------------------------
+INTRO_FIELD_RE = re.compile(r'"intro"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def extract_intro(text: str) -> str | None:
+    # 덜 온 JSON에서도 intro 문자열이 닫혔으면 꺼냄
+    m = INTRO_FIELD_RE.search(text or "")
+    if not m:
+        return None
+    try:
+        return json.loads(f'"{m.group(1)}"').strip() or None
+    except ValueError:
+        return None
+
+
+def intro_watcher(on_intro):
+    # 스트림 누적 원문을 보다가 intro가 완성되는 순간 1번만 on_intro
+    sent = []
+
+    def on_text(buf: str):
+        if not sent:
+            intro = extract_intro(buf)
+            if intro:
+                sent.append(intro)
+                on_intro(intro)
+
+    return on_text, sent
+
+
+def rerank_with_intro(conditions: dict, places: list, llm, session: str | None = None, limit: int = 20,
+                      on_intro=None, policy: dict | None = None):
+    # 반환 (picks, raw, intro). intro 못 받으면 None → 호출 쪽에서 템플릿 멘트
+    # 스트리밍은 헤지 없이 티어 모델 + 엄격 타임아웃만
+    if llm is None:
+        return [], "", None
+    policy = policy or default_policy()
+    emit = on_intro or (lambda text: None)
+    prompt = build_rerank_prompt(conditions, places, limit, with_intro=True)
+    ckey = rerank_cache_key(prompt, policy["model"])
+    t0 = time.perf_counter()
+    raw = store.get_json(ckey)
+    if isinstance(raw, str):
+        record_outcome(policy, session, "combined", "cache", t0)
+        intro = extract_intro(raw)
+        if intro:
+            emit(intro)
+        return parse_rerank_picks(raw), raw, intro
+
+    on_text, sent = intro_watcher(emit)
+    try:
+        raw = llm_stream(timed_client(llm, policy["timeout_s"]), session, "combined", on_text,
+                         **rerank_chat_kwargs(prompt, policy["model"]))
+    except Exception as e:
+        record_outcome(policy, session, "combined", "timeout" if is_timeout(e) else "error", t0)
+        return [], "", (sent[0] if sent else None)
+    record_outcome(policy, session, "combined", "primary", t0)
+    store.set_json(ckey, raw, STORE_TTL["rerank"])
+    return parse_rerank_picks(raw), raw, (sent[0] if sent else None)
+
+
 def ensure_3_picks(picks: list, candidates: list):
     if not isinstance(picks, list):
         picks = []
 
-    cand_map = {p.get("id"): p for p in candidates if p.get("id")}
+    cand_map = {p.id: p for p in candidates}
     used = set()
     fixed = []
 
     for pk in picks:
         if not isinstance(pk, dict):
             continue
-        pid = pk.get("id")
-        if not pid or pid in used or pid not in cand_map:
+        pid = parse_place_id(pk.get("id"))
+        if pid is None or pid in used or pid not in cand_map:
             continue
         used.add(pid)
+        pk["id"] = pid
         # 안전 필드 보강
         pk.setdefault("one_line", "여기 무난하게 괜찮아 보여 😎")
         pk.setdefault("scene_feel", "카카오맵 사진/리뷰로 분위기 빠르게 확인 가능!")
@@ -1035,8 +3793,8 @@ def ensure_3_picks(picks: list, candidates: list):
     for p in candidates:
         if len(fixed) >= 3:
             break
-        pid = p.get("id")
-        if not pid or pid in used:
+        pid = p.id
+        if pid in used:
             continue
         used.add(pid)
         fixed.append({
@@ -1051,23 +3809,1320 @@ def ensure_3_picks(picks: list, candidates: list):
     return fixed[:3]
 
 
-def generate_pre_text(conditions: dict, query: str):
-    if client is None:
-        return f"오케이ㅋㅋ **{query}**로 바로 3곳 뽑아볼게 🔍"
-    res = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": f"친구처럼 1~2문장으로 추천 시작 멘트. 조건 반영. 이모지 1개.\n검색어: {query}"}],
-        temperature=0.8
+def build_course_prompt(conditions: dict, courses: list) -> str:
+    m = conditions["meta"]
+    cm = m["common"]
+    compact = [{
+        "idx": i + 1,
+        "first": {"name": c["first"].name, "category": c["first"].category},
+        "second": {"name": c["second"].name, "category": c["second"].category},
+        "walk_min": c["leg_min"],
+    } for i, c in enumerate(courses)]
+    rules = {
+        "mode": m.get("mode"),
+        "people_count": m.get("people_count"),
+        "alcohol_type": cm.get("alcohol_type"),
+        "focus": cm.get("focus"),
+        "sensitivity": cm.get("sensitivity"),
+    }
+    return f"""
+너는 '결정 메이트'다. 코스는 이미 정해졌다. 순서/가게를 바꾸지 말고 각 코스를 친구톤으로 설명만 해라.
+
+반드시 아래 JSON 형식만 출력:
+{{
+  "courses":[
+    {{"idx":1, "one_line":"친구톤 한줄", "flow":"1차에서 뭐 하고 2차로 어떻게 넘어가는지 1문장",
+      "hashtags":["#...","#...","#..."], "reason":"사용자 조건 기반 1~2문장"}}
+  ]
+}}
+
+[사용자 조건]
+{json.dumps(rules, ensure_ascii=False)}
+
+[코스]
+{json.dumps(compact, ensure_ascii=False)}
+""".strip()
+
+
+def course_chat_kwargs(prompt: str) -> dict:
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.5,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def fill_course_lines(courses: list, raw: str) -> list:
+    data = safe_json_load(raw) or extract_first_json_object(raw) or {}
+    by_idx = {}
+    for c in data.get("courses", []) if isinstance(data, dict) else []:
+        if isinstance(c, dict):
+            try:
+                by_idx[int(c.get("idx"))] = c
+            except (TypeError, ValueError):
+                continue
+    lines = []
+    for i, c in enumerate(courses):
+        line = by_idx.get(i + 1, {})
+        lines.append({
+            "one_line": line.get("one_line") or "1차 배 채우고 2차로 슬슬 넘어가기 딱 좋아 🍻",
+            "flow": line.get("flow") or f"{c['first'].name}에서 1차 → 걸어서 {c['leg_min']}분 {c['second'].name}로 2차.",
+            "hashtags": line.get("hashtags") or ["#1차2차", "#도보코스", "#근처"],
+            "reason": line.get("reason") or "후보 중에서 가깝게 이어지는 조합이라 골랐어.",
+        })
+    return lines
+
+
+def phrase_courses(conditions: dict, courses: list, llm, session: str | None = None):
+    prompt = build_course_prompt(conditions, courses)
+    ckey = rerank_cache_key(prompt)
+    raw = store.get_json(ckey)
+    if not isinstance(raw, str):
+        raw = ""
+        if llm is not None:
+            try:
+                raw = llm_chat(llm, session, "course", **course_chat_kwargs(prompt))
+                store.set_json(ckey, raw, STORE_TTL["rerank"])
+            except Exception:
+                raw = ""
+    return fill_course_lines(courses, raw), raw
+
+
+def pre_text_fallback(query: str) -> str:
+    return f"오케이ㅋㅋ **{query}**로 바로 3곳 뽑아볼게 🔍"
+
+
+def pre_text_prompt(query: str) -> str:
+    return f"친구처럼 1~2문장으로 추천 시작 멘트. 조건 반영. 이모지 1개.\n검색어: {query}"
+
+
+def generate_pre_text(conditions: dict, query: str, llm, session: str | None = None):
+    if llm is None:
+        return pre_text_fallback(query)
+    try:
+        return llm_chat(
+            llm, session, "pre_text",
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": pre_text_prompt(query)}],
+            temperature=0.8
+        )
+    except Exception:
+        return pre_text_fallback(query)
+
+
+# -----------------------------
+# Async engine (httpx + AsyncOpenAI, 프로세스당 이벤트 루프 1개)
+# -----------------------------
+ASYNC_ENGINE_TIMEOUT_S = 45
+
+
+class AsyncEngine:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="decision-mate-async", daemon=True)
+        self._thread.start()
+        self._http = None
+        self._llm = {}
+
+    # http()/llm()은 루프 스레드(코루틴) 안에서만 호출
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=10)
+        return self._http
+
+    def llm(self, api_key: str):
+        if not api_key:
+            return None
+        c = self._llm.get(api_key)
+        if c is None:
+            c = self._llm[api_key] = AsyncOpenAI(api_key=api_key)
+        return c
+
+    def run(self, coro, timeout: float | None = ASYNC_ENGINE_TIMEOUT_S, events: queue.Queue | None = None,
+            on_event=None):
+        # 스크립트 스레드에서 결과 대기. 타임아웃/중단이면 루프 쪽 태스크도 취소
+        # events: 루프 쪽에서 넣은 중간 결과(스트리밍 intro 등)를 기다리는 스레드에서 on_event로 처리
+        fut = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            if events is not None:
+                while not fut.done():
+                    if deadline and time.monotonic() > deadline:
+                        raise TimeoutError("async engine timeout")
+                    try:
+                        on_event(events.get(timeout=0.05))
+                    except queue.Empty:
+                        pass
+                while not events.empty():
+                    on_event(events.get_nowait())
+            # 이벤트 처리에 쓴 시간까지 합쳐서 timeout 한 번만
+            return fut.result(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+        except BaseException:
+            fut.cancel()
+            raise
+
+
+@st.cache_resource
+def get_async_engine() -> AsyncEngine:
+    return AsyncEngine()
+
+
+async def akakao_keyword_search(engine: AsyncEngine, query: str, rest_key: str, size: int = 15, page: int = 1,
+                                x: str | None = None, y: str | None = None,
+                                radius: int | None = None, sort: str | None = None,
+                                category: str | None = None):
+    params = kakao_params(query, size=size, page=page, x=x, y=y, radius=radius, sort=sort, category=category)
+
+    async def fetch():
+        res = await engine.http().get(kakao_url(category), headers=kakao_headers(rest_key), params=params)
+        res.raise_for_status()
+        return res.json()
+
+    return await acall_guarded("kakao", fetch)
+
+
+async def akakao_search_paged(engine: AsyncEngine, query: str, rest_key: str, max_pages: int = 3, size: int = 15,
+                              x: str | None = None, y: str | None = None,
+                              radius: int | None = None, sort: str | None = None,
+                              category: str | None = None):
+    return (await akakao_search_result(engine, query, rest_key, max_pages, size, x, y, radius, sort, category))[0]
+
+
+async def akakao_search_result(engine: AsyncEngine, query: str, rest_key: str, max_pages: int = 3, size: int = 15,
+                               x: str | None = None, y: str | None = None,
+                               radius: int | None = None, sort: str | None = None,
+                               category: str | None = None) -> tuple[list, str]:
+    search_log.record(query, max_pages, size, x, y, radius, sort, category)
+    ckey = kakao_cache_key(query, max_pages, size, x, y, radius, sort, category)
+    # 스토어(Redis 등)는 블로킹 API → 공유 이벤트 루프 밖 스레드에서
+    hit = await asyncio.to_thread(cached_places, ckey)
+    if hit is not None:
+        return hit, "cache"
+
+    # 1페이지로 총량 확인 → 필요한 나머지 페이지만 동시에 요청
+    all_docs = []
+    try:
+        first = await akakao_keyword_search(engine, query, rest_key, size=size, page=1, x=x, y=y, radius=radius,
+                                            sort=sort, category=category)
+        all_docs.extend(first.get("documents", []) or [])
+        meta = first.get("meta", {}) or {}
+        last_page = max_pages
+        if meta.get("pageable_count") is not None:
+            last_page = min(max_pages, max(1, math.ceil(int(meta["pageable_count"]) / size)))
+
+        if last_page > 1 and meta.get("is_end") is not True and len(all_docs) >= size:
+            rest = await asyncio.gather(*[
+                akakao_keyword_search(engine, query, rest_key, size=size, page=page, x=x, y=y, radius=radius,
+                                      sort=sort, category=category)
+                for page in range(2, last_page + 1)
+            ])
+            for data in rest:
+                docs = data.get("documents", []) or []
+                all_docs.extend(docs)
+                if (data.get("meta", {}) or {}).get("is_end") is True or len(docs) < size:
+                    break
+    except Exception as e:
+        return await asyncio.to_thread(degraded_places, ckey, all_docs, e), "degraded"
+    places = docs_to_places(all_docs)
+    await asyncio.to_thread(cache_places, ckey, places)
+    return places, "fresh"
+
+
+async def aget_location_center(engine: AsyncEngine, location: str, rest_key: str, cache: dict):
+    loc = (location or "").strip()
+    if not loc:
+        return None
+    if loc in cache:
+        return cache[loc]
+    shared = await asyncio.to_thread(store.get_json, store_key("geo", loc))
+    if shared:
+        cache[loc] = shared
+        return shared
+
+    # 후보("홍대역", "홍대")를 동시에 조회하고 원래 우선순위대로 채택
+    cands = location_candidates(loc)
+    results = await asyncio.gather(
+        *[akakao_search_paged(engine, cand, rest_key, max_pages=1, size=15) for cand in cands],
+        return_exceptions=True,
     )
-    return (res.choices[0].message.content or "").strip()
+    for cand, docs in zip(cands, results):
+        if isinstance(docs, BaseException) or not docs:
+            continue
+        d = docs[0]
+        if d.has_coords:
+            center = {"x": d.x, "y": d.y, "name": cand}
+            cache[loc] = center
+            await asyncio.to_thread(store.set_json, store_key("geo", loc), center, STORE_TTL["geo"])
+            return center
+    return None
+
+
+async def ameeting_center(engine: AsyncEngine, origins: list, rest_key: str, cache: dict):
+    names = [o["name"] for o in origins]
+    misses = [n for n in dict.fromkeys(names) if n not in cache]
+    found = await asyncio.gather(*[aget_location_center(engine, n, rest_key, {}) for n in misses])
+    for name, center in zip(misses, found):
+        if center:
+            cache[name] = center
+    points = origin_points(origins, [cache.get(n) for n in names])
+    if len(points) < 2:
+        return (cache.get(points[0]["name"]) if points else None), points
+
+    x, y = meeting_target(points)
+    try:
+        docs = await akakao_search_paged(engine, "지하철역", rest_key, max_pages=1, size=5, x=x, y=y,
+                                         radius=MEET_SNAP_RADIUS_M, sort="distance")
+    except UpstreamUnavailable:
+        docs = []
+    return station_center(docs) or {"x": x, "y": y, "name": "중간 지점"}, points
+
+
+async def aresolve_center(engine: AsyncEngine, conditions: dict, rest_key: str, cache: dict):
+    cm = conditions["meta"]["common"]
+    if conditions.get("origins"):
+        center, cm["origin_points"] = await ameeting_center(engine, conditions["origins"], rest_key, cache)
+        return center
+    cm["origin_points"] = []
+    return await aget_location_center(engine, conditions.get("location"), rest_key, cache)
+
+
+async def acategory_pool(engine: AsyncEngine, conditions: dict, rest_key: str, center: dict, pages: int,
+                         radius: int | None):
+    # 카테고리 페이지와 구체 토큰 키워드 검색을 동시에
+    code = category_group(conditions)
+    keyword = category_keyword(conditions)
+    radius = radius or CATEGORY_WIDE_RADIUS_M
+    x, y = center["x"], center["y"]
+    searches = [akakao_search_result(engine, "", rest_key, max_pages=min(pages, CATEGORY_MAX_PAGES), size=15,
+                                     x=x, y=y, radius=radius, sort="distance", category=code)]
+    if keyword:
+        searches.append(akakao_search_result(engine, keyword, rest_key, max_pages=1, size=15, x=x, y=y,
+                                             radius=radius, sort="distance"))
+    results = await asyncio.gather(*searches)
+    places = merge_places(results[1][0], results[0][0]) if keyword else results[0][0]
+    return places, category_label(code, keyword), worst_source(*(source for _, source in results))
+
+
+async def aget_candidate_pool(engine: AsyncEngine, conditions: dict, rest_key: str, loc_cache: dict):
+    cm = conditions["meta"]["common"]
+    relax = int(cm.get("search_relax", 0))
+
+    center = await aresolve_center(engine, conditions, rest_key, loc_cache)
+    cm["center"] = center
+    hit = cached_pool(conditions, center)
+    if hit is not None:
+        return hit[0], center, hit[1]
+
+    relax, pages, radius = await asyncio.to_thread(plan_search, center, conditions, relax)
+    cm["search_relax"] = relax
+    x = center["x"] if center else None
+    y = center["y"] if center else None
+    sort = "distance" if center else None
+
+    if use_category_search(conditions, center):
+        places, query, source = await acategory_pool(engine, conditions, rest_key, center, pages, radius)
+        pages = min(pages, CATEGORY_MAX_PAGES)
+    else:
+        query = build_query(conditions)
+        places, source = await akakao_search_result(engine, query, rest_key, max_pages=pages, size=15, x=x, y=y,
+                                                    radius=radius, sort=sort)
+    if source == "fresh":
+        await asyncio.to_thread(record_search_stats, center, conditions, relax, pages, places)
+
+    if relax >= 3 and len(places) < 10:
+        places2, source2 = await akakao_search_result(engine, build_weak_query(conditions), rest_key, max_pages=4, size=15, x=x, y=y, radius=None, sort=sort)
+        places = merge_places(places, places2)
+        source = worst_source(source, source2)
+
+    pool_cache.put(retrieval_signature(conditions, center), places, query, relax, source)
+    return places, center, query
+
+
+async def acollect_candidates(engine: AsyncEngine, conditions: dict, rest_key: str, loc_cache: dict,
+                              exclude_ids: list | None = None):
+    cm = conditions["meta"]["common"]
+    relax_guard = 0
+    places = []
+    center = None
+    used_query = build_query(conditions)
+
+    while relax_guard < 4:
+        places, center, used_query = await aget_candidate_pool(engine, conditions, rest_key, loc_cache)
+        # 도보 분(HTTP/그래프 백엔드)과 상세 정보(스토어)는 루프 밖에서 미리 → 이어지는 정렬들은 로컬 캐시만 읽음
+        await asyncio.to_thread(prefetch_scoring_inputs, center, places, not cm.get("origin_points"))
+        places = refine_places(places, center, conditions)
+
+        if len(filter_exclude_last(places, exclude_ids or [])) >= 8:
+            break
+
+        cm["search_relax"] = min(3, int(cm.get("search_relax", 0)) + 1)
+        relax_guard += 1
+
+    return places, center, used_query
+
+
+async def agenerate_pre_text(engine: AsyncEngine, api_key: str, query: str, session: str | None = None) -> str:
+    llm = engine.llm(api_key)
+    if llm is None:
+        return pre_text_fallback(query)
+    try:
+        return await allm_chat(
+            llm, session, "pre_text",
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": pre_text_prompt(query)}],
+            temperature=0.8
+        )
+    except Exception:
+        return pre_text_fallback(query)
+
+
+async def arerank_and_format(engine: AsyncEngine, api_key: str, conditions: dict, places: list,
+                             session: str | None = None, limit: int = 20, policy: dict | None = None):
+    llm = engine.llm(api_key)
+    if llm is None:
+        return [], ""
+    policy = policy or default_policy()
+    # 프롬프트의 상세 정보 조회와 캐시 조회는 스토어 왕복 → 루프 밖에서
+    prompt = await asyncio.to_thread(build_rerank_prompt, conditions, places, limit)
+    ckey = rerank_cache_key(prompt, policy["model"])
+    t0 = time.perf_counter()
+    raw = await asyncio.to_thread(store.get_json, ckey)
+    if isinstance(raw, str):
+        record_outcome(policy, session, "rerank", "cache", t0)
+    else:
+        try:
+            raw, outcome = await ahedged_chat(llm, session, "rerank", policy,
+                                              **rerank_chat_kwargs(prompt, policy["model"]))
+        except Exception as e:
+            record_outcome(policy, session, "rerank", "timeout" if is_timeout(e) else "error", t0)
+            return [], ""
+        record_outcome(policy, session, "rerank", outcome, t0)
+        await asyncio.to_thread(store.set_json, ckey, raw, STORE_TTL["rerank"])
+    return parse_rerank_picks(raw), raw
+
+
+async def arerank_with_intro(engine: AsyncEngine, api_key: str, conditions: dict, places: list,
+                             session: str | None = None, limit: int = 20, on_intro=None,
+                             policy: dict | None = None):
+    llm = engine.llm(api_key)
+    if llm is None:
+        return [], "", None
+    policy = policy or default_policy()
+    emit = on_intro or (lambda text: None)
+    prompt = await asyncio.to_thread(build_rerank_prompt, conditions, places, limit, True)
+    ckey = rerank_cache_key(prompt, policy["model"])
+    t0 = time.perf_counter()
+    raw = await asyncio.to_thread(store.get_json, ckey)
+    if isinstance(raw, str):
+        record_outcome(policy, session, "combined", "cache", t0)
+        intro = extract_intro(raw)
+        if intro:
+            emit(intro)
+        return parse_rerank_picks(raw), raw, intro
+
+    on_text, sent = intro_watcher(emit)
+    try:
+        raw = await asyncio.wait_for(
+            allm_stream(timed_client(llm, policy["timeout_s"]), session, "combined", on_text,
+                        **rerank_chat_kwargs(prompt, policy["model"])),
+            policy["timeout_s"],
+        )
+    except Exception as e:
+        record_outcome(policy, session, "combined", "timeout" if is_timeout(e) else "error", t0)
+        return [], "", (sent[0] if sent else None)
+    record_outcome(policy, session, "combined", "primary", t0)
+    await asyncio.to_thread(store.set_json, ckey, raw, STORE_TTL["rerank"])
+    return parse_rerank_picks(raw), raw, (sent[0] if sent else None)
+
+
+async def aphrase_courses(engine: AsyncEngine, api_key: str, conditions: dict, courses: list,
+                          session: str | None = None):
+    llm = engine.llm(api_key)
+    prompt = build_course_prompt(conditions, courses)
+    ckey = rerank_cache_key(prompt)
+    raw = await asyncio.to_thread(store.get_json, ckey)
+    if not isinstance(raw, str):
+        raw = ""
+        if llm is not None:
+            try:
+                raw = await allm_chat(llm, session, "course", **course_chat_kwargs(prompt))
+                await asyncio.to_thread(store.set_json, ckey, raw, STORE_TTL["rerank"])
+            except Exception:
+                raw = ""
+    return fill_course_lines(courses, raw), raw
+
+
+async def arecommend(engine: AsyncEngine, conditions: dict, kakao_key: str, openai_key: str,
+                     loc_cache: dict, exclude_ids: list, session: str | None = None, budget_level: int = 0,
+                     on_intro=None):
+    # geocode → 검색 fan-out → 필터 → rerank. 멘트는 후보 파이프라인과 독립이라 동시에 진행
+    # on_intro가 있으면 한 번에 모드: 멘트 호출 없이 rerank 스트림의 intro를 on_intro로
+    query = build_query(conditions)
+    pre_key = openai_key if budget_level < 1 else None
+    rerank_limit = LLM_RERANK_LIMITS[budget_level]
+    pre_task = None
+    try:
+        async with asyncio.TaskGroup() as tg:
+            if on_intro is None:
+                pre_task = tg.create_task(agenerate_pre_text(engine, pre_key, query, session))
+            pool_task = tg.create_task(acollect_candidates(engine, conditions, kakao_key, loc_cache, exclude_ids))
+    except* UpstreamUnavailable as eg:
+        raise eg.exceptions[0] from None
+    pool, center, used_query = pool_task.result()
+
+    places = filter_exclude_last(pool, exclude_ids)
+    # 코스 모드는 run_recommend에서 코스를 먼저 짜고 문구만 LLM에
+    picks, raw = (None, "")
+    pre = pre_task.result() if pre_task else ""
+    shortlist = []
+    policy = None
+    if places and rerank_limit and not is_course_mode(conditions):
+        # 점수 계산이 도보 분/상세 정보를 읽음 (로컬 캐시 만료 시 스토어·라우팅 왕복) → 루프 밖에서
+        shortlist = await asyncio.to_thread(select_candidates, places, center, conditions, rerank_limit)
+        policy = await asyncio.to_thread(choose_rerank_policy, conditions, shortlist, center, budget_level)
+        if policy["tier"] == "local":
+            t0 = time.perf_counter()
+            picks = await asyncio.to_thread(local_picks, shortlist, center, conditions)
+            record_outcome(policy, session, "rerank", "local", t0)
+        elif on_intro is not None:
+            picks, raw, intro = await arerank_with_intro(engine, openai_key, conditions, shortlist, session,
+                                                         len(shortlist), on_intro, policy)
+            pre = intro or ""
+        else:
+            picks, raw = await arerank_and_format(engine, openai_key, conditions, shortlist, session,
+                                                  len(shortlist), policy)
+
+    return {
+        "pre": pre,
+        "pool": pool,
+        "places": places,
+        "center": center,
+        "query": used_query,
+        "picks": picks,
+        "raw": raw,
+        "shortlist": len(shortlist),
+        "policy": policy,
+    }
+
+
+# -----------------------------
+# Recommend phase (스크립트 스레드/워커 공용: st 접근 없음)
+# -----------------------------
+REUSE_PRE_TEXT = "오케이, 방금 본 데는 빼고 남은 후보에서 바로 다시 골라볼게 🔁"
+
+
+def run_recommend(conditions: dict, kakao_key: str, openai_key: str, llm, loc_cache: dict,
+                  seen_ids: list, unseen: list | None = None, pool: dict | None = None,
+                  engine: AsyncEngine | None = None, on_stage=None, on_pre=None,
+                  session: str | None = None, combined: bool = False) -> dict:
+    # combined: 멘트 LLM 호출 없이 rerank 한 번에 intro까지 (스트리밍으로 intro 먼저 on_pre)
+    stage = on_stage or (lambda text: None)
+    emit_pre = on_pre or (lambda text: None)
+    cm = conditions["meta"]["common"]
+    picks, raw = None, ""
+    new_pool = None
+    pre = ""
+    degraded = []
+    shortlist = 0
+    policy = None
+    # 예산 단계: 1+ 멘트 템플릿, 2+ rerank 후보 축소, 3 rerank 없이 후보 순위 그대로
+    budget_level = meter.budget_level(session)
+    rerank_limit = LLM_RERANK_LIMITS[budget_level]
+
+    try:
+        if unseen is not None:
+            # 조건 그대로 → 카카오/멘트 LLM 없이 남은 후보만 다시 고름
+            pre = REUSE_PRE_TEXT
+            emit_pre(pre)
+            places, center, used_query = unseen, pool["center"], pool["query"]
+        elif engine is not None:
+            stage("후보 찾는 중")
+            if combined:
+                # intro는 루프 스레드에서 오니까 큐로 받아 이 스레드에서 출력
+                intros = queue.Queue()
+                result = engine.run(arecommend(engine, conditions, kakao_key, openai_key, loc_cache, seen_ids,
+                                               session, budget_level, on_intro=intros.put),
+                                    events=intros, on_event=emit_pre)
+                pre = result["pre"]
+            else:
+                result = engine.run(arecommend(engine, conditions, kakao_key, openai_key, loc_cache, seen_ids,
+                                               session, budget_level))
+                pre = result["pre"]
+                emit_pre(pre)
+            places, center, used_query = result["places"], result["center"], result["query"]
+            new_pool = make_pool(conditions, result["pool"], center, used_query)
+            picks, raw = result["picks"], result["raw"]
+            shortlist, policy = result["shortlist"], result["policy"]
+        else:
+            query = build_query(conditions)
+            if not combined:
+                stage("멘트 준비 중")
+                pre = generate_pre_text(conditions, query, llm if budget_level < 1 else None, session)
+                emit_pre(pre)
+
+            # candidate pipeline with relax escalation
+            stage("후보 찾는 중")
+            full, center, used_query = collect_candidates(conditions, kakao_key, seen_ids, loc_cache)
+            new_pool = make_pool(conditions, full, center, used_query)
+            places = filter_exclude_last(full, seen_ids)
+    except UpstreamUnavailable:
+        # 카카오 장애 + 캐시 사본도 없음 → 후보 없이 안내
+        degraded.append("kakao")
+        places, center, used_query = [], cm.get("center"), build_query(conditions)
+
+    courses = []
+    if places and picks is None and is_course_mode(conditions):
+        courses = plan_courses(places, center, conditions)
+    if courses:
+        stage("코스 다듬는 중")
+        course_key = openai_key if rerank_limit else None
+        if engine is not None:
+            lines, raw = engine.run(aphrase_courses(engine, course_key, conditions, courses, session))
+        else:
+            lines, raw = phrase_courses(conditions, courses, llm if rerank_limit else None, session)
+        for c, line in zip(courses, lines):
+            c.update(line)
+    elif places and picks is None and rerank_limit:
+        stage("3곳 고르는 중")
+        cands = select_candidates(places, center, conditions, rerank_limit)
+        shortlist = len(cands)
+        policy = choose_rerank_policy(conditions, cands, center, budget_level)
+        if policy["tier"] == "local":
+            t0 = time.perf_counter()
+            picks = local_picks(cands, center, conditions)
+            record_outcome(policy, session, "rerank", "local", t0)
+        elif combined and not pre and engine is None:
+            picks, raw, intro = rerank_with_intro(conditions, cands, llm, session, shortlist, emit_pre, policy)
+            pre = intro or ""
+        elif engine is not None:
+            picks, raw = engine.run(arerank_and_format(engine, openai_key, conditions, cands,
+                                                       session, shortlist, policy))
+        else:
+            picks, raw = rerank_and_format(conditions, cands, llm, session, shortlist, policy)
+    if combined and not pre and places:
+        # 코스 모드/예산 차단/LLM 실패로 intro가 없으면 템플릿 멘트
+        pre = pre_text_fallback(used_query)
+        emit_pre(pre)
+    if places and rerank_limit and not raw and not (policy and policy["tier"] == "local"):
+        # rerank 실패/차단 → 후보 순서 그대로 3곳 (local 티어는 일부러 안 부른 거라 제외)
+        degraded.append("openai")
+
+    return {
+        "pre": pre,
+        "pool": new_pool,
+        "places": places,
+        "center": center,
+        "query": used_query,
+        "relax": cm.get("search_relax"),
+        "picks": ensure_3_picks(picks, places) if places else [],
+        "raw": raw,
+        "budget_level": budget_level,
+        "degraded": degraded,
+        "shortlist": shortlist,
+        "courses": courses,
+        "llm_policy": policy,
+    }
+
+
+# -----------------------------
+# Compare mode ("밥 vs 술" → 시나리오 2~4개를 동시에 돌려서 나란히)
+# -----------------------------
+COMPARE_MAX = 4
+COMPARE_WORKERS = 8
+COMPARE_SPLIT_RE = re.compile(r"\s*(?:vs\.?|아니면)\s*", re.IGNORECASE)
+# (키워드, meta 덮어쓰기, common 덮어쓰기) — 한 시나리오에 여러 개 겹쳐 적용
+SCENARIO_RULES = [
+    (["한식"], {"place_type": "식사", "food_class": "한식"}, {}),
+    (["중식", "중국"], {"place_type": "식사", "food_class": "중식"}, {}),
+    (["일식", "일본"], {"place_type": "식사", "food_class": "일식"}, {}),
+    (["양식"], {"place_type": "식사", "food_class": "양식"}, {}),
+    (["밥", "식사"], {"place_type": "식사"}, {}),
+    (["술"], {"place_type": "술"}, {}),
+    (["카페", "커피", "디저트"], {"place_type": "카페"}, {}),
+    (["역근처", "역앞", "가까운", "가까이"], {}, {"walk_limit_min": 5, "walk_limit_src": "scenario"}),
+    (["걷더라도", "좀걸어도", "조금걸어도"], {}, {"walk_limit_min": 15, "walk_limit_src": "scenario"}),
+    (["조용"], {}, {"focus": "대화 중심"}),
+    (["맛집", "맛있는"], {}, {"focus": "음식 중심"}),
+]
+
+
+def parse_scenario(part: str) -> dict | None:
+    tc = nc(part)
+    meta, common = {}, {}
+    for keys, m_over, c_over in SCENARIO_RULES:
+        if contains_any(tc, keys):
+            meta = {**m_over, **meta}
+            common = {**c_over, **common}
+    if not meta and not common:
+        return None
+    return {"label": part.strip(" ?!.~"), "meta": meta, "common": common}
+
+
+def parse_scenarios(text: str) -> list:
+    # 전부 알아들은 2~4개일 때만 비교 모드 (하나라도 모르면 평소대로)
+    parts = [p for p in COMPARE_SPLIT_RE.split(text or "") if p.strip()]
+    if not 2 <= len(parts) <= COMPARE_MAX:
+        return []
+    scenarios = [parse_scenario(p) for p in parts]
+    return scenarios if all(scenarios) else []
+
+
+# 비교 요청에서 시나리오가 아닌 말 ("뭐가 나아?" 같은 군더더기)
+COMPARE_FILLER = ["뭐가", "어디가", "어느쪽", "나아", "좋을까", "중에", "골라", "비교", "해줘"]
+
+
+def scenario_remainder(text: str) -> str:
+    # "홍대 밥 vs 술" → "홍대": 시나리오 키워드/구분자/군더더기를 뺀 나머지 (지역 답 같은 것)
+    keys = [k for rule_keys, _, __ in SCENARIO_RULES for k in rule_keys] + COMPARE_FILLER
+    words = " ".join(COMPARE_SPLIT_RE.split(text or "")).split()
+    drop = {i for i, w in enumerate(words) if contains_any(nc(w), keys)}
+    for i in range(len(words) - 1):
+        # "역 근처"처럼 띄어 쓴 키워드: 키워드가 통째로 덮는 단어만 뺌 ("강남역 근처" → 강남역은 남김)
+        a, b = nc(words[i]), nc(words[i + 1])
+        for k in keys:
+            start = (a + b).find(k)
+            if 0 <= start < len(a) < start + len(k):
+                if start == 0:
+                    drop.add(i)
+                if start + len(k) == len(a + b):
+                    drop.add(i + 1)
+    return " ".join(w for i, w in enumerate(words) if i not in drop).strip(" ?!.~,")
+
+
+def scenario_conditions(conditions: dict, scenario: dict) -> dict:
+    variant = copy.deepcopy(conditions)
+    variant["meta"].update(scenario["meta"])
+    variant["meta"]["common"].update(scenario["common"])
+    variant["meta"]["compare"] = None
+    return variant
+
+
+@st.cache_resource
+def get_compare_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix="decision-mate-compare")
+
+
+def run_compare(conditions: dict, scenarios: list, kakao_key: str, openai_key: str, llm, loc_cache: dict,
+                seen_ids: list, engine: AsyncEngine | None = None, session: str | None = None) -> list:
+    # 좌표는 여기서 1번만 (세션 캐시에 채움) → 시나리오별로 복사본을 들고 동시에 run_recommend
+    # 카카오/rerank는 공유 스토어 캐시를 같이 씀. 멘트는 시나리오마다 따로 안 부르고 rerank intro로
+    try:
+        if engine is not None:
+            engine.run(aresolve_center(engine, copy.deepcopy(conditions), kakao_key, loc_cache))
+        else:
+            resolve_center(copy.deepcopy(conditions), kakao_key, loc_cache)
+    except UpstreamUnavailable:
+        pass    # 시나리오별로 degraded 처리됨
+
+    pool = get_compare_pool()
+    futures = [
+        pool.submit(run_recommend, scenario_conditions(conditions, sc), kakao_key, openai_key, llm,
+                    dict(loc_cache), seen_ids, engine=engine, session=session, combined=True)
+        for sc in scenarios
+    ]
+    return [f.result() for f in futures]
 
 
 # -----------------------------
-# Render chat history
+# Job runner (추천 단계를 워커 풀로: 질문 턴은 계속 인라인)
 # -----------------------------
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+JOB_MAX_WORKERS = 4
+JOB_MAX_PENDING = 16      # 실행 중 + 대기 합계 상한 (넘으면 거절 = backpressure)
+JOB_MAX_PER_USER = 1
+JOB_TTL_S = 600           # 결과를 안 가져간 작업 정리
+
+
+class JobRejected(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, user: str):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.status = "queued"   # queued/running/done/error
+        self.stage = "대기 중"
+        self.pre = None
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "error")
+
+    def set_stage(self, text: str):
+        self.stage = text
+
+    def set_pre(self, text: str):
+        self.pre = text
+
+
+class JobRunner:
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 max_per_user: int = JOB_MAX_PER_USER):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="decision-mate-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = 0
+        self._per_user = {}
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+
+    def submit(self, user: str, fn) -> Job:
+        with self._lock:
+            self._gc()
+            if self._per_user.get(user, 0) >= self.max_per_user:
+                raise JobRejected("이미 추천 뽑는 중이야! 잠깐만 기다려줘 ⏳")
+            if self._pending >= self.max_pending:
+                raise JobRejected("지금 추천 요청이 몰려서 바빠 🥲 잠깐 뒤에 다시 말해줘!")
+            self._pending += 1
+            self._per_user[user] = self._per_user.get(user, 0) + 1
+            job = Job(user)
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn):
+        job.status = "running"
+        try:
+            job.result = fn(job)
+            job.status = "done"
+        except Exception as e:
+            job.error = e
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+                self._per_user[job.user] -= 1
+                if self._per_user[job.user] <= 0:
+                    del self._per_user[job.user]
+
+    def _gc(self):
+        now = time.time()
+        stale = [jid for jid, j in self._jobs.items() if j.finished_at and now - j.finished_at > JOB_TTL_S]
+        for jid in stale:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def pop(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.pop(job_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self._pending, "users": len(self._per_user), "jobs": len(self._jobs)}
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    return JobRunner()
+
+
+# -----------------------------
+# Cache warmer (인기 역 × 사이드바 프리셋 → 공유 캐시 미리 채움)
+# -----------------------------
+# 배포 시: 레플리카 띄우기 전에 `python app.py --warm` 한 번 (공유 스토어를 데우고 ready 파일 쓰고 종료)
+#   → 첫 세션도 데워진 캐시를 봄. 프로세스 안 워머는 첫 세션부터 주기적으로 다시 데움
+WARM_SET_PATH = os.environ.get(
+    "DECISION_MATE_WARM_SET", os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_set.json"))
+WARM_KAKAO_KEY = os.environ.get("KAKAO_REST_API_KEY", "")
+WARM_READY_FILE = os.environ.get("DECISION_MATE_READY_FILE")   # --warm이 끝나면 기록 (readiness probe용)
+WARM_TOP_N = 40             # search_log 상위 N개 (warm_set.json 조합은 상한과 별개로 전부)
+WARM_RATE_PER_S = 2.0       # 워머가 쓰는 카카오 요청/초 예산
+WARM_INTERVAL_S = 1800
+WARM_META_KEYS = ("mode", "place_type", "food_class")
+
+
+def load_warm_set(path: str) -> list[dict]:
+    # {"locations": [...], "presets": [{"place_type": "술"}, ...]} → (location, preset) 조합
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    presets = data.get("presets") or [{}]
+    return [{"location": loc, **preset} for loc in data.get("locations", []) for preset in presets]
+
+
+class CacheWarmer:
+    # 1) 세션이 실제로 보낸 검색(search_log 상위 N)을 같은 파라미터로 다시 → 캐시 키가 그대로 맞음
+    # 2) warm_set.json 역 × 프리셋 (트래픽 쌓이기 전 콜드 스타트용: 좌표 + 기본 검색어 풀)
+    def __init__(self, rest_key: str, path: str = WARM_SET_PATH, top_n: int = WARM_TOP_N,
+                 rate_per_s: float = WARM_RATE_PER_S, interval_s: float = WARM_INTERVAL_S,
+                 background: bool = True):
+        self.rest_key = rest_key
+        self.path = path
+        self.top_n = top_n
+        self.rate_per_s = rate_per_s
+        self.interval_s = interval_s
+        self.ready = threading.Event()
+        self.status = {"runs": 0, "warmed": 0, "errors": 0, "last_run": None, "size": 0}
+
+        if not rest_key:
+            # 키 없으면 데울 게 없음 → 바로 ready
+            self.status["skipped"] = "no KAKAO_REST_API_KEY"
+            self.ready.set()
+            return
+        if background:
+            threading.Thread(target=self._loop, name="decision-mate-warmer", daemon=True).start()
+
+    def warm_set(self) -> list[dict]:
+        # 설정한 조합은 항상 전부 (로그가 쌓여도 밀려나지 않게), 로그는 상위 top_n만
+        out = [{"search": params} for params in search_log.top(self.top_n)]
+        return out + load_warm_set(self.path)
+
+    def warm_search(self, params: dict):
+        # 세션과 같은 (query, pages, radius, ...) → 같은 kakao_cache_key
+        kakao_search_paged(params["query"], self.rest_key, max_pages=params["max_pages"], size=params["size"],
+                           x=params["x"], y=params["y"], radius=params["radius"], sort=params["sort"],
+                           category=params["category"])
+
+    def warm_pair(self, pair: dict):
+        conditions = init_conditions()
+        conditions["location"] = pair["location"]
+        for k in WARM_META_KEYS:
+            if pair.get(k):
+                conditions["meta"][k] = pair[k]
+        # 빈 세션 캐시를 넘겨서 좌표/검색 결과가 공유 스토어로만 들어가게
+        get_candidate_pool(conditions, self.rest_key, {})
+
+    def warm_once(self):
+        items = self.warm_set()
+        self.status["size"] = len(items)
+        pages, _ = relax_plan(0)
+        for item in items:
+            t0 = time.time()
+            try:
+                if "search" in item:
+                    self.warm_search(item["search"])
+                else:
+                    self.warm_pair(item)
+                self.status["warmed"] += 1
+            except Exception:
+                self.status["errors"] += 1
+            # 항목당 최대 요청 수(페이지, 또는 좌표 후보 + 페이지) 기준으로 예산 맞춰 쉬기
+            if "search" in item:
+                cost = item["search"]["max_pages"]
+            else:
+                cost = len(location_candidates(item["location"])) + pages
+            time.sleep(max(0.0, cost / self.rate_per_s - (time.time() - t0)))
+        self.status["runs"] += 1
+        self.status["last_run"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _loop(self):
+        search_log.mark_warm_thread()
+        while True:
+            self.warm_once()
+            self.ready.set()
+            time.sleep(self.interval_s)
+
+
+@st.cache_resource
+def get_cache_warmer() -> CacheWarmer:
+    return CacheWarmer(WARM_KAKAO_KEY)
+
+
+def warm_main() -> int:
+    # `python app.py --warm`: 세션 없이 한 바퀴 데우고 ready 파일 기록
+    if not WARM_KAKAO_KEY:
+        print("KAKAO_REST_API_KEY가 없어서 데울 게 없음", file=sys.stderr)
+        return 2
+    if isinstance(store, MemoryStore):
+        # 메모리 스토어는 이 프로세스가 끝나면 사라짐 → 레플리카들이 보는 공유 스토어가 필요
+        print("DECISION_MATE_STORE가 memory://면 데워도 서버에 안 남음 (sqlite:// 또는 redis:// 필요)", file=sys.stderr)
+        return 2
+    search_log.mark_warm_thread()
+    w = CacheWarmer(WARM_KAKAO_KEY, background=False)
+    w.warm_once()
+    status = json.dumps(w.status, ensure_ascii=False)
+    if WARM_READY_FILE:
+        with open(WARM_READY_FILE, "w", encoding="utf-8") as f:
+            f.write(status)
+    print(status)
+    return 0 if w.status["warmed"] else 1
+
+
+if "--warm" in sys.argv[1:] and not st.runtime.exists():
+    sys.exit(warm_main())
+
+
+warmer = get_cache_warmer()
+
+
+PROFILE_PREFETCH_WORKERS = 2
+
+
+@st.cache_resource
+def get_prefetch_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=PROFILE_PREFETCH_WORKERS, thread_name_prefix="decision-mate-prefetch")
+
+
+def prefetch_usual_area(location: str, profile: dict, rest_key: str):
+    # 재방문 사용자의 자주 가는 동네 좌표/기본 후보를 공유 스토어에 미리 (세션 캐시는 스크립트 스레드 전용)
+    conditions = init_conditions(profile)
+    conditions["location"] = location
+    get_candidate_pool(conditions, rest_key, {})
+
+
+if st.session_state.profile_prefetch and kakao_key:
+    get_prefetch_pool().submit(prefetch_usual_area, st.session_state.profile_prefetch,
+                               st.session_state.profile, kakao_key)
+    st.session_state.profile_prefetch = None
+
+if debug_mode:
+    warm_state = "준비됨" if warmer.ready.is_set() else "데우는 중"
+    st.sidebar.caption(f"🔥 캐시 워머: {warm_state} · {json.dumps(warmer.status, ensure_ascii=False)}")
+    usage = meter.usage(st.session_state.user_key)
+    st.sidebar.caption(
+        "💸 LLM 토큰 · "
+        + " · ".join(f"{k} {v['prompt'] + v['completion']:,} (${v['usd']:.4f}, {v['calls']}회)" for k, v in usage.items())
+        + f" · 예산 단계 {meter.budget_level(st.session_state.user_key)}"
+    )
+    st.sidebar.caption(f"🎚️ LLM 요청 정책 · {json.dumps(meter.policy_status(), ensure_ascii=False)}")
+    if st.session_state.profile is not None:
+        prof = st.session_state.profile
+        st.sidebar.caption(
+            f"👤 프로필 · 동네 {json.dumps(prof.get('areas') or {}, ensure_ascii=False)} · "
+            f"최근 제외 {len(profile_exclusions(prof))}곳"
+        )
+    st.sidebar.caption(f"🗺️ 도보 시간 · {json.dumps(travel.status, ensure_ascii=False)}")
+    st.sidebar.caption(f"🏷️ 장소 보강 · {json.dumps(details.status, ensure_ascii=False)}")
+    st.sidebar.caption(f"♻️ 후보 풀 캐시 · {json.dumps(pool_cache.status, ensure_ascii=False)}")
+    st.sidebar.caption(
+        "🚦 breakers · " + " · ".join(f"{name} {json.dumps(b.status(), ensure_ascii=False)}" for name, b in breakers.items())
+    )
+
+
+# -----------------------------
+# Render recommendation
+# -----------------------------
+def reply(text: str):
+    # assistant 메시지 출력 + 히스토리 추가 + 공유 스토어에 세션 스냅샷
+    st.markdown(text)
+    st.session_state.messages.append({"role": "assistant", "content": text})
+    save_session()
+
+
+def remember_profile(conditions: dict, pick_ids: list):
+    # opt-in 프로필이 있을 때만: 이번 조건/추천을 다음 세션용으로 저장
+    profile_id = st.session_state.profile_id
+    if not profile_id or st.session_state.profile is None:
+        return
+    st.session_state.profile = update_profile(st.session_state.profile, conditions, pick_ids)
+    store.set_json(profile_key(profile_id), st.session_state.profile, STORE_TTL["profile"])
+
+
+def render_courses(courses: list, seen_ids: list, conditions: dict):
+    st.markdown("---")
+    st.subheader(f"🍻 1차 → 2차 코스 {len(courses)}개 골랐어")
+    cols = st.columns(len(courses))
+    details.enrich([p for c in courses for p in (c["first"], c["second"])])
+
+    current_pick_ids = []
+    for i, c in enumerate(courses):
+        first, second = c["first"], c["second"]
+        current_pick_ids += [first.id, second.id]
+        with cols[i]:
+            st.markdown(f"### {i+1}. {first.name} → {second.name}")
+            st.caption(f"1차 {first.category} · 2차 {second.category}")
+            st.markdown(f"**{c.get('one_line', '')}**")
+            st.write(c.get("flow", ""))
+            tags = c.get("hashtags", [])
+            if tags:
+                st.markdown(" ".join(tags))
+            st.markdown("**왜 이 코스냐면…**")
+            st.write(c.get("reason", ""))
+            st.caption(f"🚶 1차 → 2차 도보 약 {c['leg_min']}분")
+            render_place_details(first, "1차 ")
+            render_place_details(second, "2차 ")
+            if first.url:
+                st.link_button("1차 카카오맵", first.url)
+            if second.url:
+                st.link_button("2차 카카오맵", second.url)
+
+    st.session_state.last_picks_ids = current_pick_ids
+    st.session_state.seen_pick_ids = (seen_ids + [pid for pid in current_pick_ids if pid not in seen_ids])[-SEEN_IDS_MAX:]
+    remember_profile(conditions, current_pick_ids)
+    reply("끝! 😎\n코스 하나 고르거나, **'다른 데'** 라고 하면 다른 조합으로 다시 짜줄게.")
+
+
+def render_recommendation(result: dict, conditions: dict, show_pre: bool):
+    cm = conditions["meta"]["common"]
+    places, center, used_query = result["places"], result["center"], result["query"]
+    seen_ids = st.session_state.seen_pick_ids
+
+    if show_pre and result["pre"]:
+        st.markdown(result["pre"])
+    if result.get("pool") is not None:
+        st.session_state.rec_pool = result["pool"]
+    # LLM 원문은 디버그 모드에서만 세션에 보관
+    st.session_state.debug_raw_rerank = result["raw"] if debug_mode else ""
+
+    if debug_mode:
+        with st.expander("🧾 현재 누적 조건(JSON)"):
+            st.json(conditions)
+        with st.expander("🧪 후보 풀(상위 25)"):
+            st.write(f"query: {used_query}")
+            st.write(f"candidates: {len(places)} / relax: {cm.get('search_relax')} / shortlist: {result.get('shortlist')}")
+            for p in places[:25]:
+                st.write(f"- {p.name} | {p.category} | {p.address}")
+
+    if not places:
+        if "kakao" in result.get("degraded", []):
+            msg = "앗, 지금 카카오 검색이 잠깐 불안정해 🥲 조금 있다가 다시 말해줄래?"
+        else:
+            msg = "헉… 이 조건으로는 딱 맞는 데가 잘 안 잡히네 🥲\n지역을 조금만 넓혀볼까?"
+        reply(msg)
+        return
+
+    if debug_mode:
+        if result.get("degraded"):
+            st.caption(f"🩹 degraded: {', '.join(result['degraded'])}")
+        if result.get("budget_level"):
+            st.caption(f"💸 LLM 예산 단계 {result['budget_level']} (rerank 후보 {LLM_RERANK_LIMITS[result['budget_level']]})")
+        if result.get("llm_policy"):
+            pol = result["llm_policy"]
+            st.caption(f"🎚️ rerank {pol['tier']}({pol['reason']}) · {pol['model']} · "
+                       f"{pol.get('outcome', '-')} {pol.get('latency_s', 0):.2f}s")
+        with st.expander("🤖 (디버그) rerank LLM 원문"):
+            st.code(st.session_state.debug_raw_rerank)
+
+    if result.get("courses"):
+        render_courses(result["courses"], seen_ids, conditions)
+        return
+
+    picks = result["picks"]
+    kakao_map = {p.id: p for p in places}
+    # picks 먼저, 다음 후보까지 백그라운드 보강 (안 기다림)
+    details.enrich([kakao_map.get(pk.get("id")) for pk in picks[:3]] + places[:DETAILS_TOP_K])
+
+    st.markdown("---")
+    st.subheader("🍽️ 딱 3곳만 골랐어")
+    cols = st.columns(3)
+
+    current_pick_ids = []
+
+    for i, pick in enumerate(picks[:3]):
+        pid = pick.get("id")
+        place = kakao_map.get(pid)
+        if pid is None or not place:
+            continue
+        current_pick_ids.append(pid)
+
+        with cols[i]:
+            name = place.name
+            addr = place.address
+            url = place.url
+            category = place.category
+
+            st.markdown(f"### {i+1}. {name}")
+            st.caption(category or "")
+            st.write(f"📍 {addr}")
+
+            st.markdown(f"**{pick.get('one_line','')}**")
+            scene = pick.get("scene_feel")
+            if scene:
+                st.markdown(f"_이 자리 느낌_: {scene}")
+
+            matched = pick.get("matched_conditions", [])
+            if matched:
+                st.markdown("**반영한 조건**")
+                st.markdown(" · ".join([f"`{m}`" for m in matched]))
+
+            tags = pick.get("hashtags", [])
+            if tags:
+                st.markdown(" ".join(tags))
+
+            st.markdown("**왜 여기냐면…**")
+            st.write(pick.get("reason", ""))
+
+            # walk estimate
+            walk = walk_minutes_to(center, [place])[0]
+            if walk is not None:
+                st.caption(f"🚶 예상 도보 약 {max(1, int(math.ceil(walk)))}분")
+            points = cm.get("origin_points") or []
+            if len(points) >= 2 and place.has_coords:
+                st.caption("👥 " + " · ".join(f"{name} 약 {m}분" for name, m in travel_minutes(points, place)))
+            render_place_details(place)
+
+            if url:
+                st.link_button("카카오맵에서 보기", url)
+
+    st.session_state.last_picks_ids = current_pick_ids
+    st.session_state.seen_pick_ids = (seen_ids + [pid for pid in current_pick_ids if pid not in seen_ids])[-SEEN_IDS_MAX:]
+    remember_profile(conditions, current_pick_ids)
+
+    final = "끝! 😎\n셋 중에 하나 고르거나, **'다른 데'**, **'더 조용한 데'**, **'완전 다른 분위기'** 이렇게 다시 시켜도 돼."
+    reply(final)
+
+
+def render_compare(results: list, scenarios: list, conditions: dict):
+    seen_ids = st.session_state.seen_pick_ids
+    st.markdown("---")
+    st.subheader("⚖️ " + " vs ".join(sc["label"] for sc in scenarios))
+    cols = st.columns(len(results))
+
+    current_pick_ids = []
+    for col, sc, result in zip(cols, scenarios, results):
+        place_map = {p.id: p for p in result["places"]}
+        picks = [(pk, place_map.get(pk.get("id"))) for pk in result["picks"][:3]]
+        picks = [(pk, p) for pk, p in picks if p is not None]
+        details.enrich([p for _, p in picks])
+        with col:
+            st.markdown(f"### {sc['label']}")
+            if result["pre"]:
+                st.caption(result["pre"])
+            if debug_mode:
+                st.caption(f"query: {result['query']} · candidates: {len(result['places'])} · "
+                           f"degraded: {', '.join(result['degraded']) or '-'}")
+            if not picks:
+                st.write("이 조건으로는 딱 맞는 데가 잘 안 잡히네 🥲")
+                continue
+            walks = walk_minutes_to(result["center"], [p for _, p in picks])
+            for i, ((pick, place), walk) in enumerate(zip(picks, walks)):
+                current_pick_ids.append(place.id)
+                st.markdown(f"**{i+1}. {place.name}**")
+                st.caption(place.category or "")
+                st.write(pick.get("one_line", ""))
+                if walk is not None:
+                    st.caption(f"🚶 예상 도보 약 {max(1, int(math.ceil(walk)))}분")
+                render_place_details(place)
+                if place.url:
+                    st.link_button("카카오맵에서 보기", place.url)
+
+    st.session_state.last_picks_ids = current_pick_ids
+    st.session_state.seen_pick_ids = (seen_ids + [pid for pid in current_pick_ids if pid not in seen_ids])[-SEEN_IDS_MAX:]
+    remember_profile(conditions, current_pick_ids)
+    reply("끝! 😎\n끌리는 쪽으로 사이드바(장소 타입/음식 분류)를 맞추고 **'그냥 추천해'** 하면 그쪽으로 3곳 더 자세히 뽑아줄게.")
+
+
+# -----------------------------
+# Render chat history (최근 N개만 바로, 이전은 요약 + 페이지)
+# -----------------------------
+def summarize_messages(msgs: list, prev: dict | None) -> dict:
+    summary = dict(prev or {"dropped": 0, "user_inputs": []})
+    summary["dropped"] += len(msgs)
+    user_inputs = summary["user_inputs"] + [m["content"][:40] for m in msgs if m["role"] == "user"]
+    summary["user_inputs"] = user_inputs[-5:]
+    return summary
+
+
+def compact_history():
+    msgs = st.session_state.messages
+    if len(msgs) <= HISTORY_MAX:
+        return
+    cut = len(msgs) - HISTORY_MAX
+    st.session_state.history_summary = summarize_messages(msgs[:cut], st.session_state.history_summary)
+    st.session_state.messages = msgs[cut:]
+
+
+def render_history():
+    msgs = st.session_state.messages
+    summary = st.session_state.history_summary
+    older, recent = msgs[:-HISTORY_VISIBLE], msgs[-HISTORY_VISIBLE:]
+
+    if older or summary:
+        dropped = summary["dropped"] if summary else 0
+        with st.expander(f"🗂️ 이전 대화 {len(older) + dropped}개"):
+            if summary:
+                said = " / ".join(summary["user_inputs"])
+                st.caption(f"오래된 {dropped}개는 요약만 남김 · 그때 말한 것: {said}")
+            if older:
+                pages = max(1, math.ceil(len(older) / HISTORY_PAGE))
+                page = st.number_input("페이지(최근=1)", min_value=1, max_value=pages, value=1, step=1) if pages > 1 else 1
+                end = len(older) - (page - 1) * HISTORY_PAGE
+                for msg in older[max(0, end - HISTORY_PAGE):end]:
+                    st.markdown(f"**{'🙋' if msg['role'] == 'user' else '🤖'}** {msg['content']}")
+
+    for msg in recent:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+
+def approx_size(obj, seen: set | None = None) -> int:
+    # 세션 상태 대략 크기 (컨테이너/Place 슬롯까지 재귀)
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, seen) for v in obj)
+    elif isinstance(obj, Place):
+        size += sum(approx_size(getattr(obj, a), seen) for a in Place.__slots__)
+    return size
+
+
+compact_history()
+render_history()
+
+if debug_mode:
+    ss = st.session_state
+    gauge = {k: approx_size(ss[k]) for k in ("messages", "conditions", "rec_pool", "question_pool",
+                                              "loc_center_cache", "seen_pick_ids", "debug_raw_rerank")}
+    st.sidebar.caption(
+        f"🧠 세션 메모리 ≈ {sum(gauge.values()) / 1024:.1f} KB · "
+        + " · ".join(f"{k} {v / 1024:.1f}KB" for k, v in gauge.items())
+    )
+
+
+# -----------------------------
+# Active job (워커 풀 진행상황 폴링 → 완료 시 결과 렌더)
+# -----------------------------
+@st.fragment(run_every=0.5)
+def job_progress(job_id: str):
+    job = get_job_runner().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    if job.pre:
+        st.markdown(job.pre)
+    st.caption(f"⏳ {job.stage}…")
+
+
+def render_active_job():
+    job_id = st.session_state.active_job
+    if not job_id:
+        return
+    runner = get_job_runner()
+    job = runner.get(job_id)
+    if job is None:
+        st.session_state.active_job = None
+        return
+
+    with st.chat_message("assistant"):
+        if not job.done:
+            job_progress(job_id)
+            return
+
+        runner.pop(job_id)
+        st.session_state.active_job = None
+        if job.error is not None:
+            msg = "앗, 추천 뽑다가 문제가 생겼어 🥲 한 번만 다시 말해줄래?"
+            reply(msg)
+            if debug_mode:
+                st.exception(job.error)
+            return
+
+        result = job.result
+        # 워커가 새로 찾은 위치 좌표만 세션 캐시로 (세션 캐시 쓰기는 스크립트 스레드에서만)
+        cache = st.session_state.loc_center_cache
+        for loc, center in result.pop("loc_cache", {}).items():
+            if loc not in cache:
+                cache[loc] = center
+        cm = st.session_state.conditions["meta"]["common"]
+        cm["search_relax"] = result["relax"]
+        cm["center"] = result["center"]
+        render_recommendation(result, st.session_state.conditions, show_pre=True)
+
+
+render_active_job()
 
 
 # -----------------------------
@@ -1083,143 +5138,100 @@ if user_input:
     with st.chat_message("assistant"):
         if not openai_key or not kakao_key:
             st.warning("사이드바에 OpenAI 키랑 Kakao 키부터 넣어줘!")
-            st.stop()
+            end_turn()
 
         # exclude last intent
         exclude_last = detect_exclude_last(user_input)
 
+        # "A vs B" 비교 요청은 시나리오 부분을 답변/자동 채움에 안 씀 (공통 조건에 한쪽 시나리오가 섞이지 않게)
+        # 나머지 말은 위치 질문 답으로만 ("홍대 밥 vs 술" → 위치 홍대)
+        scenarios = parse_scenarios(user_input)
+        if scenarios:
+            st.session_state.conditions["meta"]["compare"] = scenarios
+
         # apply answer
         pending = st.session_state.conditions["meta"].get("pending_question")
-        ok = apply_answer(st.session_state.conditions, pending, user_input)
+        if scenarios:
+            rest = scenario_remainder(user_input)
+            answers_location = rest and pending and pending.get("key") == "location"
+            ok = apply_answer(st.session_state.conditions, pending, rest) if answers_location else True
+        else:
+            ok = apply_answer(st.session_state.conditions, pending, user_input)
         if pending and not ok:
             msg = f"오케이 근데 내가 제대로 잡게 한 번만 더! 😅\n\n**{pending['text']}**"
-            st.markdown(msg)
-            st.session_state.messages.append({"role": "assistant", "content": msg})
-            st.stop()
+            reply(msg)
+            end_turn()
 
         # clear pending
         st.session_state.conditions["meta"]["pending_question"] = None
 
-        # next question?
-        next_q = get_next_question(st.session_state.conditions)
+        # next question? (플래너 켜져 있으면 미리 받은 후보 풀로 영향 큰 질문만)
+        conditions = st.session_state.conditions
+        qpool = None
+        compare = conditions["meta"].get("compare")
+        skip_once = conditions["meta"].get("skip_questions_once")
+        conditions["meta"]["skip_questions_once"] = False
+        if use_question_planner and not compare and not skip_once and not next_required_question(conditions) \
+                and not conditions["meta"].get("fast_mode"):
+            qpool = prefetch_question_pool(conditions, kakao_key)
+        # 비교 모드 / "더 가까운 데"는 필수 질문(지역)만 묻고 바로
+        next_q = next_required_question(conditions) if compare or skip_once else get_next_question(conditions, qpool)
         if next_q:
-            st.session_state.conditions["meta"]["pending_question"] = next_q
-            st.markdown(next_q["text"])
-            st.session_state.messages.append({"role": "assistant", "content": next_q["text"]})
-            st.stop()
+            conditions["meta"]["pending_question"] = next_q
+            if next_q["key"] not in ("location", "cannot_eat"):
+                conditions["meta"]["questions_asked"] = conditions["meta"].get("questions_asked", 0) + 1
+            reply(next_q["text"])
+            end_turn()
 
         # -----------------------------
         # Recommend phase
         # -----------------------------
         conditions = st.session_state.conditions
-        cm = conditions["meta"]["common"]
-
-        query = build_query(conditions)
-        pre = generate_pre_text(conditions, query)
-        st.markdown(pre)
-
-        # candidate pipeline with relax escalation
-        relax_guard = 0
-        places = []
-        center = None
-        used_query = query
-
-        while relax_guard < 4:
-            places, center, used_query = get_candidate_pool(conditions, kakao_key)
-            places = franchise_filter(places, conditions["constraints"].get("avoid_franchise", False))
-            places = filter_by_place_type(places, conditions["meta"].get("place_type", "자동"))
-            places = dating_high_sensitivity_filter(places, conditions)
-            places = prioritize_places(places, center, conditions)
-            if exclude_last:
-                places = filter_exclude_last(places, st.session_state.last_picks_ids)
-
-            if len(places) >= 8:
-                break
-
-            # not enough -> relax up
-            cm["search_relax"] = min(3, int(cm.get("search_relax", 0)) + 1)
-            relax_guard += 1
-
-        if debug_mode:
-            with st.expander("🧾 현재 누적 조건(JSON)"):
-                st.json(conditions)
-            with st.expander("🧪 후보 풀(상위 25)"):
-                st.write(f"query: {used_query}")
-                st.write(f"candidates: {len(places)} / relax: {cm.get('search_relax')}")
-                for p in places[:25]:
-                    st.write(f"- {p.get('place_name')} | {p.get('category_name')} | {p.get('road_address_name') or p.get('address_name')}")
 
-        if not places:
-            msg = "헉… 이 조건으로는 딱 맞는 데가 잘 안 잡히네 🥲\n지역을 조금만 넓혀볼까?"
-            st.markdown(msg)
-            st.session_state.messages.append({"role": "assistant", "content": msg})
-            st.stop()
-
-        # rerank
-        picks = rerank_and_format(conditions, places)
-        if debug_mode:
-            with st.expander("🤖 (디버그) rerank LLM 원문"):
-                st.code(st.session_state.debug_raw_rerank)
-
-        # ensure 3
-        picks = ensure_3_picks(picks, places)
-
-        kakao_map = {p.get("id"): p for p in places if p.get("id")}
-
-        st.markdown("---")
-        st.subheader("🍽️ 딱 3곳만 골랐어")
-        cols = st.columns(3)
-
-        current_pick_ids = []
-
-        for i, pick in enumerate(picks[:3]):
-            pid = pick.get("id")
-            place = kakao_map.get(pid)
-            if not pid or not place:
-                continue
-            current_pick_ids.append(pid)
-
-            with cols[i]:
-                name = place.get("place_name")
-                addr = place.get("road_address_name") or place.get("address_name")
-                url = place.get("place_url")
-                category = place.get("category_name")
-
-                st.markdown(f"### {i+1}. {name}")
-                st.caption(category or "")
-                st.write(f"📍 {addr}")
-
-                st.markdown(f"**{pick.get('one_line','')}**")
-                scene = pick.get("scene_feel")
-                if scene:
-                    st.markdown(f"_이 자리 느낌_: {scene}")
-
-                matched = pick.get("matched_conditions", [])
-                if matched:
-                    st.markdown("**반영한 조건**")
-                    st.markdown(" · ".join([f"`{m}`" for m in matched]))
-
-                tags = pick.get("hashtags", [])
-                if tags:
-                    st.markdown(" ".join(tags))
-
-                st.markdown("**왜 여기냐면…**")
-                st.write(pick.get("reason", ""))
-
-                # walk estimate
-                if center and center.get("x") and center.get("y") and place.get("x") and place.get("y"):
-                    try:
-                        dist = haversine_m(center["x"], center["y"], place["x"], place["y"])
-                        walk_min = estimate_walk_minutes(dist)
-                        st.caption(f"🚶 예상 도보 약 {walk_min}분")
-                    except Exception:
-                        pass
-
-                if url:
-                    st.link_button("카카오맵에서 보기", url)
-
-        st.session_state.last_picks_ids = current_pick_ids
-
-        final = "끝! 😎\n셋 중에 하나 고르거나, **'다른 데'**, **'더 조용한 데'**, **'완전 다른 분위기'** 이렇게 다시 시켜도 돼."
-        st.session_state.messages.append({"role": "assistant", "content": final})
-        st.markdown(final)
+        # "다른 데"는 누적 제외, 새 요청이면 제외 목록 리셋
+        if not exclude_last:
+            st.session_state.seen_pick_ids = []
+        seen_ids = list(st.session_state.seen_pick_ids)
+        # 프로필이 있으면 최근 세션들에서 보여준 곳도 같이 뺌
+        seen_ids += [pid for pid in profile_exclusions(st.session_state.profile) if pid not in seen_ids]
+
+        pool = st.session_state.rec_pool
+        unseen = pool_unseen(pool, conditions, seen_ids) if exclude_last else None
+        engine = get_async_engine() if use_async_engine else None
+
+        if compare:
+            # 비교는 워커 풀 모드여도 인라인 (시나리오끼리는 run_compare 안에서 병렬)
+            conditions["meta"]["compare"] = None
+            labels = " vs ".join(f"**{sc['label']}**" for sc in compare)
+            st.markdown(f"오케이 {labels} 동시에 뽑아서 나란히 보여줄게 ⚖️")
+            results = run_compare(conditions, compare, kakao_key, openai_key, client,
+                                  st.session_state.loc_center_cache, seen_ids, engine, st.session_state.user_key)
+            render_compare(results, compare, conditions)
+            end_turn()
+
+        if use_job_runner:
+            # 조건/위치 캐시는 복사본으로 넘기고(워커가 relax/center, 캐시를 바꿈) 결과 반영은 완료 시점에
+            job_conditions = copy.deepcopy(conditions)
+            loc_cache = dict(st.session_state.loc_center_cache)
+            llm = client
+            sid = st.session_state.user_key
+            try:
+                job = get_job_runner().submit(
+                    sid,
+                    lambda job: {**run_recommend(job_conditions, kakao_key, openai_key, llm, loc_cache, seen_ids,
+                                                 unseen, pool, engine, on_stage=job.set_stage, on_pre=job.set_pre,
+                                                 session=sid, combined=use_combined_llm),
+                                 "loc_cache": loc_cache},
+                )
+            except JobRejected as e:
+                reply(str(e))
+                end_turn()
+            st.session_state.active_job = job.id
+            end_turn(rerun=True)
+
+        result = run_recommend(conditions, kakao_key, openai_key, client, st.session_state.loc_center_cache,
+                               seen_ids, unseen, pool, engine, on_pre=st.markdown,
+                               session=st.session_state.user_key, combined=use_combined_llm)
+        render_recommendation(result, conditions, show_pre=False)
+
+finish_turn_profile()
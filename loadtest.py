@@ -0,0 +1,266 @@
+# loadtest.py
+# 실제 app.py를 Streamlit AppTest로 여러 세션 동시에 돌리는 부하 생성기
+# - Kakao/OpenAI 호출은 같은 프로세스에 띄운 stand-in(standins.py)으로 돌림 (지연/에러율 조절)
+# - 턴 종류(question/recommend/reuse)별 지연 백분위, 처리량, 에러/degraded 비율, 세션당 메모리 증가량 리포트
+#
+# 예: python loadtest.py --sessions 40 --concurrency 8 --llm-latency-ms 900 --kakao-error-rate 0.02
+#     python loadtest.py --sessions 20 --concurrency 20 --async-engine --json report.json
+#     python loadtest.py --sessions 20 --combined-llm   (멘트+3곳 한 번에 스트리밍)
+#     python loadtest.py --script compare               (시나리오 3개 동시 → recommend 턴과 지연 비교)
+# (워커 풀 모드는 fragment 폴링이라 AppTest로는 안 돌림)
+# 에러는 둘로 나눔: app = 앱 스크립트 예외(at.exception), harness = AppTest 자체가 던진 예외
+# (동시 세션에서 가끔 나는 KeyError('$$ID-…') 같은 AppTest 쪽 문제는 앱 에러율에 안 넣음)
+
+import argparse
+import json
+import os
+import pickle
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from standins import profile_args, profile_from_args, start_standins
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+WARM_SET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_set.json")
+
+# (입력, 턴 종류). {loc}은 세션별 지역으로 채움. 첫 입력은 위치 질문을 꺼내는 인사 턴
+SCRIPTS = {
+    "basic": [
+        ("안녕", "question"),
+        ("{loc}", "question"),
+        ("없음", "question"),
+        ("그냥 추천해", "recommend"),
+        ("다른 데", "reuse"),
+    ],
+    "drinks": [
+        ("안녕", "question"),
+        ("{loc}", "question"),
+        ("없음", "question"),
+        ("술 제대로 마실 거야, 1차 2차 나눠서", "question"),
+        ("그냥 추천해", "recommend"),
+        ("다른 데", "reuse"),
+    ],
+    "compare": [
+        ("안녕", "question"),
+        ("{loc}", "question"),
+        ("없음", "question"),
+        ("한식 vs 일식 vs 술", "compare"),
+    ],
+    "group": [
+        ("안녕", "question"),
+        ("홍대, 강남, 잠실", "question"),
+        ("없음", "question"),
+        ("그냥 추천해", "recommend"),
+    ],
+}
+# 앱이 장애/degraded 때 내보내는 안내 문구
+DEGRADED_MARKERS = ("불안정", "문제가 생겼", "잘 안 잡히네")
+STATE_KEYS = ("messages", "conditions", "rec_pool", "question_pool", "loc_center_cache",
+              "seen_pick_ids", "history_summary", "debug_raw_rerank")
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_locations() -> list[str]:
+    try:
+        with open(WARM_SET_PATH, encoding="utf-8") as f:
+            return json.load(f).get("locations") or ["홍대입구역"]
+    except (OSError, ValueError):
+        return ["홍대입구역"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def session_state_bytes(at) -> int:
+    total = 0
+    for k in STATE_KEYS:
+        try:
+            value = at.session_state[k]
+        except KeyError:
+            continue
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            # 앱 스크립트 안에서 정의된 클래스(BoundedDict 등)는 rerun마다 새 객체라 pickle 불가 → JSON 근사
+            total += len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    return total
+
+
+def pin_test_runtime():
+    # AppTest는 run마다 Runtime._instance를 mock으로 바꾸고 끝에 None으로 되돌림
+    # → 동시 세션끼리 서로의 run 도중에 지워버림. 마지막 mock을 계속 돌려주게 고정
+    from streamlit.runtime.runtime import Runtime
+
+    last = {}
+    original = Runtime.instance.__func__
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+            return cls._instance
+        return last["runtime"] if "runtime" in last else original(cls)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+
+
+def run_session(idx: int, script: list, location: str, args) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.turn_timeout)
+    at.session_state["openai_key"] = "sk-loadtest"
+    at.session_state["kakao_key"] = "kakao-loadtest"
+    at.run()
+    toggles = [("⚡", args.async_engine), ("🧩", args.combined_llm)]
+    for prefix in [p for p, on in toggles if on]:
+        next(c for c in at.sidebar.checkbox if c.label.startswith(prefix)).check()
+    if any(on for _, on in toggles):
+        at.run()
+
+    turns = []
+    for text, kind in script:
+        t0 = time.perf_counter()
+        error, harness_error, degraded = None, None, False
+        try:
+            at.chat_input[0].set_value(text.format(loc=location)).run()
+            if at.exception:
+                error = at.exception[0].message
+            elif at.chat_message:
+                last = " ".join(m.value for m in at.chat_message[-1].markdown)
+                degraded = any(k in last for k in DEGRADED_MARKERS)
+        except Exception as e:
+            # 앱 예외는 at.exception으로 잡히니 여기로 오는 건 AppTest 하네스 쪽
+            harness_error = repr(e)
+        turns.append({"kind": kind, "latency_s": time.perf_counter() - t0, "error": error,
+                      "harness_error": harness_error, "degraded": degraded})
+        if error or harness_error:
+            break
+    return {"session": idx, "turns": turns, "state_bytes": session_state_bytes(at)}
+
+
+def summarize(results: list, wall_s: float, rss_before: int, rss_after: int, counters: dict) -> dict:
+    by_kind: dict[str, list] = {}
+    for r in results:
+        for t in r["turns"]:
+            by_kind.setdefault(t["kind"], []).append(t)
+
+    kinds = {}
+    for kind, turns in by_kind.items():
+        harness = sum(1 for t in turns if t["harness_error"])
+        # 하네스 에러 난 턴은 지연/앱 에러율 계산에서 뺌 (앱이 실제로 처리한 턴만)
+        turns = [t for t in turns if not t["harness_error"]] or turns
+        lat = [t["latency_s"] for t in turns]
+        kinds[kind] = {
+            "turns": len(turns),
+            "p50_ms": percentile(lat, 50) * 1000,
+            "p90_ms": percentile(lat, 90) * 1000,
+            "p99_ms": percentile(lat, 99) * 1000,
+            "max_ms": max(lat) * 1000,
+            "error_rate": sum(1 for t in turns if t["error"]) / len(turns),
+            "degraded_rate": sum(1 for t in turns if t["degraded"]) / len(turns),
+            "harness_errors": harness,
+        }
+    total_turns = sum(k["turns"] for k in kinds.values())
+    sessions = max(1, len(results))
+    return {
+        "sessions": len(results),
+        "wall_s": wall_s,
+        "turns_per_s": total_turns / wall_s if wall_s else 0.0,
+        "sessions_per_s": len(results) / wall_s if wall_s else 0.0,
+        "kinds": kinds,
+        "rss_growth_per_session_kb": (rss_after - rss_before) / sessions / 1024,
+        "state_kb_avg": sum(r["state_bytes"] for r in results) / sessions / 1024,
+        "upstream": counters,
+        "errors": [t["error"] for r in results for t in r["turns"] if t["error"]][:5],
+        "harness_errors": [t["harness_error"] for r in results for t in r["turns"] if t["harness_error"]][:5],
+    }
+
+
+def print_report(report: dict):
+    print(f"sessions {report['sessions']} · wall {report['wall_s']:.1f}s · "
+          f"{report['turns_per_s']:.2f} turns/s · {report['sessions_per_s']:.2f} sessions/s")
+    print(f"{'kind':<10}{'turns':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'err':>8}{'degr':>8}{'harn':>6}")
+    for kind, k in sorted(report["kinds"].items()):
+        print(f"{kind:<10}{k['turns']:>7}{k['p50_ms']:>8.0f}m{k['p90_ms']:>8.0f}m{k['p99_ms']:>8.0f}m"
+              f"{k['max_ms']:>8.0f}m{k['error_rate']:>8.1%}{k['degraded_rate']:>8.1%}{k['harness_errors']:>6}")
+    print(f"memory: RSS +{report['rss_growth_per_session_kb']:.0f}KB/session · "
+          f"session_state ≈ {report['state_kb_avg']:.1f}KB/session")
+    print(f"upstream: {json.dumps(report['upstream'])}")
+    for err in report["errors"]:
+        print(f"  error: {err}")
+    for err in report["harness_errors"]:
+        print(f"  harness (AppTest, 앱 에러 아님): {err}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decision Mate concurrent-session load test")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="basic")
+    parser.add_argument("--async-engine", action="store_true")
+    parser.add_argument("--combined-llm", action="store_true")
+    parser.add_argument("--travel-http", action="store_true", help="도보 시간을 stand-in 라우팅(/v1/walk-matrix)으로")
+    parser.add_argument("--details-http", action="store_true", help="picks 보강을 stand-in(/v1/place-details)으로")
+    parser.add_argument("--turn-timeout", type=float, default=120)
+    parser.add_argument("--json", help="리포트를 JSON으로도 저장할 경로")
+    profile_args(parser)
+    args = parser.parse_args()
+
+    server, base, counters = start_standins(profile_from_args(args))
+    # 앱은 rerun마다 env를 다시 읽음 → AppTest 세션 전부 stand-in으로
+    os.environ["DECISION_MATE_KAKAO_BASE"] = base
+    os.environ["OPENAI_BASE_URL"] = f"{base}/v1"
+    os.environ.setdefault("DECISION_MATE_STORE", "memory://")
+    if args.travel_http:
+        os.environ["DECISION_MATE_TRAVEL"] = base
+    if args.details_http:
+        os.environ["DECISION_MATE_DETAILS"] = base
+    os.environ.pop("KAKAO_REST_API_KEY", None)   # 캐시 워머는 끔
+    # magic은 rerun마다 ast.parse → 3.11에서 여러 스레드 동시 파싱이 깨짐. 앱은 magic 안 씀
+    from streamlit import config as st_config
+    st_config.set_option("runner.magicEnabled", False)
+    pin_test_runtime()
+
+    script = SCRIPTS[args.script]
+    locations = load_locations()
+
+    # 첫 세션 1개로 import/캐시 리소스 초기화 비용을 측정에서 뺌
+    run_session(-1, script[:1], locations[0], args)
+
+    rss_before = rss_bytes()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="loadtest") as ex:
+        futures = [ex.submit(run_session, i, script, locations[i % len(locations)], args)
+                   for i in range(args.sessions)]
+        results = [f.result() for f in futures]
+    wall_s = time.perf_counter() - t0
+    rss_after = rss_bytes()
+    server.shutdown()
+
+    report = summarize(results, wall_s, rss_before, rss_after, counters.snapshot())
+    report["config"] = {k: v for k, v in vars(args).items() if k != "json"}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if all(k["error_rate"] == 0 for k in report["kinds"].values()) else 1
+
+
+if __name__ == "__main__":
+    threading.current_thread().name = "loadtest-main"
+    sys.exit(main())
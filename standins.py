@@ -0,0 +1,304 @@
+# standins.py
+# 부하 테스트용 로컬 stand-in 서버 (Kakao 키워드 검색 + OpenAI chat completions)
+# - GET  /v2/local/search/keyword.json : query/page/x/y 기반 결정적 가짜 장소
+# - GET  /v2/local/search/category.json: category_group_code(FD6/CE7)별 같은 방식의 가짜 장소
+# - POST /v1/chat/completions          : JSON 모드면 프롬프트 속 후보 id로 picks/courses, 아니면 멘트
+#                                        (stream=true면 SSE 청크 + 마지막에 usage 청크)
+# - POST /v1/walk-matrix               : 라우팅 stand-in. 직선거리 × 우회 계수 / 80m·분
+# - POST /v1/place-details             : 장소 보강 stand-in. id 해시로 결정적 영업시간/주차/가격대 (일부는 모름)
+# - 엔드포인트별 지연(기본 + 지터) / 에러율(5xx) 프로파일
+#
+# 단독 실행:  python standins.py --port 8765 --llm-latency-ms 900 --kakao-error-rate 0.02
+# 앱 연결:    DECISION_MATE_KAKAO_BASE=http://127.0.0.1:8765 OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CATEGORIES = [
+    "음식점 > 한식 > 육류,고기",
+    "음식점 > 한식 > 국밥",
+    "음식점 > 일식 > 초밥,롤",
+    "음식점 > 중식",
+    "음식점 > 양식 > 이탈리안",
+    "음식점 > 술집 > 호프,요리주점",
+    "음식점 > 술집 > 와인바",
+    "음식점 > 술집 > 실내포장마차",
+    "음식점 > 카페",
+    "음식점 > 카페 > 디저트카페",
+]
+PAGEABLE_COUNT = 45
+STREAM_PIECE_CHARS = 12
+ROUTE_DETOUR = 1.3          # 보행 경로 / 직선거리
+WALK_M_PER_MIN = 80.0
+
+
+@dataclass
+class Latency:
+    base_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def wait(self, rnd: random.Random):
+        ms = self.base_ms + rnd.uniform(0, self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def fails(self, rnd: random.Random) -> bool:
+        return rnd.random() < self.error_rate
+
+
+@dataclass
+class Profile:
+    kakao: Latency = field(default_factory=lambda: Latency(60, 60))
+    llm: Latency = field(default_factory=lambda: Latency(700, 600))
+    routing: Latency = field(default_factory=lambda: Latency(20, 20))
+    details: Latency = field(default_factory=lambda: Latency(300, 300))
+
+
+@dataclass
+class Counters:
+    kakao: int = 0
+    kakao_errors: int = 0
+    llm: int = 0
+    llm_errors: int = 0
+    routing: int = 0
+    details: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, name: str, n: int = 1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {k: getattr(self, k) for k in ("kakao", "kakao_errors", "llm", "llm_errors", "routing", "details")}
+
+
+def fake_places(query: str, page: int, size: int, x: float, y: float, group: str | None = None) -> dict:
+    seed = int(hashlib.sha1(f"{group or query}|{page}".encode("utf-8")).hexdigest()[:8], 16)
+    rnd = random.Random(seed)
+    # 카테고리 검색이면 그 그룹 카테고리에서만
+    cats = [c for c in CATEGORIES if ("카페" in c) == (group == "CE7")] if group else CATEGORIES
+    start = (page - 1) * size
+    count = max(0, min(size, PAGEABLE_COUNT - start))
+    docs = []
+    for i in range(count):
+        pid = str(10_000_000 + seed % 1_000_000 * 10 + start + i)
+        cat = cats[rnd.randrange(len(cats))]
+        px = x + rnd.uniform(-0.008, 0.008)
+        py = y + rnd.uniform(-0.008, 0.008)
+        docs.append({
+            "id": pid,
+            "place_name": f"{query.split()[0] if query and not group else '가게'} {cat.split(' > ')[-1]} {start + i + 1}호점",
+            "category_name": cat,
+            "category_group_code": "CE7" if "카페" in cat else "FD6",
+            "road_address_name": f"서울 테스트구 테스트로 {start + i + 1}",
+            "address_name": f"서울 테스트동 {start + i + 1}",
+            "place_url": f"http://place.map.kakao.com/{pid}",
+            "x": f"{px:.7f}",
+            "y": f"{py:.7f}",
+        })
+    return {
+        "documents": docs,
+        "meta": {"is_end": start + count >= PAGEABLE_COUNT, "pageable_count": PAGEABLE_COUNT,
+                 "total_count": PAGEABLE_COUNT},
+    }
+
+
+def fake_completion(body: dict) -> dict:
+    messages = body.get("messages") or [{}]
+    prompt = str(messages[-1].get("content", ""))
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        if "코스는 이미 정해졌다" in prompt:
+            idx = [int(i) for i in re.findall(r'"idx":\s*(\d+)', prompt)]
+            content = {"courses": [{"idx": i, "one_line": "1차 2차 딱 이어져 🍻", "flow": "1차 먹고 2차로 슬슬",
+                                    "hashtags": ["#코스", "#도보"], "reason": "가깝게 이어지는 조합"} for i in idx]}
+        else:
+            ids = list(dict.fromkeys(re.findall(r'"id":\s*"?(\d+)"?', prompt)))
+            content = {"intro": "오케이 골라봤어 😎", "picks": [{
+                "id": i, "one_line": "여기 괜찮아", "scene_feel": "편하게 얘기하기 좋은 분위기",
+                "hashtags": ["#근처", "#무난"], "matched_conditions": ["근처 우선"],
+                "reason": "조건에 무난하게 맞아서",
+            } for i in ids[:3]]}
+        text = json.dumps(content, ensure_ascii=False)
+    else:
+        text = "오케이 바로 찾아볼게 🔍"
+    prompt_tokens = max(1, len(prompt) // 2)
+    completion_tokens = max(1, len(text) // 2)
+    return {
+        "id": f"chatcmpl-standin-{random.getrandbits(32):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def walk_matrix(body: dict) -> dict:
+    ox, oy = map(float, body["origin"])
+    minutes = []
+    for x, y in body.get("destinations", []):
+        dlon, dlat = math.radians(float(x) - ox), math.radians(float(y) - oy)
+        a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(oy)) * math.cos(math.radians(float(y))) * math.sin(dlon / 2) ** 2
+        meters = 6371000 * 2 * math.asin(math.sqrt(min(1.0, a)))
+        minutes.append(round(meters * ROUTE_DETOUR / WALK_M_PER_MIN, 2))
+    return {"minutes": minutes}
+
+
+def place_details(body: dict) -> dict:
+    out = {}
+    for p in body.get("places", []):
+        h = int(hashlib.sha1(str(p.get("id")).encode("utf-8")).hexdigest()[:8], 16)
+        if h % 7 == 0:
+            continue    # 보강 소스에 없는 곳
+        category = p.get("category") or ""
+        if "술집" in category:
+            hours = "17:00~02:00"
+        elif "카페" in category:
+            hours = "10:00~22:00"
+        else:
+            hours = "11:30~21:30"
+        out[str(p.get("id"))] = {"hours": hours, "parking": h % 3 == 0, "price_level": 1 + h % 3}
+    return {"details": out}
+
+
+def stream_chunks(completion: dict) -> list[dict]:
+    # 완성 응답을 chat.completion.chunk 조각들로 (마지막은 choices 없이 usage만)
+    text = completion["choices"][0]["message"]["content"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+            "model": completion["model"]}
+    chunks = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}]
+    for i in range(0, len(text), STREAM_PIECE_CHARS):
+        chunks.append({**base, "choices": [{"index": 0, "delta": {"content": text[i:i + STREAM_PIECE_CHARS]},
+                                            "finish_reason": None}]})
+    chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    chunks.append({**base, "choices": [], "usage": completion["usage"]})
+    return chunks
+
+
+def make_handler(profile: Profile, counters: Counters):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, payload: dict):
+            raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            try:
+                self.wfile.write(raw)
+            except (BrokenPipeError, ConnectionResetError):
+                # 클라이언트가 먼저 끊음 (타임아웃, TaskGroup 취소 등)
+                pass
+
+        def _send_stream(self, chunks: list[dict]):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for event in [json.dumps(c, ensure_ascii=False) for c in chunks] + ["[DONE]"]:
+                    raw = f"data: {event}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path not in ("/v2/local/search/keyword.json", "/v2/local/search/category.json"):
+                return self._send(404, {"message": "not found"})
+            rnd = random.Random()
+            counters.add("kakao")
+            profile.kakao.wait(rnd)
+            if profile.kakao.fails(rnd):
+                counters.add("kakao_errors")
+                return self._send(503, {"errorType": "ServiceUnavailable", "message": "stand-in error"})
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            group = q.get("category_group_code") if url.path.endswith("category.json") else None
+            self._send(200, fake_places(q.get("query", ""), int(q.get("page", 1)), int(q.get("size", 15)),
+                                        float(q.get("x", 126.9237)), float(q.get("y", 37.5566)), group))
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if url.path == "/v1/walk-matrix":
+                counters.add("routing")
+                profile.routing.wait(random.Random())
+                return self._send(200, walk_matrix(body))
+            if url.path == "/v1/place-details":
+                counters.add("details")
+                profile.details.wait(random.Random())
+                return self._send(200, place_details(body))
+            if not url.path.endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+            rnd = random.Random()
+            counters.add("llm")
+            profile.llm.wait(rnd)
+            if profile.llm.fails(rnd):
+                counters.add("llm_errors")
+                return self._send(500, {"error": {"message": "stand-in error", "type": "server_error"}})
+            completion = fake_completion(body)
+            if body.get("stream"):
+                return self._send_stream(stream_chunks(completion))
+            self._send(200, completion)
+
+    return Handler
+
+
+def start_standins(profile: Profile | None = None, host: str = "127.0.0.1", port: int = 0):
+    # 백그라운드 스레드로 띄우고 (server, base_url, counters) 반환. 끝나면 server.shutdown()
+    profile = profile or Profile()
+    counters = Counters()
+    server = ThreadingHTTPServer((host, port), make_handler(profile, counters))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="standins", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", counters
+
+
+def profile_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--kakao-latency-ms", type=float, default=60)
+    parser.add_argument("--kakao-jitter-ms", type=float, default=60)
+    parser.add_argument("--kakao-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=700)
+    parser.add_argument("--llm-jitter-ms", type=float, default=600)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+
+
+def profile_from_args(args) -> Profile:
+    return Profile(
+        kakao=Latency(args.kakao_latency_ms, args.kakao_jitter_ms, args.kakao_error_rate),
+        llm=Latency(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kakao/OpenAI stand-in servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    profile_args(parser)
+    args = parser.parse_args()
+    server, base, _ = start_standins(profile_from_args(args), args.host, args.port)
+    print(f"stand-ins on {base}  (Kakao: {base}, OpenAI: {base}/v1)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
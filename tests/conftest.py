@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 외부 호출 없는 기본 백엔드로 (워머/라우팅/상세 조회가 네트워크를 안 타게)
+os.environ["DECISION_MATE_STORE"] = "memory://"
+os.environ["DECISION_MATE_TRAVEL"] = "haversine"
+os.environ["DECISION_MATE_DETAILS"] = "off"
+os.environ.pop("KAKAO_REST_API_KEY", None)
+
+CENTER = {"x": 126.9139, "y": 37.5496, "name": "합정역"}
+
+
+@pytest.fixture(scope="session")
+def app():
+    # app.py는 스크립트라 import 하면 bare 모드로 한 번 돈다 (Streamlit 경고만 찍고 함수/상수는 그대로 씀)
+    import app as module
+    return module
+
+
+@pytest.fixture
+def center():
+    return dict(CENTER)
+
+
+@pytest.fixture
+def make_place(app):
+    def make(pid, name, cats=("음식점", "한식"), dx_m=0.0, dy_m=0.0):
+        # CENTER에서 동쪽 dx_m, 북쪽 dy_m 떨어진 가게
+        x = CENTER["x"] + dx_m / 88_000.0
+        y = CENTER["y"] + dy_m / 111_000.0
+        return app.Place(pid, name, tuple(cats), "서울 마포구", f"https://place.map.kakao.com/{pid}", x, y)
+    return make
@@ -0,0 +1,108 @@
+import copy
+import pickle
+import time
+
+
+def test_bounded_dict_drops_least_recent(app):
+    d = app.BoundedDict(2)
+    d["a"] = 1
+    d["b"] = 2
+    assert d["a"] == 1      # a가 최근 사용으로
+    d["c"] = 3
+    assert list(d) == ["a", "c"]
+
+
+def test_bounded_dict_copies_keep_bound(app):
+    d = app.BoundedDict(2, [("a", 1), ("b", 2)])
+    for clone in (copy.deepcopy(d), pickle.loads(pickle.dumps(d))):
+        assert clone.maxsize == 2 and list(clone.items()) == [("a", 1), ("b", 2)]
+        clone["c"] = 3
+        assert list(clone) == ["b", "c"]
+
+
+def make_breaker(app, **kw):
+    return app.CircuitBreaker("test", slow_s=1.0, window_s=60, min_calls=4, open_s=0.05, **kw)
+
+
+def test_breaker_opens_on_errors_then_probes_once(app):
+    b = make_breaker(app)
+    for _ in range(4):
+        assert b.allow()
+        b.record(False, 0.01)
+    assert b.state == "open"
+    assert not b.allow()
+    time.sleep(0.06)
+    assert b.allow()            # half-open 시험 호출 1건
+    assert not b.allow()
+    b.record(True, 0.01)
+    assert b.state == "closed" and b.allow()
+
+
+def test_breaker_opens_on_slow_calls(app):
+    b = make_breaker(app)
+    for _ in range(4):
+        b.record(True, 2.0)
+    assert b.state == "open"
+    assert b.status()["slow"] == 1.0
+
+
+def test_breaker_failed_probe_reopens(app):
+    b = make_breaker(app)
+    for _ in range(4):
+        b.record(False, 0.01)
+    time.sleep(0.06)
+    assert b.allow()
+    b.record(False, 0.01)
+    assert b.state == "open" and not b.allow()
+
+
+def test_breaker_abandon_returns_probe_slot(app):
+    b = make_breaker(app)
+    for _ in range(4):
+        b.record(False, 0.01)
+    time.sleep(0.06)
+    assert b.allow()
+    b.abandon()
+    assert b.allow()
+
+
+def test_retrieval_signature_ignores_filter_only_fields(app, center):
+    base = app.init_conditions()
+    filtered = app.init_conditions()
+    filtered["meta"]["common"]["transport"] = "차"
+    filtered["meta"]["common"]["walk_limit_min"] = 5
+    filtered["constraints"]["avoid_franchise"] = True
+    assert app.retrieval_signature(base, center) == app.retrieval_signature(filtered, center)
+
+    other = app.init_conditions()
+    other["meta"]["place_type"] = "술"
+    assert app.retrieval_signature(base, center) != app.retrieval_signature(other, center)
+
+
+def test_retrieval_signature_uses_location_without_center(app):
+    a, b = app.init_conditions(), app.init_conditions()
+    a["location"], b["location"] = "합정", "홍대"
+    assert app.retrieval_signature(a, None) != app.retrieval_signature(b, None)
+
+
+def test_pool_cache_serves_same_or_narrower_relax(app):
+    cache = app.PoolCache(max_items=4, ttl_s=60)
+    cache.put("sig", ["p1"], "합정 맛집", relax=1)
+    assert cache.get("sig", 0)["places"] == ["p1"]
+    assert cache.get("sig", 1)["query"] == "합정 맛집"
+    assert cache.get("sig", 2) is None
+    assert cache.status == {"hits": 2, "misses": 1}
+
+
+def test_pool_cache_expiry_eviction_and_degraded(app):
+    cache = app.PoolCache(max_items=2, ttl_s=60)
+    cache.put("degraded", ["p"], "q", relax=0, source="degraded")
+    assert cache.get("degraded", 0) is None
+    for sig in ("a", "b", "c"):
+        cache.put(sig, [sig], "q", relax=0)
+    assert cache.get("a", 0) is None and cache.get("c", 0) is not None
+
+    stale = app.PoolCache(ttl_s=0)
+    stale.put("a", ["a"], "q", relax=0)
+    time.sleep(0.01)
+    assert stale.get("a", 0) is None
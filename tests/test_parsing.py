@@ -0,0 +1,40 @@
+def test_parse_origins_weights_and_noise(app):
+    assert app.parse_origins("홍대 3명, 강남 2명, 잠실에서 모여") == [
+        {"name": "홍대", "weight": 3},
+        {"name": "강남", "weight": 2},
+        {"name": "잠실", "weight": 1},
+    ]
+
+
+def test_parse_origins_needs_two_places(app):
+    assert app.parse_origins("홍대 3명") == []
+    assert app.parse_origins("") == []
+
+
+def test_parse_origins_rejects_location_plus_condition(app):
+    # 위치 + 말로 붙인 조건은 출발지 2곳이 아님
+    assert app.parse_origins("홍대역 근처, 소개팅이라 조용했으면") == []
+
+
+def test_meet_objective_follows_weights(app):
+    assert app.meet_objective(app.parse_origins("홍대 3명, 강남")) == "weighted"
+    assert app.meet_objective(app.parse_origins("홍대, 강남")) == "minimax"
+
+
+def test_parse_scenarios_two_known_parts(app):
+    got = app.parse_scenarios("밥 vs 술")
+    assert [s["label"] for s in got] == ["밥", "술"]
+    assert [s["meta"] for s in got] == [{"place_type": "식사"}, {"place_type": "술"}]
+
+
+def test_parse_scenarios_walk_limits_are_marked(app):
+    near, far = app.parse_scenarios("역 근처 아니면 좀 걸어도")
+    assert near["common"] == {"walk_limit_min": 5, "walk_limit_src": "scenario"}
+    assert far["common"] == {"walk_limit_min": 15, "walk_limit_src": "scenario"}
+
+
+def test_parse_scenarios_all_or_nothing(app):
+    assert app.parse_scenarios("밥") == []
+    # 하나라도 모르는 조각이면 평소 흐름
+    assert app.parse_scenarios("밥 vs 아무거나") == []
+    assert app.parse_scenarios(" vs ".join(["밥"] * (app.COMPARE_MAX + 1))) == []
@@ -0,0 +1,87 @@
+import math
+
+
+def far_center(center, i):
+    # 테스트마다 다른 통계 셀 (공유 메모리 스토어라서)
+    return {**center, "x": center["x"] + 0.05 * i, "y": center["y"] + 0.05 * i}
+
+
+def test_select_candidates_small_pool_unchanged(app, center, make_place):
+    places = [make_place(i, f"가게{i}", dx_m=50 * i) for i in range(app.MMR_MIN_K)]
+    assert app.select_candidates(places, center, app.init_conditions()) == places
+
+
+def test_select_candidates_spreads_out_chain_branches(app, center, make_place):
+    # 2호점이 가게1보다 가깝지만 1호점과 거의 같은 가게라 뒤로 밀림
+    chain = [make_place(i, f"교동짬뽕 합정{i}호점", ("음식점", "중식"), dx_m=10 * i) for i in range(1, 7)]
+    others = [make_place(100 + i, f"가게{i}", ("음식점", c), dx_m=40 * i, dy_m=30 * i)
+              for i, c in enumerate(["한식", "일식", "양식", "분식", "고기", "국밥"], 1)]
+    picked = app.select_candidates(chain + others, center, app.init_conditions())
+    assert picked[0].name == "교동짬뽕 합정1호점"
+    assert picked[1].name == "가게1"
+    assert len({p.id for p in picked}) == len(picked)
+
+
+def test_select_candidates_fewer_when_leaders_are_clear(app, center, make_place):
+    near = [make_place(i, f"가까운{i}", dx_m=20 * i) for i in range(3)]
+    far = [make_place(100 + i, f"먼{i}", dy_m=5000 + 100 * i) for i in range(20)]
+    picked = app.select_candidates(near + far, center, app.init_conditions())
+    assert len(picked) == app.MMR_MIN_K
+    assert {p.id for p in near} <= {p.id for p in picked}
+
+
+def test_plan_courses_pairs_within_walk_limit(app, center, make_place):
+    conditions = app.init_conditions()
+    conditions["meta"]["common"]["alcohol_plan"] = app.COURSE_PLAN
+    places = [
+        make_place(1, "밥집", ("음식점", "한식")),
+        make_place(2, "술집A", ("음식점", "술집", "호프"), dx_m=100),
+        make_place(3, "카페B", ("음식점", "카페"), dy_m=150),
+        make_place(4, "먼술집", ("음식점", "술집"), dx_m=4000),
+    ]
+    courses = app.plan_courses(places, center, conditions)
+    assert [(c["first"].name, c["second"].name) for c in courses] == [("밥집", "술집A")]
+    assert courses[0]["leg_min"] >= 1
+
+
+def test_plan_courses_needs_both_roles(app, center, make_place):
+    cafes = [make_place(i, f"카페{i}", ("음식점", "카페"), dx_m=30 * i) for i in range(3)]
+    assert app.plan_courses(cafes, center, app.init_conditions()) == []
+
+
+def test_plan_search_without_stats_uses_relax_plan(app, center):
+    conditions = app.init_conditions()
+    assert app.plan_search(None, conditions, 1) == (1, *app.relax_plan(1))
+    assert app.plan_search(far_center(center, 1), conditions, 0) == (0, *app.relax_plan(0))
+
+
+def test_plan_search_dense_area_needs_one_page(app, center, make_place):
+    c = far_center(center, 2)
+    conditions = app.init_conditions()
+    places = [make_place(i, f"가게{i}", dx_m=20 * i) for i in range(30)]
+    for _ in range(app.PLAN_MIN_OBS):
+        app.record_search_stats(c, conditions, 0, 2, places)
+    assert app.plan_search(c, conditions, 0) == (0, 1, app.relax_plan(0)[1])
+
+
+def test_plan_search_sparse_area_starts_wider(app, center, make_place):
+    c = far_center(center, 3)
+    conditions = app.init_conditions()
+    places = [make_place(i, f"가게{i}", dx_m=20 * i) for i in range(3)]
+    for _ in range(app.PLAN_MIN_OBS):
+        app.record_search_stats(c, conditions, 0, 2, places)
+    assert app.load_search_stats(c, conditions)["0"]["exhausted"] == app.PLAN_MIN_OBS
+    assert app.plan_search(c, conditions, 0) == (1, *app.relax_plan(1))
+
+
+def test_record_search_stats_full_pages_not_exhausted(app, center, make_place):
+    c = far_center(center, 4)
+    conditions = app.init_conditions()
+    pages = app.CATEGORY_MAX_PAGES
+    places = [make_place(i, f"가게{i}", dx_m=10 * i) for i in range(pages * app.PLAN_PAGE_SIZE)]
+    app.record_search_stats(c, conditions, 0, pages, places)
+    app.record_search_stats(c, conditions, 0, pages, places)
+    lv = app.load_search_stats(c, conditions)["0"]
+    assert lv == {"obs": 2, "pages": 2 * pages, "returned": 2 * len(places), "survived": 2 * len(places),
+                  "exhausted": 0}
+    assert math.isclose(lv["survived"] / lv["pages"], app.PLAN_PAGE_SIZE)